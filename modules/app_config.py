@@ -2,6 +2,7 @@ from enum import Enum
 
 from PySide6.QtCore import QLocale
 from qfluentwidgets import (
+    BoolValidator,
     ConfigItem,
     ConfigSerializer,
     OptionsConfigItem,
@@ -59,6 +60,14 @@ class AppConfig(QConfig):
         serializer=LogParserConfigSerializer(),
     )
 
+    # 提取日志时是否同时建立 token 倒排索引，用于在日志查看页面中按关键字搜索
+    buildTokenIndex = ConfigItem(
+        "LogConfig",
+        "BuildTokenIndex",
+        False,
+        BoolValidator(),
+    )
+
 
 # 创建全局配置实例
 appcfg = AppConfig()
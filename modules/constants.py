@@ -3,6 +3,7 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DB_PATH = PROJECT_ROOT / "logtt.duckdb"
 CONFIG_PATH = PROJECT_ROOT / "config.json"
+SNAPSHOT_PATH = PROJECT_ROOT / "snapshots"
 ONNX_PATH = PROJECT_ROOT / "onnx"
 LEVEL_COLOR_MAP = {
     "FATAL": "#DC143C",
@@ -1,4 +1,4 @@
-from libc.stdint cimport int64_t, uint32_t, uint64_t
+from libc.stdint cimport int64_t, uint8_t, uint32_t, uint64_t
 from libcpp.pair cimport pair
 from libcpp.string cimport string
 from libcpp.unordered_map cimport unordered_map
@@ -7,6 +7,26 @@ from libcpp.vector cimport vector
 cdef extern from "duckdb_service.hxx" namespace "logtt" nogil:
     ctypedef unordered_map[string, vector[string]] Filters
 
+    # ==================== 查询结果 ====================
+
+    cdef enum class ColumnType(uint8_t):
+        INTEGER
+        FLOAT
+        TIMESTAMP
+        STRING
+
+    cdef struct ResultColumn:
+        string          name
+        ColumnType      type
+        bint            single_precision
+        vector[int64_t] integers
+        vector[double]  floats
+        string          chars
+        vector[int64_t] offsets
+        vector[uint8_t] validity
+
+    string format_result_cell(const ResultColumn& column, size_t row)
+
     #  ==================== 日志管理 ====================
 
     cdef struct LogEntry:
@@ -19,6 +39,8 @@ cdef extern from "duckdb_service.hxx" namespace "logtt" nogil:
         uint32_t line_count
         string   structured_table_name
         string   templates_table_name
+        string   snapshot_path
+        uint32_t snapshot_line_count
 
     cdef struct EXLogEntry:
         uint32_t id
@@ -34,20 +56,25 @@ cdef extern from "duckdb_service.hxx" namespace "logtt" nogil:
     void update_log_is_extracted(uint32_t log_id, bool value)
     void update_log_extract_method(uint32_t log_id, const string& value)
     void update_log_line_count(uint32_t log_id, uint32_t value)
+    void update_log_snapshot(uint32_t log_id, const string& path, uint32_t line_count)
     void delete_log(uint32_t log_id)
 
     # ==================== CSV表格显示 ====================
 
-    pair[vector[vector[string]], int64_t] fetch_csv_table(
-        const string&  table_name,
-        int64_t       offset,
-        int64_t       limit,
-        const Filters& filters,
+    pair[vector[ResultColumn], int64_t] fetch_csv_table(
+        const string&         table_name,
+        int64_t               offset,
+        int64_t               limit,
+        const Filters&        filters,
+        const string&         order_by,
+        bint                  descending,
+        const vector[string]& search_terms,
+        bint                  match_all,
     )
 
     # ==================== CSV表格过滤器 ====================
 
-    pair[vector[vector[string]], int64_t] fetch_filter_table(
+    pair[vector[ResultColumn], int64_t] fetch_filter_table(
         const string&  table_name,
         const string&  column_name,
         int64_t       offset,
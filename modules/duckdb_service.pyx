@@ -1,17 +1,26 @@
+cdef object np
+
+import numpy as np
+from cpython.buffer cimport PyBuffer_FillInfo
+from cpython.unicode cimport PyUnicode_DecodeUTF8
 from libc.stdint cimport int64_t, uint32_t, uint64_t
 from libcpp.pair cimport pair
 from libcpp.string cimport string
+from libcpp.utility cimport move
 from libcpp.vector cimport vector
 
 from modules.duckdb_service cimport (
+    ColumnType,
     EXLogEntry,
     Filters,
     LogEntry,
+    ResultColumn,
     create_log_table_if_not_exists as cxx_create_log_table_if_not_exists,
     delete_log as cxx_delete_log,
     drop_table as cxx_drop_table,
     fetch_csv_table as cxx_fetch_csv_table,
     fetch_filter_table as cxx_fetch_filter_table,
+    format_result_cell as cxx_format_result_cell,
     get_extracted_log_table as cxx_get_extracted_log_table,
     get_log_table as cxx_get_log_table,
     get_table_columns as cxx_get_table_columns,
@@ -23,8 +32,122 @@ from modules.duckdb_service cimport (
     update_log_format_type as cxx_update_log_format_type,
     update_log_is_extracted as cxx_update_log_is_extracted,
     update_log_line_count as cxx_update_log_line_count,
+    update_log_snapshot as cxx_update_log_snapshot,
 )
 
+# ==================== 查询结果 ====================
+
+cdef class _BufferView:
+    """把 QueryColumn 中的一个 C++ 缓冲区暴露为只读的字节缓冲区，并在使用期间保持 QueryColumn 存活"""
+
+    cdef object _owner
+    cdef const char* _data
+    cdef Py_ssize_t _length
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        PyBuffer_FillInfo(buffer, self, <void*> self._data, self._length, 1, flags)
+
+
+cdef object _numpy_view(object owner, const void* data, Py_ssize_t length, object dtype):
+    """以 data 开始的 length 字节为数据、不经拷贝地创建 NumPy 数组"""
+    cdef _BufferView view
+
+    if length == 0:
+        return np.empty(0, dtype=dtype)
+
+    view = _BufferView.__new__(_BufferView)
+    view._owner = owner
+    view._data = <const char*> data
+    view._length = length
+    return np.frombuffer(view, dtype=dtype)
+
+
+cdef class QueryColumn:
+    """一列查询结果，数据保存在 C++ 的缓冲区中
+
+    整数、浮点数和时间戳列可以零拷贝地转换为 NumPy 数组，显示用的字符串只在调用 format 时按单元格生成
+    """
+
+    cdef ResultColumn _column
+
+    def __len__(self) -> int:
+        return self._column.validity.size()
+
+    @property
+    def name(self) -> str:
+        return self._column.name
+
+    def format(self, Py_ssize_t row) -> str:
+        """把一个单元格格式化为显示用的字符串，NULL 为空字符串"""
+        cdef int64_t begin
+        cdef int64_t end
+
+        if not self._column.validity[row]:
+            return ""
+
+        # 数值和时间戳按 DuckDB 转换为 VARCHAR 的格式显示，与直接查询字符串时的结果一致
+        if self._column.type != ColumnType.STRING:
+            return cxx_format_result_cell(self._column, row)
+
+        begin = self._column.offsets[row]
+        end = self._column.offsets[row + 1]
+        return PyUnicode_DecodeUTF8(self._column.chars.data() + begin, end - begin, NULL)
+
+    def valid(self) -> np.ndarray:
+        """非 NULL 的位置为 True，不拷贝数据"""
+        return _numpy_view(self, self._column.validity.data(), self._column.validity.size(), np.bool_)
+
+    def to_numpy(self) -> np.ndarray:
+        """转换为 NumPy 数组
+
+        整数为 int64，浮点数为 float64，时间戳为 datetime64[us]，这三种不拷贝数据，NULL 的位置为 0，需要配合 valid 使用；
+        字符串列返回 object 数组，NULL 的位置为 None
+        """
+        cdef Py_ssize_t row
+        cdef object values
+
+        if self._column.type == ColumnType.INTEGER:
+            return _numpy_view(
+                self, self._column.integers.data(), self._column.integers.size() * sizeof(int64_t), np.int64
+            )
+        elif self._column.type == ColumnType.FLOAT:
+            return _numpy_view(
+                self, self._column.floats.data(), self._column.floats.size() * sizeof(double), np.float64
+            )
+        elif self._column.type == ColumnType.TIMESTAMP:
+            return _numpy_view(
+                self, self._column.integers.data(), self._column.integers.size() * sizeof(int64_t), "datetime64[us]"
+            )
+
+        values = np.empty(self._column.validity.size(), dtype=object)
+        for row in range(<Py_ssize_t> self._column.validity.size()):
+            if self._column.validity[row]:
+                values[row] = self.format(row)
+        return values
+
+    def string_buffers(self) -> tuple[np.ndarray, np.ndarray]:
+        """字符串列的 (offsets, chars)，第 i 行为 chars[offsets[i]:offsets[i + 1]]，不拷贝数据"""
+        if self._column.type != ColumnType.STRING:
+            raise TypeError(f"Column {self.name} is not a string column")
+
+        return (
+            _numpy_view(self, self._column.offsets.data(), self._column.offsets.size() * sizeof(int64_t), np.int64),
+            _numpy_view(self, self._column.chars.data(), self._column.chars.size(), np.uint8),
+        )
+
+
+cdef list _to_query_columns(vector[ResultColumn]& columns):
+    cdef list result = []
+    cdef QueryColumn column
+    cdef size_t i
+
+    for i in range(columns.size()):
+        column = QueryColumn.__new__(QueryColumn)
+        column._column = move(columns[i])
+        result.append(column)
+
+    return result
+
 
 cdef class DuckDBService:
     @staticmethod
@@ -35,7 +158,7 @@ cdef class DuckDBService:
     @staticmethod
     def get_log_table() -> list[tuple]:
         cdef vector[LogEntry] table
-        cdef vector[(uint32_t, string, string, string, bint, string, uint32_t, string, string)] result
+        cdef vector[(uint32_t, string, string, string, bint, string, uint32_t, string, string, string, uint32_t)] result
 
         with nogil:
             table = cxx_get_log_table()
@@ -54,6 +177,8 @@ cdef class DuckDBService:
                     entry.line_count,
                     entry.structured_table_name,
                     entry.templates_table_name,
+                    entry.snapshot_path,
+                    entry.snapshot_line_count,
                 )
             )
 
@@ -115,6 +240,12 @@ cdef class DuckDBService:
         else:
             raise ValueError(f"Unsupported column name: {column_name}")
 
+    @staticmethod
+    def update_log_snapshot(uint32_t log_id, string path, uint32_t line_count):
+        """记录解析器状态快照的路径和它已经解析的行数，path 为空串表示没有可用的快照"""
+        with nogil:
+            cxx_update_log_snapshot(log_id, path, line_count)
+
     @staticmethod
     def delete_log(uint32_t log_id):
         with nogil:
@@ -126,24 +257,43 @@ cdef class DuckDBService:
         int64_t offset,
         int64_t limit,
         object filters=None,
-    ) -> tuple[list[list[str]], int]:
-        cdef pair[vector[vector[string]], int64_t] result
+        object order_by=None,
+        bint descending=False,
+        object search_terms=None,
+        bint match_all=True,
+    ) -> tuple[list[QueryColumn], int]:
+        """search_terms 不为空时只返回包含全部 (match_all) 或任意一个搜索词的行"""
+        cdef pair[vector[ResultColumn], int64_t] result
         cdef Filters filters_cxx
+        cdef string order_by_cxx
+        cdef vector[string] search_terms_cxx
 
         if filters is None:
             filters_cxx = Filters()
         else:
             filters_cxx = filters
 
+        if order_by is None:
+            order_by_cxx = string()
+        else:
+            order_by_cxx = order_by
+
+        if search_terms is not None:
+            search_terms_cxx = search_terms
+
         with nogil:
             result = cxx_fetch_csv_table(
                 table_name,
                 offset,
                 limit,
                 filters_cxx,
+                order_by_cxx,
+                descending,
+                search_terms_cxx,
+                match_all,
             )
 
-        return result
+        return _to_query_columns(result.first), result.second
 
     @staticmethod
     def fetch_filter_table(
@@ -153,8 +303,8 @@ cdef class DuckDBService:
         int64_t limit,
         object keyword=None,
         object other_filters=None,
-    ) -> tuple[list[list[str]], int]:
-        cdef pair[vector[vector[string]], int64_t] result
+    ) -> tuple[list[QueryColumn], int]:
+        cdef pair[vector[ResultColumn], int64_t] result
         cdef string keyword_cxx
         cdef Filters other_filters_cxx
 
@@ -178,7 +328,7 @@ cdef class DuckDBService:
                 other_filters_cxx,
             )
 
-        return result
+        return _to_query_columns(result.first), result.second
 
     @staticmethod
     def table_exists(string table_name) -> bool:
@@ -10,3 +10,4 @@ class ParseResult:
     line_count: int  # 日志行数
     structured_table_name: str  # 结构化日志表名
     templates_table_name: str  # 模板日志表名
+    unmatched_count: int = 0  # 匹配模式下未匹配到模板的日志行数
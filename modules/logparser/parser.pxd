@@ -1,4 +1,4 @@
-from libc.stdint cimport int32_t, uint16_t, uint32_t
+from libc.stdint cimport int32_t, int64_t, uint16_t, uint32_t
 from libcpp.pair cimport pair
 from libcpp.string cimport string
 from libcpp.vector cimport vector
@@ -19,11 +19,19 @@ cdef extern from "ael_log_parser.hxx" namespace "logtt" nogil:
             uint32_t       cluster_thr,
             float          merge_thr,
         )
+        bint m_build_token_index
         int32_t parse(
             const string& log_file,
             const string& structured_table_name,
             const string& templates_table_name,
         )
+        int32_t match(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            const string& source_templates_table_name,
+            int64_t&      unmatched_count,
+        )
 
 cdef extern from "brain_log_parser.hxx" namespace "logtt" nogil:
     cdef cppclass BrainLogParser:
@@ -37,11 +45,19 @@ cdef extern from "brain_log_parser.hxx" namespace "logtt" nogil:
             vector[char]   delimiters,
             uint16_t       var_thr,
         )
+        bint m_build_token_index
         int32_t parse(
             const string& log_file,
             const string& structured_table_name,
             const string& templates_table_name,
         )
+        int32_t match(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            const string& source_templates_table_name,
+            int64_t&      unmatched_count,
+        )
 
 cdef extern from "drain_log_parser.hxx" namespace "logtt" nogil:
     cdef cppclass DrainLogParser:
@@ -57,11 +73,34 @@ cdef extern from "drain_log_parser.hxx" namespace "logtt" nogil:
             uint16_t       children,
             float          sim_thr,
         )
+        bint m_build_token_index
         int32_t parse(
             const string& log_file,
             const string& structured_table_name,
             const string& templates_table_name,
         )
+        int32_t match(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            const string& source_templates_table_name,
+            int64_t&      unmatched_count,
+        )
+        int32_t parse_incremental(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            int64_t       line_offset,
+        )
+        int32_t match_learned(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            bint          learn_unmatched,
+            int64_t&      unmatched_count,
+        )
+        bint save_snapshot(const string& snapshot_file) const
+        bint load_snapshot(const string& snapshot_file)
 
 cdef extern from "jaccard_drain_log_parser.hxx" namespace "logtt" nogil:
     cdef cppclass JaccardDrainLogParser:
@@ -77,11 +116,34 @@ cdef extern from "jaccard_drain_log_parser.hxx" namespace "logtt" nogil:
             uint16_t       children,
             float          sim_thr,
         )
+        bint m_build_token_index
         int32_t parse(
             const string& log_file,
             const string& structured_table_name,
             const string& templates_table_name,
         )
+        int32_t match(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            const string& source_templates_table_name,
+            int64_t&      unmatched_count,
+        )
+        int32_t parse_incremental(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            int64_t       line_offset,
+        )
+        int32_t match_learned(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            bint          learn_unmatched,
+            int64_t&      unmatched_count,
+        )
+        bint save_snapshot(const string& snapshot_file) const
+        bint load_snapshot(const string& snapshot_file)
 
 cdef extern from "spell_log_parser.hxx" namespace "logtt" nogil:
     cdef cppclass SpellLogParser:
@@ -95,8 +157,31 @@ cdef extern from "spell_log_parser.hxx" namespace "logtt" nogil:
             vector[char]   delimiters,
             float          sim_thr,
         )
+        bint m_build_token_index
         int32_t parse(
             const string& log_file,
             const string& structured_table_name,
             const string& templates_table_name,
         )
+        int32_t match(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            const string& source_templates_table_name,
+            int64_t&      unmatched_count,
+        )
+        int32_t parse_incremental(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            int64_t       line_offset,
+        )
+        int32_t match_learned(
+            const string& log_file,
+            const string& structured_table_name,
+            const string& templates_table_name,
+            bint          learn_unmatched,
+            int64_t&      unmatched_count,
+        )
+        bint save_snapshot(const string& snapshot_file) const
+        bint load_snapshot(const string& snapshot_file)
@@ -5,6 +5,9 @@ from .parse_result import ParseResult
 
 
 class LogParserProtocol(Protocol):
+    # 解析时是否同时建立 token 倒排索引
+    build_token_index: bool
+
     def __init__(
         self,
         log_format: str,
@@ -20,6 +23,13 @@ class LogParserProtocol(Protocol):
         structured_table_name: str,
         templates_table_name: str,
     ) -> ParseResult: ...
+    def match(
+        self,
+        log_file: str,
+        structured_table_name: str,
+        templates_table_name: str,
+        source_templates_table_name: str,
+    ) -> ParseResult: ...
     @staticmethod
     def name() -> str: ...
     @staticmethod
@@ -5,7 +5,7 @@ cdef object ParamWidgetType
 cdef object ParseResult
 cdef object QCoreApplication
 
-from libc.stdint cimport int32_t, uint16_t, uint32_t
+from libc.stdint cimport int32_t, int64_t, uint16_t, uint32_t
 from libcpp.string cimport string
 from libcpp.vector cimport vector
 
@@ -24,9 +24,242 @@ from .param_descriptor import ParamDescriptor, ParamWidgetType
 from .parse_result import ParseResult
 from .parser_factory import parser_register
 
+# ========================== Base ==========================
+
+cdef class _BaseLogParser:
+    """各解析算法共用的 Python 接口，子类实现下面的 cdef 方法，转发给各自的 C++ 解析器"""
+
+    cdef int32_t _parse(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+    ) noexcept nogil:
+        return -1
+
+    cdef int32_t _match(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        const string& source_templates_table_name,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return -1
+
+    cdef bint _get_build_token_index(self) noexcept:
+        return False
+
+    cdef void _set_build_token_index(self, bint value) noexcept:
+        pass
+
+    def parse(
+        self,
+        string log_file,
+        string structured_table_name,
+        string templates_table_name,
+    ) -> ParseResult:
+        cdef int32_t log_length
+
+        with nogil:
+            log_length = self._parse(
+                log_file,
+                structured_table_name,
+                templates_table_name,
+            )
+
+        if log_length < 0:
+            raise ValueError("The log_format or timestamp_format is invalid")
+
+        return ParseResult(
+            log_file,
+            log_length,
+            structured_table_name,
+            templates_table_name,
+        )
+
+    def match(
+        self,
+        string log_file,
+        string structured_table_name,
+        string templates_table_name,
+        string source_templates_table_name,
+    ) -> ParseResult:
+        """只匹配不学习：把日志逐行匹配到已有模板表中的模板上，不会新增或修改任何模板"""
+        cdef int32_t log_length
+        cdef int64_t unmatched_count = 0
+
+        with nogil:
+            log_length = self._match(
+                log_file,
+                structured_table_name,
+                templates_table_name,
+                source_templates_table_name,
+                unmatched_count,
+            )
+
+        return self._match_result(
+            log_file,
+            log_length,
+            structured_table_name,
+            templates_table_name,
+            unmatched_count,
+        )
+
+    cdef object _match_result(
+        self,
+        const string& log_file,
+        int32_t log_length,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        int64_t unmatched_count,
+    ):
+        if log_length < 0:
+            raise ValueError("The source templates table does not exist or the log_format is invalid")
+
+        return ParseResult(
+            log_file,
+            log_length,
+            structured_table_name,
+            templates_table_name,
+            unmatched_count,
+        )
+
+    @property
+    def build_token_index(self) -> bool:
+        """解析时是否同时建立 token 倒排索引，用于在日志中按关键字搜索"""
+        return self._get_build_token_index()
+
+    @build_token_index.setter
+    def build_token_index(self, bint value):
+        self._set_build_token_index(value)
+
+cdef class _IncrementalLogParser(_BaseLogParser):
+    """支持增量解析与快照的解析算法共用的 Python 接口"""
+
+    cdef int32_t _parse_incremental(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        int64_t line_offset,
+    ) noexcept nogil:
+        return -1
+
+    cdef int32_t _match_learned(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        bint learn_unmatched,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return -1
+
+    cdef bint _save_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return False
+
+    cdef bint _load_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return False
+
+    def match(
+        self,
+        string log_file,
+        string structured_table_name,
+        string templates_table_name,
+        object source_templates_table_name=None,
+        bint learn_unmatched=False,
+    ) -> ParseResult:
+        """
+        只匹配不学习：把日志逐行匹配到已有模板上，不会新增或修改任何模板
+
+        Args:
+            source_templates_table_name: 已有的模板表，为 None 时使用当前学习到的模板（例如刚加载的快照）
+            learn_unmatched: 未匹配的行是否再交给聚类学习，只在使用当前学习到的模板时有效
+        """
+        cdef int32_t log_length
+        cdef int64_t unmatched_count = 0
+        cdef string source
+
+        if source_templates_table_name is None:
+            with nogil:
+                log_length = self._match_learned(
+                    log_file,
+                    structured_table_name,
+                    templates_table_name,
+                    learn_unmatched,
+                    unmatched_count,
+                )
+        else:
+            source = source_templates_table_name
+            with nogil:
+                log_length = self._match(
+                    log_file,
+                    structured_table_name,
+                    templates_table_name,
+                    source,
+                    unmatched_count,
+                )
+
+        return self._match_result(
+            log_file,
+            log_length,
+            structured_table_name,
+            templates_table_name,
+            unmatched_count,
+        )
+
+    def parse_incremental(
+        self,
+        string log_file,
+        string structured_table_name,
+        string templates_table_name,
+        int64_t line_offset,
+    ) -> ParseResult:
+        """在上一次解析的基础上，只解析前 line_offset 行之后追加的日志"""
+        cdef int32_t log_length
+
+        with nogil:
+            log_length = self._parse_incremental(
+                log_file,
+                structured_table_name,
+                templates_table_name,
+                line_offset,
+            )
+
+        if log_length < 0:
+            raise ValueError("The log_format or timestamp_format is invalid")
+
+        return ParseResult(
+            log_file,
+            line_offset + log_length,
+            structured_table_name,
+            templates_table_name,
+        )
+
+    def save_snapshot(self, string snapshot_file):
+        """把学习到的状态保存为二进制快照"""
+        cdef bint ok
+
+        with nogil:
+            ok = self._save_snapshot(snapshot_file)
+
+        if not ok:
+            raise OSError(f"Failed to write snapshot: {snapshot_file}")
+
+    def load_snapshot(self, string snapshot_file):
+        """从二进制快照恢复学习到的状态，之后可以继续增量解析"""
+        cdef bint ok
+
+        with nogil:
+            ok = self._load_snapshot(snapshot_file)
+
+        if not ok:
+            raise ValueError(f"Invalid snapshot: {snapshot_file}")
+
 # ========================== AEL ==========================
 
-cdef class AELLogParser:
+cdef class AELLogParser(_BaseLogParser):
     """AEL算法"""
 
     cdef CXX_AELLogParser log_parser
@@ -60,31 +293,36 @@ cdef class AELLogParser:
             merge_thr,
         )
 
-    def parse(
+    cdef int32_t _parse(
         self,
-        string log_file,
-        string structured_table_name,
-        string templates_table_name,
-    ) -> ParseResult:
-        cdef int32_t log_length
-
-        with nogil:
-            log_length = self.log_parser.parse(
-                log_file,
-                structured_table_name,
-                templates_table_name,
-            )
-
-        if log_length < 0:
-            raise ValueError("The log_format or timestamp_format is invalid")
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+    ) noexcept nogil:
+        return self.log_parser.parse(log_file, structured_table_name, templates_table_name)
 
-        return ParseResult(
+    cdef int32_t _match(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        const string& source_templates_table_name,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match(
             log_file,
-            log_length,
             structured_table_name,
             templates_table_name,
+            source_templates_table_name,
+            unmatched_count,
         )
 
+    cdef bint _get_build_token_index(self) noexcept:
+        return self.log_parser.m_build_token_index
+
+    cdef void _set_build_token_index(self, bint value) noexcept:
+        self.log_parser.m_build_token_index = value
+
     @staticmethod
     def name() -> str:
         return "AEL"
@@ -118,7 +356,7 @@ cdef class AELLogParser:
 
 # ========================== Brain ==========================
 
-cdef class BrainLogParser:
+cdef class BrainLogParser(_BaseLogParser):
     """Brain算法"""
 
     cdef CXX_BrainLogParser log_parser
@@ -149,31 +387,36 @@ cdef class BrainLogParser:
             var_thr,
         )
 
-    def parse(
+    cdef int32_t _parse(
         self,
-        string log_file,
-        string structured_table_name,
-        string templates_table_name,
-    ) -> ParseResult:
-        cdef int32_t log_length
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+    ) noexcept nogil:
+        return self.log_parser.parse(log_file, structured_table_name, templates_table_name)
 
-        with nogil:
-            log_length = self.log_parser.parse(
-                log_file,
-                structured_table_name,
-                templates_table_name,
-            )
-
-        if log_length < 0:
-            raise ValueError("The log_format or timestamp_format is invalid")
-
-        return ParseResult(
+    cdef int32_t _match(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        const string& source_templates_table_name,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match(
             log_file,
-            log_length,
             structured_table_name,
             templates_table_name,
+            source_templates_table_name,
+            unmatched_count,
         )
 
+    cdef bint _get_build_token_index(self) noexcept:
+        return self.log_parser.m_build_token_index
+
+    cdef void _set_build_token_index(self, bint value) noexcept:
+        self.log_parser.m_build_token_index = value
+
     @staticmethod
     def name() -> str:
         return "Brain"
@@ -198,7 +441,7 @@ cdef class BrainLogParser:
 
 # ========================== Drain ==========================
 
-cdef class DrainLogParser:
+cdef class DrainLogParser(_IncrementalLogParser):
     """Drain算法"""
 
     cdef CXX_DrainLogParser log_parser
@@ -238,31 +481,72 @@ cdef class DrainLogParser:
             sim_thr,
         )
 
-    def parse(
+    cdef int32_t _parse(
         self,
-        string log_file,
-        string structured_table_name,
-        string templates_table_name,
-    ) -> ParseResult:
-        cdef int32_t log_length
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+    ) noexcept nogil:
+        return self.log_parser.parse(log_file, structured_table_name, templates_table_name)
 
-        with nogil:
-            log_length = self.log_parser.parse(
-                log_file,
-                structured_table_name,
-                templates_table_name,
-            )
+    cdef int32_t _match(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        const string& source_templates_table_name,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match(
+            log_file,
+            structured_table_name,
+            templates_table_name,
+            source_templates_table_name,
+            unmatched_count,
+        )
 
-        if log_length < 0:
-            raise ValueError("The log_format or timestamp_format is invalid")
+    cdef bint _get_build_token_index(self) noexcept:
+        return self.log_parser.m_build_token_index
 
-        return ParseResult(
+    cdef void _set_build_token_index(self, bint value) noexcept:
+        self.log_parser.m_build_token_index = value
+
+    cdef int32_t _parse_incremental(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        int64_t line_offset,
+    ) noexcept nogil:
+        return self.log_parser.parse_incremental(
             log_file,
-            log_length,
             structured_table_name,
             templates_table_name,
+            line_offset,
         )
 
+    cdef int32_t _match_learned(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        bint learn_unmatched,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match_learned(
+            log_file,
+            structured_table_name,
+            templates_table_name,
+            learn_unmatched,
+            unmatched_count,
+        )
+
+    cdef bint _save_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return self.log_parser.save_snapshot(snapshot_file)
+
+    cdef bint _load_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return self.log_parser.load_snapshot(snapshot_file)
+
     @staticmethod
     def name() -> str:
         return "Drain"
@@ -305,7 +589,7 @@ cdef class DrainLogParser:
 
 # ========================== JaccardDrain ==========================
 
-cdef class JaccardDrainLogParser:
+cdef class JaccardDrainLogParser(_IncrementalLogParser):
     """Drain算法"""
 
     cdef CXX_JaccardDrainLogParser log_parser
@@ -345,31 +629,72 @@ cdef class JaccardDrainLogParser:
             sim_thr,
         )
 
-    def parse(
+    cdef int32_t _parse(
         self,
-        string log_file,
-        string structured_table_name,
-        string templates_table_name,
-    ) -> ParseResult:
-        cdef int32_t log_length
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+    ) noexcept nogil:
+        return self.log_parser.parse(log_file, structured_table_name, templates_table_name)
 
-        with nogil:
-            log_length = self.log_parser.parse(
-                log_file,
-                structured_table_name,
-                templates_table_name,
-            )
+    cdef int32_t _match(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        const string& source_templates_table_name,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match(
+            log_file,
+            structured_table_name,
+            templates_table_name,
+            source_templates_table_name,
+            unmatched_count,
+        )
 
-        if log_length < 0:
-            raise ValueError("The log_format or timestamp_format is invalid")
+    cdef bint _get_build_token_index(self) noexcept:
+        return self.log_parser.m_build_token_index
 
-        return ParseResult(
+    cdef void _set_build_token_index(self, bint value) noexcept:
+        self.log_parser.m_build_token_index = value
+
+    cdef int32_t _parse_incremental(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        int64_t line_offset,
+    ) noexcept nogil:
+        return self.log_parser.parse_incremental(
             log_file,
-            log_length,
             structured_table_name,
             templates_table_name,
+            line_offset,
         )
 
+    cdef int32_t _match_learned(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        bint learn_unmatched,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match_learned(
+            log_file,
+            structured_table_name,
+            templates_table_name,
+            learn_unmatched,
+            unmatched_count,
+        )
+
+    cdef bint _save_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return self.log_parser.save_snapshot(snapshot_file)
+
+    cdef bint _load_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return self.log_parser.load_snapshot(snapshot_file)
+
     @staticmethod
     def name() -> str:
         return "JaccardDrain"
@@ -412,7 +737,7 @@ cdef class JaccardDrainLogParser:
 
 # ========================== Spell ==========================
 
-cdef class SpellLogParser:
+cdef class SpellLogParser(_IncrementalLogParser):
     """Spell算法"""
 
     cdef CXX_SpellLogParser log_parser
@@ -443,31 +768,72 @@ cdef class SpellLogParser:
             sim_thr,
         )
 
-    def parse(
+    cdef int32_t _parse(
         self,
-        string log_file,
-        string structured_table_name,
-        string templates_table_name,
-    ) -> ParseResult:
-        cdef int32_t log_length
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+    ) noexcept nogil:
+        return self.log_parser.parse(log_file, structured_table_name, templates_table_name)
 
-        with nogil:
-            log_length = self.log_parser.parse(
-                log_file,
-                structured_table_name,
-                templates_table_name,
-            )
+    cdef int32_t _match(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        const string& source_templates_table_name,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match(
+            log_file,
+            structured_table_name,
+            templates_table_name,
+            source_templates_table_name,
+            unmatched_count,
+        )
 
-        if log_length < 0:
-            raise ValueError("The log_format or timestamp_format is invalid")
+    cdef bint _get_build_token_index(self) noexcept:
+        return self.log_parser.m_build_token_index
 
-        return ParseResult(
+    cdef void _set_build_token_index(self, bint value) noexcept:
+        self.log_parser.m_build_token_index = value
+
+    cdef int32_t _parse_incremental(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        int64_t line_offset,
+    ) noexcept nogil:
+        return self.log_parser.parse_incremental(
             log_file,
-            log_length,
             structured_table_name,
             templates_table_name,
+            line_offset,
         )
 
+    cdef int32_t _match_learned(
+        self,
+        const string& log_file,
+        const string& structured_table_name,
+        const string& templates_table_name,
+        bint learn_unmatched,
+        int64_t& unmatched_count,
+    ) noexcept nogil:
+        return self.log_parser.match_learned(
+            log_file,
+            structured_table_name,
+            templates_table_name,
+            learn_unmatched,
+            unmatched_count,
+        )
+
+    cdef bint _save_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return self.log_parser.save_snapshot(snapshot_file)
+
+    cdef bint _load_snapshot(self, const string& snapshot_file) noexcept nogil:
+        return self.log_parser.load_snapshot(snapshot_file)
+
     @staticmethod
     def name() -> str:
         return "Spell"
@@ -8,7 +8,7 @@ from PySide6.QtCore import (
 )
 from PySide6.QtGui import QColor
 
-from modules.duckdb_service import DuckDBService
+from modules.duckdb_service import DuckDBService, QueryColumn
 
 
 class CsvFileTableModel(QAbstractTableModel):
@@ -27,7 +27,8 @@ class CsvFileTableModel(QAbstractTableModel):
         self._columns = DuckDBService.get_table_columns(table_name)
         self._total_row_count = DuckDBService.get_table_row_count(table_name)
 
-        # 缓存的DataFrame
+        # 缓存的列，单元格只在显示时才格式化为字符串
+        self._cache_columns: list[QueryColumn] = []
         self._cache_offset: int = 0
         self._cache_limit: int = 0
 
@@ -35,6 +36,14 @@ class CsvFileTableModel(QAbstractTableModel):
         self._filters: dict[str, list[str]] = {}
         self._filtered_row_count: int
 
+        # 排序的状态，为空时按表中的顺序显示
+        self._order_by: str = ""
+        self._descending: bool = False
+
+        # 搜索的状态，为空时不搜索
+        self._search_terms: list[str] = []
+        self._match_all: bool = True
+
         # 预加载第一页数据，主要是为了提前获取总行数
         self._cache_row_data(0)
 
@@ -80,7 +89,7 @@ class CsvFileTableModel(QAbstractTableModel):
             self._cache_row_data(row)
 
         if role == Qt.ItemDataRole.DisplayRole:
-            return self._cache_data[row - self._cache_offset][col]
+            return self._cache_columns[col].format(row - self._cache_offset)
 
         # 处理前景色角色
         elif role == Qt.ItemDataRole.ForegroundRole:
@@ -91,6 +100,21 @@ class CsvFileTableModel(QAbstractTableModel):
 
         return None
 
+    def sort(
+        self,
+        column: int,
+        order: Qt.SortOrder = Qt.SortOrder.AscendingOrder,
+    ) -> None:
+        # 无效列索引表示取消排序
+        order_by = self._columns[column] if column >= 0 else ""
+        descending = order == Qt.SortOrder.DescendingOrder
+        if order_by == self._order_by and (not order_by or descending == self._descending):
+            return
+
+        self._order_by = order_by
+        self._descending = descending
+        self.refresh()
+
     # ==================== 私有方法 ====================
 
     def _cache_row_data(self, row: int):
@@ -99,11 +123,15 @@ class CsvFileTableModel(QAbstractTableModel):
         self._cache_offset = max(0, row - self._PAGE_SIZE)
 
         try:
-            self._cache_data, self._filtered_row_count = DuckDBService.fetch_csv_table(
+            self._cache_columns, self._filtered_row_count = DuckDBService.fetch_csv_table(
                 self._table_name,
                 self._cache_offset,
                 self._cache_limit,
                 self._filters,
+                self._order_by,
+                self._descending,
+                self._search_terms,
+                self._match_all,
             )
         except Exception as e:
             print(f"Error fetching data: {e}")
@@ -148,6 +176,21 @@ class CsvFileTableModel(QAbstractTableModel):
         self._filters.clear()
         self.refresh()
 
+    def is_searching(self) -> bool:
+        """检查是否正在搜索"""
+        return bool(self._search_terms)
+
+    def set_search(self, terms: list[str], match_all: bool = True):
+        """只显示包含全部 (match_all) 或任意一个搜索词的行"""
+        self._search_terms = terms
+        self._match_all = match_all
+        self.refresh()
+
+    def clear_search(self):
+        """清除搜索"""
+        self._search_terms = []
+        self.refresh()
+
     def refresh(self):
         """刷新模型数据"""
         self.beginResetModel()
@@ -9,7 +9,7 @@ from PySide6.QtCore import (
     Signal,
 )
 
-from modules.duckdb_service import DuckDBService
+from modules.duckdb_service import DuckDBService, QueryColumn
 
 
 class CsvFilterTableModel(QAbstractTableModel):
@@ -43,7 +43,8 @@ class CsvFilterTableModel(QAbstractTableModel):
         self._column_name = column_name
         self._total_row_count: int
 
-        # 缓存的DataFrame
+        # 缓存的列，单元格只在显示时才格式化为字符串
+        self._cache_columns: list[QueryColumn] = []
         self._cache_offset: int = 0
         self._cache_limit: int = 0
 
@@ -112,12 +113,12 @@ class CsvFilterTableModel(QAbstractTableModel):
             self._cache_row_data(row)
 
         if role == Qt.ItemDataRole.DisplayRole:
-            return self._cache_data[row - self._cache_offset][col]
+            return self._cache_columns[col].format(row - self._cache_offset)
 
         if role == Qt.ItemDataRole.CheckStateRole:
             if col != 0:
                 return None
-            row_value = self._cache_data[row - self._cache_offset][0]
+            row_value = self._cache_columns[0].format(row - self._cache_offset)
             return (
                 Qt.CheckState.Checked
                 if row_value in self._current_filter
@@ -136,7 +137,7 @@ class CsvFilterTableModel(QAbstractTableModel):
             return False
 
         if role == Qt.ItemDataRole.CheckStateRole:
-            row_value = self._cache_data[index.row() - self._cache_offset][0]
+            row_value = self._cache_columns[0].format(index.row() - self._cache_offset)
 
             if Qt.CheckState(value) == Qt.CheckState.Checked:
                 self._current_filter.append(row_value)
@@ -158,7 +159,7 @@ class CsvFilterTableModel(QAbstractTableModel):
         self._cache_offset = max(0, row - self._PAGE_SIZE)
 
         try:
-            self._cache_data, self._total_row_count = DuckDBService.fetch_filter_table(
+            self._cache_columns, self._total_row_count = DuckDBService.fetch_filter_table(
                 self._table_name,
                 self._column_name,
                 self._cache_offset,
@@ -16,8 +16,15 @@ from PySide6.QtCore import (
 )
 from PySide6.QtGui import QColor
 
+from modules.app_config import appcfg
+from modules.constants import SNAPSHOT_PATH
 from modules.duckdb_service import DuckDBService
-from modules.logparser import LogParserConfig, LogParserProtocol
+from modules.logparser import (
+    BUILTIN_LOG_PARSER_CONFIGS,
+    LogParserConfig,
+    LogParserProtocol,
+    ParserFactory,
+)
 
 
 class LogColumn(IntEnum):
@@ -43,6 +50,8 @@ class SqlColumn(IntEnum):
     LINE_COUNT = 6  # line_count
     STRUCTURED_TABLE_NAME = 7  # structured_table_name
     TEMPLATES_TABLE_NAME = 8  # templates_table_name
+    SNAPSHOT_PATH = 9  # snapshot_path
+    SNAPSHOT_LINE_COUNT = 10  # snapshot_line_count
 
 
 class LogStatus(IntEnum):
@@ -54,7 +63,7 @@ class LogStatus(IntEnum):
 
 
 class LogExtractTaskSignals(QObject):
-    finished = Signal(int, int)  # (log_id, line_count)
+    finished = Signal(int, int, str)  # (log_id, line_count, snapshot_path)
     error = Signal(int, str)  # (log_id, error_message)
 
 
@@ -65,43 +74,54 @@ class LogExtractTask(QRunnable):
         self,
         log_id: int,
         log_file: Path,
-        log_parser_type: type[LogParserProtocol],
-        log_parser_config: LogParserConfig,
+        log_parser: LogParserProtocol,
         structured_table_name: str,
         templates_table_name: str,
+        line_offset: int = 0,
+        snapshot_file: Path | None = None,
     ):
         super().__init__()
         self._log_id = log_id
         self._log_file = log_file
-        self._log_parser_type = log_parser_type
-        self._log_parser_config = log_parser_config
+        self._log_parser = log_parser
         self._structured_table_name = structured_table_name
         self._templates_table_name = templates_table_name
+        self._line_offset = line_offset
+        self._snapshot_file = snapshot_file
 
         self.signals = LogExtractTaskSignals()
 
     @Slot()
     def run(self):
-        ex_args = self._log_parser_config.ex_args.get(
-            self._log_parser_type.name(),
-            {},
-        )
         try:
-            result = self._log_parser_type(
-                self._log_parser_config.log_format,
-                self._log_parser_config.timestamp_fields,
-                self._log_parser_config.timestamp_format,
-                self._log_parser_config.user_masks,
-                self._log_parser_config.delimiters,
-                **ex_args,
-            ).parse(
-                self._log_file.as_posix(),
-                self._structured_table_name,
-                self._templates_table_name,
-            )
-            self.signals.finished.emit(self._log_id, result.line_count)
+            # 有行偏移时只解析追加的日志，沿用解析器已有的状态
+            if self._line_offset > 0:
+                result = self._log_parser.parse_incremental(
+                    self._log_file.as_posix(),
+                    self._structured_table_name,
+                    self._templates_table_name,
+                    self._line_offset,
+                )
+            else:
+                result = self._log_parser.parse(
+                    self._log_file.as_posix(),
+                    self._structured_table_name,
+                    self._templates_table_name,
+                )
         except Exception as e:
             self.signals.error.emit(self._log_id, str(e))
+            return
+
+        # 保存解析器状态，重启程序后仍可以从这里继续增量解析；保存失败时只是不能再增量解析
+        snapshot_path = ""
+        if self._snapshot_file is not None:
+            try:
+                self._snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+                self._log_parser.save_snapshot(self._snapshot_file.as_posix())
+                snapshot_path = self._snapshot_file.as_posix()
+            except OSError:
+                pass
+        self.signals.finished.emit(self._log_id, result.line_count, snapshot_path)
 
 
 class LogTableModel(QAbstractTableModel):
@@ -127,6 +147,8 @@ class LogTableModel(QAbstractTableModel):
         "line_count",
         "structured_table_name",
         "templates_table_name",
+        "snapshot_path",
+        "snapshot_line_count",
     ]
     # 模型列到数据库列的映射
     _MODEL_TO_SQL = [
@@ -168,6 +190,8 @@ class LogTableModel(QAbstractTableModel):
         self._data: list[tuple] = DuckDBService.get_log_table()
         # 存储正在提取的任务信息: log_id
         self._extract_tasks: set[int] = set()
+        # 存储支持增量解析的解析器实例: log_id -> parser
+        self._log_parsers: dict[int, LogParserProtocol] = {}
 
     # ==================== 重写方法 ====================
 
@@ -241,10 +265,10 @@ class LogTableModel(QAbstractTableModel):
         if col == LogColumn.STATUS:
 
             def sort_status(log: tuple) -> int:
-                if log[SqlColumn.IS_EXTRACTED]:
-                    return LogStatus.EXTRACTED
-                elif log[SqlColumn.ID] in self._extract_tasks:
+                if log[SqlColumn.ID] in self._extract_tasks:
                     return LogStatus.EXTRACTING
+                elif log[SqlColumn.IS_EXTRACTED]:
+                    return LogStatus.EXTRACTED
                 else:
                     return LogStatus.NOT_EXTRACTED
 
@@ -296,11 +320,11 @@ class LogTableModel(QAbstractTableModel):
 
     def _get_status(self, index: QModelIndex | QPersistentModelIndex) -> LogStatus:
         """获取日志状态"""
-        is_extracted = self._data[index.row()][SqlColumn.IS_EXTRACTED]
-        if is_extracted:
-            return LogStatus.EXTRACTED
-        elif index.data(self.LOG_ID_ROLE) in self._extract_tasks:
+        # 增量提取时日志已是已提取状态，需要先判断是否正在提取
+        if index.data(self.LOG_ID_ROLE) in self._extract_tasks:
             return LogStatus.EXTRACTING
+        elif self._data[index.row()][SqlColumn.IS_EXTRACTED]:
+            return LogStatus.EXTRACTED
         else:
             return LogStatus.NOT_EXTRACTED
 
@@ -314,13 +338,107 @@ class LogTableModel(QAbstractTableModel):
         """同步数据库"""
         DuckDBService.update_log(log_id, self._SQL_HEADERS[column], value)
 
+    def _set_snapshot(self, log_id: int, snapshot_path: str, line_count: int):
+        """同步数据库和内存中的快照路径及其已经解析的行数"""
+        DuckDBService.update_log_snapshot(log_id, snapshot_path, line_count)
+        if (row := self._get_row(log_id)) >= 0:
+            self._set_df_data(row, SqlColumn.SNAPSHOT_PATH, snapshot_path)
+            self._set_df_data(row, SqlColumn.SNAPSHOT_LINE_COUNT, line_count)
+
+    def _remove_snapshot(self, log_id: int):
+        """删除日志的解析器状态快照"""
+        self._snapshot_file(log_id).unlink(missing_ok=True)
+        self._set_snapshot(log_id, "", 0)
+
+    def _has_snapshot(self, row: int) -> bool:
+        """快照存在且与已解析的行数一致时，才可以从快照继续增量解析"""
+        snapshot_path = self._data[row][SqlColumn.SNAPSHOT_PATH]
+        return (
+            bool(snapshot_path)
+            and self._data[row][SqlColumn.SNAPSHOT_LINE_COUNT]
+            == self._data[row][SqlColumn.LINE_COUNT]
+            and Path(snapshot_path).is_file()
+        )
+
+    @staticmethod
+    def _snapshot_file(log_id: int) -> Path:
+        """日志的解析器状态快照文件"""
+        return SNAPSHOT_PATH / f"{log_id}.snapshot"
+
+    @staticmethod
+    def _create_log_parser(
+        log_parser_type: type[LogParserProtocol],
+        log_parser_config: LogParserConfig,
+    ) -> LogParserProtocol:
+        """按日志格式创建解析器"""
+        ex_args = log_parser_config.ex_args.get(log_parser_type.name(), {})
+        log_parser = log_parser_type(
+            log_parser_config.log_format,
+            log_parser_config.timestamp_fields,
+            log_parser_config.timestamp_format,
+            log_parser_config.user_masks,
+            log_parser_config.delimiters,
+            **ex_args,
+        )
+        log_parser.build_token_index = appcfg.get(appcfg.buildTokenIndex)
+        return log_parser
+
+    def _restore_log_parser(self, row: int) -> LogParserProtocol | None:
+        """按记录的日志格式和提取方法重新创建解析器，并从快照恢复它的状态"""
+        format_type = self._data[row][SqlColumn.FORMAT_TYPE]
+        extract_method = self._data[row][SqlColumn.EXTRACT_METHOD]
+        log_parser_config = next(
+            (
+                config
+                for config in appcfg.get(appcfg.logParserConfigs)
+                + BUILTIN_LOG_PARSER_CONFIGS
+                if config.name == format_type
+            ),
+            None,
+        )
+        log_parser_type = next(
+            (
+                parser_type
+                for parser_type in ParserFactory.get_all_parsers_type()
+                if parser_type.name() == extract_method
+            ),
+            None,
+        )
+        if log_parser_config is None or log_parser_type is None:
+            return None
+
+        # 格式配置可能已经被修改，快照文件可能无法读取、版本不符或者已损坏，这些情况都放弃恢复
+        # 解析器参数无效时抛出 TypeError 或 ValueError，快照无法加载时 load_snapshot 抛出 ValueError
+        try:
+            log_parser = self._create_log_parser(log_parser_type, log_parser_config)
+            log_parser.load_snapshot(self._data[row][SqlColumn.SNAPSHOT_PATH])
+        except (AttributeError, OSError, TypeError, ValueError):
+            return None
+        return log_parser
+
+    def _start_extract_task(self, row: int, log_id: int, task: LogExtractTask):
+        """提交提取任务并记录任务信息"""
+        task.signals.finished.connect(self._on_extract_finished)
+        task.signals.error.connect(self._on_extract_errored)
+
+        # 将任务提交到线程池
+        self._log_extract_pool.start(task)
+
+        # 记录任务信息
+        self._extract_tasks.add(log_id)
+        self.dataChanged.emit(
+            self.index(row, 0),
+            self.index(row, self.columnCount() - 1),
+        )
+
     # ==================== 槽函数 ====================
 
-    @Slot(int, int)
+    @Slot(int, int, str)
     def _on_extract_finished(
         self,
         log_id: int,
         line_count: int,
+        snapshot_path: str,
     ):
         """处理提取完成"""
         # 清理任务信息
@@ -329,6 +447,7 @@ class LogTableModel(QAbstractTableModel):
         # 更新数据库和ui状态
         self._set_sql_data(log_id, SqlColumn.IS_EXTRACTED, True)
         self._set_sql_data(log_id, SqlColumn.LINE_COUNT, line_count)
+        self._set_snapshot(log_id, snapshot_path, line_count if snapshot_path else 0)
         if (row := self._get_row(log_id)) >= 0:
             self._set_df_data(row, SqlColumn.IS_EXTRACTED, True)
             self._set_df_data(row, SqlColumn.LINE_COUNT, line_count)
@@ -343,8 +462,10 @@ class LogTableModel(QAbstractTableModel):
     @Slot(int, str)
     def _on_extract_errored(self, log_id: int, error_msg: str):
         """处理提取错误"""
-        # 清理任务信息
+        # 清理任务信息，解析器状态可能已不完整，不再用于增量解析
         self._extract_tasks.remove(log_id)
+        self._log_parsers.pop(log_id, None)
+        self._remove_snapshot(log_id)
 
         # 更新ui状态
         if (row := self._get_row(log_id)) >= 0:
@@ -384,7 +505,9 @@ class LogTableModel(QAbstractTableModel):
             DuckDBService.drop_table(structured_table_name)
             DuckDBService.drop_table(templates_table_name)
             # 删除日志记录
+            self._remove_snapshot(log_id)
             DuckDBService.delete_log(log_id)
+            self._log_parsers.pop(log_id, None)
 
             self.beginRemoveRows(QModelIndex(), row, row)
             self._data.pop(row)
@@ -412,23 +535,62 @@ class LogTableModel(QAbstractTableModel):
             self.index(row, LogColumn.EXTRACT_METHOD),
         )
 
+        # 重新提取后旧的快照不再对应结构化表中的数据
+        self._remove_snapshot(log_id)
+
+        # 创建解析器，支持增量解析的解析器保留下来供后续追加的日志使用，并在提取完成后保存快照
+        log_parser = self._create_log_parser(log_parser_type, log_parser_config)
+        snapshot_file = None
+        if hasattr(log_parser, "parse_incremental"):
+            self._log_parsers[log_id] = log_parser
+            snapshot_file = self._snapshot_file(log_id)
+        else:
+            self._log_parsers.pop(log_id, None)
+
         # 创建提取任务
         task = LogExtractTask(
             log_id,
             Path(self._data[row][SqlColumn.LOG_PATH]),
-            log_parser_type,
-            log_parser_config,
+            log_parser,
             self._data[row][SqlColumn.STRUCTURED_TABLE_NAME],
             self._data[row][SqlColumn.TEMPLATES_TABLE_NAME],
+            snapshot_file=snapshot_file,
         )
-        task.signals.finished.connect(self._on_extract_finished)
-        task.signals.error.connect(self._on_extract_errored)
+        self._start_extract_task(row, log_id, task)
 
-        # 将任务提交到线程池
-        self._log_extract_pool.start(task)
+    def can_extract_incremental(self, index: QModelIndex) -> bool:
+        """是否可以对该日志进行增量提取：解析器仍在内存中，或者保存了可用的快照"""
+        log_id = index.data(self.LOG_ID_ROLE)
+        return log_id in self._log_parsers or self._has_snapshot(index.row())
 
-        # 记录任务信息
-        self._extract_tasks.add(log_id)
+    def request_extract_incremental(self, index: QModelIndex):
+        """请求增量提取日志，只解析上次提取之后追加的行"""
+        row = index.row()
+        log_id = index.data(self.LOG_ID_ROLE)
+        if log_id in self._extract_tasks:
+            return
+        # 解析器不在内存中（例如程序重启过）时，从快照恢复
+        if (log_parser := self._log_parsers.get(log_id)) is None:
+            if not self._has_snapshot(row):
+                return
+            if (log_parser := self._restore_log_parser(row)) is None:
+                # 快照无法恢复时删除它，之后只能重新提取
+                self._remove_snapshot(log_id)
+                return
+            self._log_parsers[log_id] = log_parser
+
+        # 提取过程中结构化表和快照不再对应，提取完成后重新保存快照
+        self._set_snapshot(log_id, "", 0)
+        task = LogExtractTask(
+            log_id,
+            Path(self._data[row][SqlColumn.LOG_PATH]),
+            log_parser,
+            self._data[row][SqlColumn.STRUCTURED_TABLE_NAME],
+            self._data[row][SqlColumn.TEMPLATES_TABLE_NAME],
+            self._data[row][SqlColumn.LINE_COUNT],
+            self._snapshot_file(log_id),
+        )
+        self._start_extract_task(row, log_id, task)
 
     def has_extracting_tasks(self) -> bool:
         """是否有正在提取的任务"""
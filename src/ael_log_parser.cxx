@@ -1,6 +1,8 @@
 #include "ael_log_parser.hxx"
 #include "duckdb_service.hxx"
 #include "utils.hxx"
+#include <algorithm>
+#include <numeric>
 #include <ranges>
 
 namespace logtt
@@ -31,132 +33,135 @@ std::int32_t AELLogParser::parse(
     const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
 )
 {
-    // 初始化日志簇池
+    // 初始化日志簇池和 token 字典
     this->m_cluster_pool.clear();
-    std::vector<std::string> templates;
+    this->m_token_dict.clear();
+    std::vector<std::string>    log_templates;
+    std::vector<TemplateRecord> templates;
+    std::vector<std::uint32_t>  template_ids;
     // 获取数据库连接
     auto& conn {get_connection()};
 
     auto rel {load_data(
         conn, log_file, this->m_log_regex, this->m_named_fields, this->m_timestamp_fields, this->m_timestamp_format
     )};
-    rel = mask_log_rel(rel, this->m_masks);
-    rel = split_log_rel(rel, this->m_delimiters);
+    rel = mask_log_rel(conn, rel, this->m_masks);
+    rel = split_log_rel(conn, rel, this->m_delimiters);
 
     // 缓存分词结果，避免重复计算
-    auto ret {get_tmp(conn, rel)};
-    if (!ret)
+    auto star_expr_1 {make_uniq<StarExpression>()};
+    star_expr_1->exclude_list.emplace("MaskedContent");
+
+    ParsedExprVec project_exprs_1;
+    project_exprs_1.push_back(std::move(star_expr_1));
+
+    rel = rel->Project(std::move(project_exprs_1), {});
+
+    auto scratch {ScratchTable::create(conn, rel)};
+    if (!scratch)
     {
         return -1;
     }
-    rel = ret.value();
+    rel = scratch->relation();
 
     auto log_length {get_rel_row_count(rel)};
-    templates.resize(log_length);
+    template_ids.resize(log_length);
 
     auto log_bin {this->_get_log_bins(rel)};
     auto merged_clusters {this->_reconcile(log_bin)};
-    for (auto&& cluster : merged_clusters)
+    // 预留足够的容量，log_templates 中的字符串不会被移动，templates 可以直接引用
+    log_templates.reserve(merged_clusters.size());
+    templates.reserve(merged_clusters.size());
+    for (auto&& [template_id, cluster] : std::views::enumerate(merged_clusters))
     {
-        auto log_template {cluster->get_template()};
+        const auto& log_template {log_templates.emplace_back(this->m_token_dict.to_string(cluster->content))};
+        templates.emplace_back(
+            static_cast<std::uint32_t>(template_id), log_template, static_cast<std::int64_t>(cluster->rows.size())
+        );
 
         for (auto&& row : cluster->rows)
         {
-            templates[row - 1] = log_template;
+            template_ids[row - 1] = static_cast<std::uint32_t>(template_id);
         }
     }
 
+    if (!this->_write_token_index(conn, rel, structured_table_name))
+    {
+        return -1;
+    }
+
     // 移除多余列
-    auto star_expr {make_uniq<StarExpression>()};
-    star_expr->exclude_list.emplace("MaskedContent");
-    star_expr->exclude_list.emplace("Tokens");
+    auto star_expr_2 {make_uniq<StarExpression>()};
+    star_expr_2->exclude_list.emplace("Tokens");
 
-    ParsedExprVec project_exprs;
-    project_exprs.push_back(std::move(star_expr));
+    ParsedExprVec project_exprs_2;
+    project_exprs_2.push_back(std::move(star_expr_2));
 
-    rel = rel->Project(std::move(project_exprs), {});
+    rel = rel->Project(std::move(project_exprs_2), {});
 
-    to_table(conn, rel, templates, structured_table_name, templates_table_name);
+    to_table(conn, rel, template_ids, 0, std::move(templates), structured_table_name, templates_table_name);
     return static_cast<std::int32_t>(log_length);
 }
 
 AELLogParser::LogBin AELLogParser::_get_log_bins(const shared_ptr<Relation>& rel)
 {
-    ParsedExprVec arg_exprs_1;
-    arg_exprs_1.push_back(make_uniq<ColumnRefExpression>("Tokens"));
-
-    auto func_expr_1 {make_uniq<FunctionExpression>("length", std::move(arg_exprs_1))};
-    func_expr_1->SetAlias("token_count");
-
-    ParsedExprVec arg_exprs_2;
-    arg_exprs_2.push_back(make_uniq<ColumnRefExpression>("MaskedContent"));
-    arg_exprs_2.push_back(make_uniq<ConstantExpression>("<#.*#>"));
-
-    ParsedExprVec arg_exprs_3;
-    arg_exprs_3.push_back(make_uniq<FunctionExpression>("regexp_extract_all", std::move(arg_exprs_2)));
-
-    auto func_expr_2 {make_uniq<FunctionExpression>("length", std::move(arg_exprs_3))};
-    func_expr_2->SetAlias("para_count");
-
-    ParsedExprVec project_exprs_1;
-    project_exprs_1.push_back(make_uniq<ColumnRefExpression>("LineID"));
-    project_exprs_1.push_back(make_uniq<ColumnRefExpression>("Tokens"));
-    project_exprs_1.push_back(std::move(func_expr_1));
-    project_exprs_1.push_back(std::move(func_expr_2));
+    // token_count 和 para_count 都由 Tokens 决定，只需按 Tokens 分组，两个计数在读取时从 token 列表得到
+    ParsedExprVec arg_exprs;
+    arg_exprs.push_back(make_uniq<ColumnRefExpression>("LineID"));
 
-    auto tmp_rel {rel->Project(std::move(project_exprs_1), {})};
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(make_uniq<ColumnRefExpression>("Tokens"));
+    project_exprs.push_back(make_uniq<FunctionExpression>("list", std::move(arg_exprs)));
 
-    ParsedExprVec arg_exprs_4;
-    arg_exprs_4.push_back(make_uniq<ColumnRefExpression>("LineID"));
+    auto tmp_rel {rel->Aggregate(std::move(project_exprs), "Tokens")};
 
-    ParsedExprVec project_exprs_2;
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("token_count"));
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("para_count"));
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("Tokens"));
-    project_exprs_2.push_back(make_uniq<FunctionExpression>("list", std::move(arg_exprs_4)));
+    // 按 token ID 缓存该 token 是否包含掩码占位符 <#...#>，字典随读取增长，缓存也随之扩展
+    std::vector<std::int8_t> is_param;
+    auto                     count_params {[this, &is_param](const TContent& content) -> std::int64_t
+    {
+        is_param.resize(this->m_token_dict.size(), -1);
 
-    tmp_rel = tmp_rel->Aggregate(std::move(project_exprs_2), "token_count, para_count, Tokens");
+        std::int64_t para_count {0};
+        for (auto&& token : content)
+        {
+            if (is_param[token] < 0)
+            {
+                auto str {this->m_token_dict.get(token)};
+                auto begin {str.find("<#")};
+                is_param[token] =
+                    begin != std::string_view::npos && str.find("#>", begin + 2) != std::string_view::npos;
+            }
+            para_count += is_param[token];
+        }
+        return para_count;
+    }};
 
     LogBin log_bin;
     for (auto&& data_chunk : to_m_result(tmp_rel->Execute())->Collection().Chunks())
     {
-        const auto& token_count_col {data_chunk.data[0]};
-        const auto& para_count_col {data_chunk.data[1]};
-        const auto& tokens_col {data_chunk.data[2]};
-        const auto& tokens_child {ListVector::GetEntry(tokens_col)};
-        const auto& line_ids_col {data_chunk.data[3]};
+        const auto& tokens_col {data_chunk.data[0]};
+        const auto& line_ids_col {data_chunk.data[1]};
         const auto& line_ids_child {ListVector::GetEntry(line_ids_col)};
 
-        const auto* const token_count_data {FlatVector::GetData<std::int64_t>(token_count_col)};
-        const auto* const para_count_data {FlatVector::GetData<std::int64_t>(para_count_col)};
-        const auto* const tokens_data {FlatVector::GetData<list_entry_t>(tokens_col)};
-        const auto* const tokens_child_data {FlatVector::GetData<string_t>(tokens_child)};
         const auto* const line_ids_data {FlatVector::GetData<list_entry_t>(line_ids_col)};
         const auto* const line_ids_child_data {FlatVector::GetData<std::int64_t>(line_ids_child)};
 
         for (auto&& row : std::views::iota(0UL, data_chunk.size()))
         {
-            TContent                  content;
-            std::vector<std::int64_t> rows;
-
-            auto        token_count {token_count_data[row]};
-            auto        para_count {para_count_data[row]};
-            const auto& tokens_entry {tokens_data[row]};
             const auto& line_ids_entry {line_ids_data[row]};
 
-            for (auto&& i : std::views::iota(0UL, tokens_entry.length))
-            {
-                const auto& token {tokens_child_data[tokens_entry.offset + i]};
-                content.emplace_back(token.GetString());
-            }
+            // 直接写入日志簇，避免中间缓冲区的拷贝
+            auto* cluster {&this->m_cluster_pool.emplace_back()};
+            this->_read_content(tokens_col, row, cluster->content);
+            cluster->rows.reserve(line_ids_entry.length);
             for (auto&& i : std::views::iota(0UL, line_ids_entry.length))
             {
                 auto line_id {line_ids_child_data[line_ids_entry.offset + i]};
-                rows.push_back(line_id);
+                cluster->rows.push_back(line_id);
             }
 
-            this->m_cluster_pool.emplace_back(content, rows);
-            auto* cluster {&this->m_cluster_pool.back()};
+            auto token_count {static_cast<std::int64_t>(cluster->content.size())};
+            auto para_count {count_params(cluster->content)};
 
             auto [it, inserted] {log_bin.try_emplace(LogBinKey {token_count, para_count}, 1, cluster)};
             if (!inserted)
@@ -171,18 +176,73 @@ AELLogParser::LogBin AELLogParser::_get_log_bins(const shared_ptr<Relation>& rel
 
 std::vector<AELLogParser::LogCluster*> AELLogParser::_reconcile(LogBin& log_bin)
 {
+    // 各个桶互不相关，大桶优先交给线程池动态调度
+    std::vector<std::vector<LogCluster*>*> bins;
+    bins.reserve(log_bin.size());
+    for (auto&& [_, clusters] : log_bin)
+    {
+        bins.push_back(&clusters);
+    }
+    std::ranges::sort(bins, std::greater {}, [](const auto* clusters) { return clusters->size(); });
+
+    std::vector<std::vector<LogCluster*>> bin_results(bins.size());
+#pragma omp parallel for schedule(dynamic, 1)
+    for (std::size_t i = 0; i < bins.size(); ++i)
+    {
+        bin_results[i] = this->_reconcile_bin(*bins[i]);
+    }
+
     std::vector<LogCluster*> merged_clusters;
+    for (auto&& result : bin_results)
+    {
+        merged_clusters.insert(merged_clusters.end(), result.begin(), result.end());
+    }
 
-    // 对于每个桶中的日志簇，计算它们之间的差异，并将相似的簇合并
-    for (auto&& [_, clusters] : log_bin)
+    return merged_clusters;
+}
+
+std::vector<AELLogParser::LogCluster*> AELLogParser::_reconcile_bin(std::vector<LogCluster*>& clusters) const
+{
+    if (clusters.size() <= this->m_cluster_thr)
+    {
+        return clusters;
+    }
+
+    // 同一个桶内的日志簇 token 数相同且互不相同，_has_diff 等价于汉明距离 <= max_diff
+    auto length {clusters.front()->content.size()};
+    std::size_t max_diff {0};
+    while (max_diff < length &&
+           static_cast<float>(max_diff + 1) / static_cast<float>(length) <= this->m_merge_thr)
+    {
+        ++max_diff;
+    }
+
+    std::vector<std::vector<LogCluster*>> cluster_groups;
+    if (max_diff == length)
+    {
+        // 任意两个簇都满足合并条件，整个桶合并为一组
+        cluster_groups.push_back(clusters);
+    }
+    else
     {
-        if (clusters.size() <= this->m_cluster_thr)
+        // 鸽巢原理：把位置切成 max_diff + 1 段，汉明距离 <= max_diff 的两个簇至少有一段完全相同
+        // 因此只需要比较至少有一段签名相同的候选簇，签名冲突由 _has_diff 兜底校验
+        auto block_count {max_diff + 1};
+        auto block_begin {[&](std::size_t block) { return block * length / block_count; }};
+
+        std::vector<std::unordered_map<std::size_t, std::vector<std::uint32_t>>> block_index(block_count);
+        for (auto&& [idx, cluster] : std::views::enumerate(clusters))
         {
-            merged_clusters.insert(merged_clusters.end(), clusters.begin(), clusters.end());
-            continue;
+            for (auto&& block : std::views::iota(0UL, block_count))
+            {
+                auto signature {boost::hash_range(
+                    cluster->content.begin() + block_begin(block), cluster->content.begin() + block_begin(block + 1)
+                )};
+                block_index[block][signature].push_back(static_cast<std::uint32_t>(idx));
+            }
         }
 
-        std::vector<std::vector<LogCluster*>> cluster_groups;
+        std::vector<std::uint32_t> candidates;
         for (auto&& i : std::views::iota(0UL, clusters.size()))
         {
             auto* cluster1 {clusters[i]};
@@ -194,14 +254,29 @@ std::vector<AELLogParser::LogCluster*> AELLogParser::_reconcile(LogBin& log_bin)
             cluster1->merged = true;
             cluster_groups.emplace_back(1, cluster1);
 
-            for (auto&& j : std::views::iota(i + 1, clusters.size()))
+            candidates.clear();
+            for (auto&& block : std::views::iota(0UL, block_count))
             {
-                auto* cluster2 {clusters[j]};
-                if (cluster2->merged)
+                auto signature {boost::hash_range(
+                    cluster1->content.begin() + block_begin(block), cluster1->content.begin() + block_begin(block + 1)
+                )};
+                for (auto&& j : block_index[block].at(signature))
                 {
-                    continue;
+                    if (j > i && !clusters[j]->merged)
+                    {
+                        candidates.push_back(j);
+                    }
                 }
+            }
+
+            // 按原始顺序校验候选簇，与逐对比较的结果一致
+            std::ranges::sort(candidates);
+            auto [first, last] {std::ranges::unique(candidates)};
+            candidates.erase(first, last);
 
+            for (auto&& j : candidates)
+            {
+                auto* cluster2 {clusters[j]};
                 if (this->_has_diff(cluster1, cluster2))
                 {
                     cluster2->merged = true;
@@ -209,14 +284,16 @@ std::vector<AELLogParser::LogCluster*> AELLogParser::_reconcile(LogBin& log_bin)
                 }
             }
         }
+    }
 
-        for (auto&& group : cluster_groups)
-        {
-            auto* merged_cluster {
-                std::accumulate(group.begin() + 1, group.end(), group.front(), AELLogParser::_merge_log_cluster)
-            };
-            merged_clusters.push_back(merged_cluster);
-        }
+    std::vector<LogCluster*> merged_clusters;
+    merged_clusters.reserve(cluster_groups.size());
+    for (auto&& group : cluster_groups)
+    {
+        auto* merged_cluster {
+            std::accumulate(group.begin() + 1, group.end(), group.front(), AELLogParser::_merge_log_cluster)
+        };
+        merged_clusters.push_back(merged_cluster);
     }
 
     return merged_clusters;
@@ -252,9 +329,4 @@ AELLogParser::LogCluster* AELLogParser::_merge_log_cluster(LogCluster* cluster1,
     return cluster1;
 }
 
-std::string AELLogParser::LogCluster::get_template() const
-{
-    return this->content | std::views::join_with(' ') | std::ranges::to<std::string>();
-}
-
 }    // namespace logtt
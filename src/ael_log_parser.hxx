@@ -37,6 +37,8 @@ public:
     std::int32_t parse(
         const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
     ) override;
+    using BaseLogParser::match;
+    using BaseLogParser::m_build_token_index;
 
 private:
     struct LogCluster
@@ -44,9 +46,6 @@ private:
         TContent                  content;
         std::vector<std::int64_t> rows;
         bool                      merged {false};
-
-        [[nodiscard]]
-        std::string get_template() const;
     };
 
     struct LogBinKey
@@ -69,6 +68,7 @@ private:
 
     LogBin                   _get_log_bins(const shared_ptr<Relation>& rel);
     std::vector<LogCluster*> _reconcile(LogBin& log_bin);
+    std::vector<LogCluster*> _reconcile_bin(std::vector<LogCluster*>& clusters) const;
     bool                     _has_diff(const LogCluster* cluster1, const LogCluster* cluster2) const;
     static LogCluster*       _merge_log_cluster(LogCluster* cluster1, const LogCluster* cluster2);
 
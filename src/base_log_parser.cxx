@@ -1,8 +1,31 @@
 #include "base_log_parser.hxx"
+#include "duckdb_service.hxx"
+#include <boost/container_hash/hash.hpp>
+#include <format>
+#include <ranges>
+#include <unordered_map>
 
 namespace logtt
 {
 
+std::vector<std::uint32_t> UniqueContents::expand(const std::vector<std::uint32_t>& unique_template_ids) const
+{
+    std::vector<std::uint32_t> template_ids;
+    template_ids.reserve(this->row_contents.size());
+    for (auto&& i : this->row_contents)
+    {
+        template_ids.push_back(unique_template_ids[i]);
+    }
+    return template_ids;
+}
+
+void UniqueContents::clear()
+{
+    this->contents.clear();
+    this->counts.clear();
+    this->row_contents.clear();
+}
+
 BaseLogParser::BaseLogParser(
     std::string              log_regex,
     std::vector<std::string> named_fields,
@@ -16,4 +39,442 @@ BaseLogParser::BaseLogParser(
     m_masks {std::move(masks)}, m_delimiters {std::move(delimiters)}
 {}
 
+std::int32_t BaseLogParser::match(
+    const std::string& log_file,
+    const std::string& structured_table_name,
+    const std::string& templates_table_name,
+    const std::string& source_templates_table_name,
+    std::int64_t&      unmatched_count
+)
+{
+    auto matcher {TemplateMatcher::from_table(get_connection(), source_templates_table_name, this->m_token_dict)};
+    if (!matcher)
+    {
+        return -1;
+    }
+
+    return this->_match(
+        log_file, structured_table_name, templates_table_name, matcher.value(), false, unmatched_count
+    );
+}
+
+void BaseLogParser::_read_content(const Vector& tokens_col, idx_t row, TContent& content)
+{
+    const auto& tokens_child {ListVector::GetEntry(tokens_col)};
+
+    const auto* const tokens_data {FlatVector::GetData<list_entry_t>(tokens_col)};
+    const auto* const tokens_child_data {FlatVector::GetData<string_t>(tokens_child)};
+
+    const auto& entry {tokens_data[row]};
+    content.clear();
+    content.reserve(entry.length);
+    for (auto&& i : std::views::iota(0UL, entry.length))
+    {
+        const auto& token {tokens_child_data[entry.offset + i]};
+        content.push_back(this->m_token_dict.intern(std::string_view {token.GetData(), token.GetSize()}));
+    }
+}
+
+std::int64_t BaseLogParser::_stream_to_table(
+    Connection&                 conn,
+    const shared_ptr<Relation>& rel,
+    std::int64_t                line_offset,
+    const std::string&          structured_table_name,
+    const std::string&          templates_table_name,
+    const BatchLabeler&         label
+)
+{
+    // 结构化表的列为 rel 中除 Tokens 外的全部列，末尾加上 TemplateID
+    idx_t                    tokens_col_idx {0};
+    idx_t                    line_id_col_idx {0};
+    idx_t                    content_col_idx {0};
+    std::vector<idx_t>       column_ids;
+    vector<LogicalType>      column_types;
+    std::vector<std::string> column_defs;
+    for (auto&& [i, column] : std::views::enumerate(rel->Columns()))
+    {
+        if (column.Name() == "Tokens")
+        {
+            tokens_col_idx = static_cast<idx_t>(i);
+            continue;
+        }
+        if (column.Name() == "LineID")
+        {
+            line_id_col_idx = static_cast<idx_t>(i);
+        }
+        if (column.Name() == "Content")
+        {
+            content_col_idx = static_cast<idx_t>(i);
+        }
+        column_ids.push_back(static_cast<idx_t>(i));
+        column_types.push_back(column.Type());
+        column_defs.push_back(std::format(R"("{}" {})", column.Name(), column.Type().ToString()));
+    }
+    column_types.push_back(LogicalType::UINTEGER);
+    column_defs.push_back("TemplateID UINTEGER");
+
+    // 从头解析时重建两张表，增量解析时追加到已有的表
+    if (line_offset == 0)
+    {
+        conn.Query(std::format("DROP TABLE IF EXISTS {}", templates_table_name));
+    }
+    conn.Query(
+        std::format(
+            "CREATE {} {} ({})",
+            line_offset == 0 ? "OR REPLACE TABLE" : "TABLE IF NOT EXISTS",
+            structured_table_name,
+            column_defs | std::views::join_with(std::string_view {", "}) | std::ranges::to<std::string>()
+        )
+    );
+
+    // 流式结果占用着 conn，结构化表和倒排索引通过另一个连接追加写入
+    Connection append_conn {*conn.context->db};
+
+    // 倒排索引表要在开始流式读取之前建好；不建索引时删除已有的索引，否则它会缺少这次写入的行
+    std::optional<TokenIndexWriter> index_writer;
+    if (this->m_build_token_index)
+    {
+        index_writer = TokenIndexWriter::open(conn, append_conn, structured_table_name, line_offset);
+    }
+    else
+    {
+        conn.Query(std::format("DROP TABLE IF EXISTS {}", token_index_table_name(structured_table_name)));
+    }
+
+    rel->CreateView("_stream", true, true);
+    auto result {conn.SendQuery("SELECT * FROM _stream")};
+    if (result->HasError())
+    {
+        return -1;
+    }
+
+    Appender appender {append_conn, structured_table_name};
+
+    std::vector<unique_ptr<DataChunk>>                                 chunks;
+    UniqueContents                                                     batch;
+    std::unordered_map<TContent, std::uint32_t, boost::hash<TContent>> content_ids;
+    TContent                                                           content;
+    std::int64_t                                                       row_count {0};
+
+    // 给当前批打标签，再把整批写入结构化表
+    auto flush_batch {
+        [&]() -> void
+        {
+            auto template_ids {batch.expand(label(batch))};
+
+            DataChunk out_chunk;
+            out_chunk.InitializeEmpty(column_types);
+
+            std::size_t offset {0};
+            for (auto&& chunk : chunks)
+            {
+                for (auto&& [i, column_id] : std::views::enumerate(column_ids))
+                {
+                    out_chunk.data[i].Reference(chunk->data[column_id]);
+                }
+
+                // 匹配模式下未匹配到模板的行写入 NULL
+                Vector template_id_col {LogicalType::UINTEGER, chunk->size()};
+                auto*  template_id_data {FlatVector::GetData<std::uint32_t>(template_id_col)};
+                auto&  template_id_validity {FlatVector::Validity(template_id_col)};
+                for (auto&& row : std::views::iota(0UL, chunk->size()))
+                {
+                    auto template_id {template_ids[offset + row]};
+                    if (template_id == NO_TEMPLATE_ID)
+                    {
+                        template_id_validity.SetInvalid(row);
+                    }
+                    else
+                    {
+                        template_id_data[row] = template_id;
+                    }
+                }
+                out_chunk.data.back().Reference(template_id_col);
+                out_chunk.SetCardinality(*chunk);
+
+                appender.AppendDataChunk(out_chunk);
+                offset += chunk->size();
+            }
+            if (index_writer)
+            {
+                index_writer->flush();
+            }
+
+            chunks.clear();
+            batch.clear();
+            content_ids.clear();
+        }
+    };
+
+    try
+    {
+        while (auto chunk {result->Fetch()})
+        {
+            chunk->Flatten();
+            const auto& tokens_col {chunk->data[tokens_col_idx]};
+            const auto* line_id_data {FlatVector::GetData<std::int64_t>(chunk->data[line_id_col_idx])};
+            const auto* content_data {FlatVector::GetData<string_t>(chunk->data[content_col_idx])};
+            const auto& content_validity {FlatVector::Validity(chunk->data[content_col_idx])};
+
+            // 批内相同的 token 列表只保留一份
+            for (auto&& row : std::views::iota(0UL, chunk->size()))
+            {
+                this->_read_content(tokens_col, row, content);
+                if (index_writer && content_validity.RowIsValid(row))
+                {
+                    index_writer->add(
+                        line_id_data[row], std::string_view {content_data[row].GetData(), content_data[row].GetSize()}
+                    );
+                }
+                auto [it, inserted] {
+                    content_ids.try_emplace(content, static_cast<std::uint32_t>(batch.contents.size()))
+                };
+                if (inserted)
+                {
+                    batch.contents.push_back(content);
+                    batch.counts.push_back(0);
+                }
+                ++batch.counts[it->second];
+                batch.row_contents.push_back(it->second);
+            }
+
+            row_count += static_cast<std::int64_t>(chunk->size());
+            chunks.push_back(std::move(chunk));
+            if (batch.row_contents.size() >= STREAM_BATCH_ROWS)
+            {
+                flush_batch();
+            }
+        }
+
+        if (result->HasError())
+        {
+            return -1;
+        }
+        if (!chunks.empty())
+        {
+            flush_batch();
+        }
+        appender.Close();
+        if (index_writer)
+        {
+            index_writer->close();
+        }
+
+        write_value_summaries(conn, structured_table_name, line_offset);
+    }
+    catch (const Exception& e)
+    {
+        return -1;
+    }
+
+    return row_count;
+}
+
+bool BaseLogParser::_write_token_index(
+    Connection& conn, const shared_ptr<Relation>& rel, const std::string& structured_table_name
+)
+{
+    if (!this->m_build_token_index)
+    {
+        conn.Query(std::format("DROP TABLE IF EXISTS {}", token_index_table_name(structured_table_name)));
+        return true;
+    }
+
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(make_uniq<ColumnRefExpression>("LineID"));
+    project_exprs.push_back(make_uniq<ColumnRefExpression>("Content"));
+
+    try
+    {
+        // 流式结果占用着 conn，倒排索引通过另一个连接追加写入
+        Connection append_conn {*conn.context->db};
+        auto       index_writer {TokenIndexWriter::open(conn, append_conn, structured_table_name, 0)};
+        if (!index_writer)
+        {
+            return false;
+        }
+
+        rel->Project(std::move(project_exprs), {})->CreateView("_token_index", true, true);
+        auto result {conn.SendQuery("SELECT * FROM _token_index")};
+        if (result->HasError())
+        {
+            return false;
+        }
+
+        // 与 _stream_to_table 一样，每 STREAM_BATCH_ROWS 行写出一批 posting 块
+        std::size_t batch_rows {0};
+        while (auto chunk {result->Fetch()})
+        {
+            chunk->Flatten();
+            const auto* line_id_data {FlatVector::GetData<std::int64_t>(chunk->data[0])};
+            const auto* content_data {FlatVector::GetData<string_t>(chunk->data[1])};
+            const auto& content_validity {FlatVector::Validity(chunk->data[1])};
+            for (auto&& row : std::views::iota(0UL, chunk->size()))
+            {
+                if (content_validity.RowIsValid(row))
+                {
+                    index_writer->add(
+                        line_id_data[row], std::string_view {content_data[row].GetData(), content_data[row].GetSize()}
+                    );
+                }
+            }
+
+            batch_rows += chunk->size();
+            if (batch_rows >= STREAM_BATCH_ROWS)
+            {
+                index_writer->flush();
+                batch_rows = 0;
+            }
+        }
+
+        if (result->HasError())
+        {
+            return false;
+        }
+        index_writer->flush();
+        index_writer->close();
+    }
+    catch (const Exception& e)
+    {
+        return false;
+    }
+
+    return true;
+}
+
+const std::string&
+BaseLogParser::_get_template(const TContent& content, std::optional<std::string>& log_template) const
+{
+    if (!log_template)
+    {
+        log_template = this->m_token_dict.to_string(content);
+    }
+    return *log_template;
+}
+
+std::int32_t BaseLogParser::_match(
+    const std::string&     log_file,
+    const std::string&     structured_table_name,
+    const std::string&     templates_table_name,
+    const TemplateMatcher& matcher,
+    bool                   learn_unmatched,
+    std::int64_t&          unmatched_count
+)
+{
+    // 获取数据库连接
+    auto& conn {get_connection()};
+
+    auto rel {load_data(
+        conn, log_file, this->m_log_regex, this->m_named_fields, this->m_timestamp_fields, this->m_timestamp_format
+    )};
+    rel = mask_log_rel(conn, rel, this->m_masks);
+    rel = split_log_rel(conn, rel, this->m_delimiters);
+
+    // 移除多余列
+    auto star_expr {make_uniq<StarExpression>()};
+    star_expr->exclude_list.emplace("MaskedContent");
+
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(std::move(star_expr));
+
+    rel = rel->Project(std::move(project_exprs), {});
+
+    // 模板表中的 Count 为本次匹配到的行数
+    std::unordered_map<std::uint32_t, std::int64_t> counts;
+    unmatched_count = 0;
+
+    // 相同的内容在批内只匹配一次，结果再展开到每一行
+    auto label {
+        [&](const UniqueContents& batch) -> std::vector<std::uint32_t>
+        {
+            auto unique_length {batch.contents.size()};
+
+            // 匹配器只读，各内容之间没有依赖
+            std::vector<std::uint32_t> unique_template_ids(unique_length);
+#pragma omp parallel for schedule(dynamic, 1024)
+            for (std::size_t i = 0; i < unique_length; ++i)
+            {
+                unique_template_ids[i] = matcher.match(batch.contents[i]);
+            }
+
+            std::vector<std::size_t> unmatched;
+            for (auto&& [i, template_id] : std::views::enumerate(unique_template_ids))
+            {
+                if (template_id == NO_TEMPLATE_ID)
+                {
+                    unmatched.push_back(static_cast<std::size_t>(i));
+                    unmatched_count += batch.counts[i];
+                }
+            }
+
+            if (learn_unmatched && !unmatched.empty())
+            {
+                std::vector<TContent>     unmatched_contents;
+                std::vector<std::int64_t> unmatched_counts;
+                unmatched_contents.reserve(unmatched.size());
+                unmatched_counts.reserve(unmatched.size());
+                for (auto&& i : unmatched)
+                {
+                    unmatched_contents.push_back(batch.contents[i]);
+                    unmatched_counts.push_back(batch.counts[i]);
+                }
+
+                for (auto&& [i, template_id] :
+                     std::views::zip(unmatched, this->_learn(unmatched_contents, unmatched_counts)))
+                {
+                    unique_template_ids[i] = template_id;
+                }
+            }
+
+            for (auto&& [i, template_id] : std::views::enumerate(unique_template_ids))
+            {
+                if (template_id != NO_TEMPLATE_ID)
+                {
+                    counts[template_id] += batch.counts[i];
+                }
+            }
+            return unique_template_ids;
+        }
+    };
+
+    auto log_length {this->_stream_to_table(conn, rel, 0, structured_table_name, templates_table_name, label)};
+    if (log_length < 0)
+    {
+        return -1;
+    }
+
+    std::vector<TemplateRecord> templates;
+    if (learn_unmatched)
+    {
+        templates = this->_learned_templates();
+    }
+    else
+    {
+        templates.reserve(matcher.templates().size());
+        for (auto&& [template_id, log_template] : matcher.templates())
+        {
+            templates.emplace_back(template_id, log_template, 0);
+        }
+    }
+    for (auto&& record : templates)
+    {
+        auto it {counts.find(record.id)};
+        record.count = it != counts.end() ? it->second : 0;
+    }
+
+    write_templates(conn, templates, templates_table_name);
+    return static_cast<std::int32_t>(log_length);
+}
+
+std::vector<std::uint32_t>
+BaseLogParser::_learn(const std::vector<TContent>& contents, [[maybe_unused]] const std::vector<std::int64_t>& counts)
+{
+    return std::vector<std::uint32_t>(contents.size(), NO_TEMPLATE_ID);
+}
+
+std::vector<TemplateRecord> BaseLogParser::_learned_templates()
+{
+    return {};
+}
+
 }    // namespace logtt
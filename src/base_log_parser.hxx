@@ -1,14 +1,38 @@
 #pragma once
 
 #include "precomp.hxx"
+#include "template_matcher.hxx"
+#include "token_dict.hxx"
+#include "token_index.hxx"
+#include "utils.hxx"
 #include <cstdint>
+#include <functional>
+#include <optional>
+#include <string>
+#include <vector>
 
 namespace logtt
 {
 
+// 一批日志按 Tokens 去重后的结果：相同的 token 列表只保留一份，按批内首次出现的顺序排列
+struct UniqueContents
+{
+    std::vector<TContent>      contents;
+    // 每个内容在批内出现的行数
+    std::vector<std::int64_t>  counts;
+    // 批内每一行对应的内容下标
+    std::vector<std::uint32_t> row_contents;
+
+    // 把每个内容的 TemplateID 展开到批内的每一行
+    [[nodiscard]]
+    std::vector<std::uint32_t> expand(const std::vector<std::uint32_t>& unique_template_ids) const;
+    void                       clear();
+};
+
 class BaseLogParser
 {
 public:
+
     BaseLogParser() = default;
     BaseLogParser(
         std::string              log_regex,
@@ -19,11 +43,27 @@ public:
         std::vector<char>        delimiters
     );
 
+    BaseLogParser(const BaseLogParser&)            = delete;
+    BaseLogParser& operator=(const BaseLogParser&) = delete;
+
+    BaseLogParser(BaseLogParser&&) noexcept            = default;
+    BaseLogParser& operator=(BaseLogParser&&) noexcept = default;
+
     // 返回解析的日志条数
     virtual std::int32_t parse(
         const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
     ) = 0;
 
+    // 匹配模式：把日志逐行匹配到 source_templates_table_name 中已有的模板上，不会新增或修改任何模板
+    // 匹配不到的行 TemplateID 为 NULL，行数写入 unmatched_count；返回解析的日志条数，模板表不存在时返回 -1
+    std::int32_t match(
+        const std::string& log_file,
+        const std::string& structured_table_name,
+        const std::string& templates_table_name,
+        const std::string& source_templates_table_name,
+        std::int64_t&      unmatched_count
+    );
+
     virtual ~BaseLogParser() = default;
 
     std::string              m_log_regex;
@@ -32,6 +72,57 @@ public:
     std::string              m_timestamp_format;
     std::vector<Mask>        m_masks;
     std::vector<char>        m_delimiters;
+    TokenDict                m_token_dict;
+    // 解析时是否同时建立 token 倒排索引，见 token_index.hxx
+    bool m_build_token_index {false};
+
+protected:
+    // 流式解析时每批的行数
+    static constexpr std::size_t STREAM_BATCH_ROWS {1 << 18};
+
+    // 给一批去重后的日志打标签，返回每个内容的 TemplateID
+    using BatchLabeler = std::function<std::vector<std::uint32_t>(const UniqueContents&)>;
+
+    // 把 Tokens 列第 row 行的 token 转成 ID 写入 content（会先清空 content，保留其容量）
+    // token 以 string_view 直接引用 DuckDB 向量中的字符串，只有首次出现的 token 会被拷贝进字典
+    void _read_content(const Vector& tokens_col, idx_t row, TContent& content);
+    // 以流式结果逐块读取 rel（必须包含 Tokens 列），每攒够 STREAM_BATCH_ROWS 行就在批内去重后交给 label，
+    // 得到每个内容的 TemplateID，再连同除 Tokens 外的全部列追加写入结构化表，内存占用只与批大小有关
+    // m_build_token_index 为真时每批的 posting 也一起写入倒排索引
+    // line_offset 为 0 时重建结构化表并删除旧的模板表；返回处理的日志条数，读取出错时返回 -1
+    std::int64_t _stream_to_table(
+        Connection&                 conn,
+        const shared_ptr<Relation>& rel,
+        std::int64_t                line_offset,
+        const std::string&          structured_table_name,
+        const std::string&          templates_table_name,
+        const BatchLabeler&         label
+    );
+    // 为不经过 _stream_to_table 写入结构化表的解析器从头建立倒排索引，rel 必须包含 LineID 和 Content 列
+    // m_build_token_index 为假时删除已有的索引；读取出错时返回 false
+    bool
+        _write_token_index(Connection& conn, const shared_ptr<Relation>& rel, const std::string& structured_table_name);
+    // 返回 content 对应的模板字符串，结果缓存在 log_template 中，只有缓存为空时才重新拼接
+    // 模板内容变化后需要把 log_template 置空
+    const std::string& _get_template(const TContent& content, std::optional<std::string>& log_template) const;
+
+    // 用 matcher 给日志逐行打标签，各行的匹配互不依赖，在多个线程上并行进行
+    // learn_unmatched 为真时，每批中未匹配的行按行号顺序交给 _learn 学习，模板表改为写入 _learned_templates 的结果
+    std::int32_t _match(
+        const std::string&     log_file,
+        const std::string&     structured_table_name,
+        const std::string&     templates_table_name,
+        const TemplateMatcher& matcher,
+        bool                   learn_unmatched,
+        std::int64_t&          unmatched_count
+    );
+    // 学习一批去重后的日志，counts[i] 为 contents[i] 出现的行数，返回每个内容的 TemplateID
+    // 会按日志顺序分批多次调用，学习状态在批之间保留
+    // 默认不学习，全部返回 NO_TEMPLATE_ID
+    virtual std::vector<std::uint32_t>
+        _learn(const std::vector<TContent>& contents, const std::vector<std::int64_t>& counts);
+    // 学习到的全部模板，默认为空
+    virtual std::vector<TemplateRecord> _learned_templates();
 };
 
 }    // namespace logtt
@@ -3,7 +3,6 @@
 #include "utils.hxx"
 #include <algorithm>
 #include <ranges>
-#include <string_view>
 #include <unordered_map>
 #include <unordered_set>
 
@@ -71,15 +70,19 @@ std::int32_t BrainLogParser::parse(
     const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
 )
 {
-    std::vector<std::string> templates;
+    // 初始化 token 字典
+    this->m_token_dict.clear();
+    std::vector<std::string>    log_templates;
+    std::vector<TemplateRecord> templates;
+    std::vector<std::uint32_t>  template_ids;
     // 获取数据库连接
     auto& conn {get_connection()};
 
     auto rel {load_data(
         conn, log_file, this->m_log_regex, this->m_named_fields, this->m_timestamp_fields, this->m_timestamp_format
     )};
-    rel = mask_log_rel(rel, this->m_masks);
-    rel = split_log_rel(rel, this->m_delimiters);
+    rel = mask_log_rel(conn, rel, this->m_masks);
+    rel = split_log_rel(conn, rel, this->m_delimiters);
 
     // 缓存分词结果，避免重复计算
     auto star_expr_1 {make_uniq<StarExpression>()};
@@ -90,12 +93,12 @@ std::int32_t BrainLogParser::parse(
 
     rel = rel->Project(std::move(project_exprs_1), {});
 
-    auto ret {get_tmp(conn, rel)};
-    if (!ret)
+    auto scratch {ScratchTable::create(conn, rel)};
+    if (!scratch)
     {
         return -1;
     }
-    rel = ret.value();
+    rel = scratch->relation();
 
     // 从 DuckDB 读取所有分词结果
     ParsedExprVec project_exprs_2;
@@ -107,22 +110,9 @@ std::int32_t BrainLogParser::parse(
     contents.reserve(log_length);
     for (auto&& data_chunk : result->Collection().Chunks())
     {
-        const auto& tokens_col {data_chunk.data[0]};
-        const auto& tokens_child {ListVector::GetEntry(tokens_col)};
-
-        const auto* const tokens_data {FlatVector::GetData<list_entry_t>(tokens_col)};
-        const auto* const tokens_child_data {FlatVector::GetData<string_t>(tokens_child)};
-
         for (auto&& row : std::views::iota(0UL, data_chunk.size()))
         {
-            TContent    content;
-            const auto& entry {tokens_data[row]};
-            for (auto&& i : std::views::iota(0UL, entry.length))
-            {
-                const auto& token {tokens_child_data[entry.offset + i]};
-                content.emplace_back(token.GetString());
-            }
-            contents.push_back(std::move(content));
+            this->_read_content(data_chunk.data[0], row, contents.emplace_back());
         }
     }
 
@@ -130,27 +120,58 @@ std::int32_t BrainLogParser::parse(
     auto fcontents_group {BrainLogParser::_get_fcontents_group(contents)};
     auto fcounters_group {BrainLogParser::_get_fcounters_group(fcontents_group)};
 
-    // 通过 key 显式对齐两个 group
+    // 通过 key 显式对齐两个 group，各长度组互不依赖，交给线程池动态调度
+    // 大组优先调度，避免最大的组最后才开始而让其他线程空等
+    std::vector<std::pair<std::vector<FContent>*, std::vector<FCounter>*>> groups;
+    groups.reserve(fcontents_group.size());
     for (auto&& [length, fcontents] : fcontents_group)
     {
-        auto root_rows {BrainLogParser::_find_root(fcounters_group[length], 0.5F)};
+        groups.emplace_back(&fcontents, &fcounters_group.at(length));
+    }
+    std::ranges::sort(groups, std::greater {}, [](const auto& group) { return group.first->size(); });
 
-        BrainLogParser::_up_split(root_rows, fcontents);
-        BrainLogParser::_down_split(root_rows, fcontents, this->m_var_thr);
+#pragma omp parallel for schedule(dynamic, 1)
+    for (std::size_t i = 0; i < groups.size(); ++i)
+    {
+        auto& [fcontents, fcounters] {groups[i]};
+        auto root_rows {BrainLogParser::_find_root(*fcounters, 0.5F)};
+
+        BrainLogParser::_up_split(root_rows, *fcontents);
+        BrainLogParser::_down_split(root_rows, *fcontents, this->m_var_thr);
     }
 
-    // 输出结果：将每行的 FToken 拼接成模板字符串
-    templates.resize(log_length);
+    // 输出结果：相同的 FToken 序列共用一个 TemplateID，模板字符串只在首次出现时拼接
+    std::unordered_map<TContent, std::uint32_t, boost::hash<TContent>> content_ids;
+    std::vector<std::int64_t>                                         counts;
+    template_ids.resize(log_length);
     for (auto&& [_, fcontents] : fcontents_group)
     {
         for (auto&& fcontent : fcontents)
         {
+            auto content {fcontent | std::views::transform(&FToken::token) | std::ranges::to<TContent>()};
+            auto [it, inserted] {content_ids.try_emplace(content, static_cast<std::uint32_t>(log_templates.size()))};
+            if (inserted)
+            {
+                log_templates.push_back(this->m_token_dict.to_string(content));
+                counts.push_back(0);
+            }
+            ++counts[it->second];
             // fcontent[0].row 是该行在原始日志中的行号（从 0 开始）
-            templates[fcontent[0].row] = fcontent | std::views::transform(&FToken::token) | std::views::join_with(' ') |
-                                         std::ranges::to<std::string>();
+            template_ids[fcontent[0].row] = it->second;
         }
     }
 
+    templates.reserve(log_templates.size());
+    for (auto&& [template_id, log_template] : std::views::enumerate(log_templates))
+    {
+        templates.emplace_back(static_cast<std::uint32_t>(template_id), log_template, counts[template_id]);
+    }
+
+    if (!this->_write_token_index(conn, rel, structured_table_name))
+    {
+        return -1;
+    }
+
     // 移除多余列
     auto star_expr_2 {make_uniq<StarExpression>()};
     star_expr_2->exclude_list.emplace("Tokens");
@@ -160,7 +181,7 @@ std::int32_t BrainLogParser::parse(
 
     rel = rel->Project(std::move(project_exprs_3), {});
 
-    to_table(conn, rel, templates, structured_table_name, templates_table_name);
+    to_table(conn, rel, template_ids, 0, std::move(templates), structured_table_name, templates_table_name);
     return static_cast<std::int32_t>(log_length);
 }
 
@@ -182,27 +203,34 @@ BrainLogParser::FContentsGroup BrainLogParser::_get_fcontents_group(const std::v
     }
 
     // 统计同组内每列每个 token 的出现次数，写回 freq
+    // 每个 (组, 列) 只读写各自那一列的 FToken，互不冲突，展开后并行计数
+    std::vector<std::pair<std::vector<FContent>*, std::uint16_t>> columns;
     for (auto&& [length, fcontents] : fcontents_group)
     {
-        auto num_cols {length};
-        auto num_rows {fcontents.size()};
-
-        // 逐列遍历所有行，用 unordered_map<string_view, uint32_t> 计数
-        for (auto&& col : std::views::iota(0U, num_cols))
+        for (auto&& col : std::views::iota(std::uint16_t {0}, length))
         {
-            std::unordered_map<std::string_view, std::uint32_t> col_counter;
-            col_counter.reserve(num_rows);
+            columns.emplace_back(&fcontents, col);
+        }
+    }
 
-            for (auto&& fcontent : fcontents)
-            {
-                ++col_counter[fcontent[col].token];
-            }
+#pragma omp parallel for schedule(dynamic)
+    for (std::size_t i = 0; i < columns.size(); ++i)
+    {
+        auto& [fcontents, col] {columns[i]};
 
-            // 将频率写回每个 FToken
-            for (auto&& fcontent : fcontents)
-            {
-                fcontent[col].freq = col_counter[fcontent[col].token];
-            }
+        // 逐行遍历该列，用 unordered_map<Token, uint32_t> 计数
+        std::unordered_map<Token, std::uint32_t> col_counter;
+        col_counter.reserve(fcontents->size());
+
+        for (auto&& fcontent : *fcontents)
+        {
+            ++col_counter[fcontent[col].token];
+        }
+
+        // 将频率写回每个 FToken
+        for (auto&& fcontent : *fcontents)
+        {
+            fcontent[col].freq = col_counter[fcontent[col].token];
         }
     }
 
@@ -213,13 +241,22 @@ BrainLogParser::FCountersGroup BrainLogParser::_get_fcounters_group(const FConte
 {
     FCountersGroup fcounters_group;
 
+    // 先在单线程中建好所有组，之后各组只写自己的 vector
+    std::vector<std::pair<const std::vector<FContent>*, std::vector<FCounter>*>> groups;
+    groups.reserve(fcontents_group.size());
     for (auto&& [length, fcontents] : fcontents_group)
     {
-        auto& fcounters {fcounters_group[length]};
-        fcounters.reserve(fcontents.size());
-        for (auto&& fcontent : fcontents)
+        groups.emplace_back(&fcontents, &fcounters_group[length]);
+    }
+
+#pragma omp parallel for schedule(dynamic, 1)
+    for (std::size_t i = 0; i < groups.size(); ++i)
+    {
+        auto& [fcontents, fcounters] {groups[i]};
+        fcounters->reserve(fcontents->size());
+        for (auto&& fcontent : *fcontents)
         {
-            fcounters.emplace_back(fcontent);
+            fcounters->emplace_back(fcontent);
         }
     }
 
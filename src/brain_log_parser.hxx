@@ -34,6 +34,8 @@ public:
     std::int32_t parse(
         const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
     ) override;
+    using BaseLogParser::match;
+    using BaseLogParser::m_build_token_index;
 
     virtual ~BrainLogParser() = default;
 
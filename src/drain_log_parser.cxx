@@ -1,6 +1,7 @@
 #include "drain_log_parser.hxx"
 #include "duckdb_service.hxx"
 #include "utils.hxx"
+#include <algorithm>
 #include <ranges>
 
 namespace logtt
@@ -32,130 +33,274 @@ std::int32_t DrainLogParser::parse(
     const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
 )
 {
-    // 初始化前缀树和日志簇池
+    // 初始化前缀树、分片和 token 字典
     this->m_root = std::make_unique<Node>();
-    this->m_cluster_pool.clear();
-    std::vector<LogCluster*> cluster_results;
-    std::vector<std::string> templates;
+    this->m_shards.clear();
+    this->m_token_dict.clear();
+    this->m_template_count = 0;
+
+    return this->parse_incremental(log_file, structured_table_name, templates_table_name, 0);
+}
+
+std::int32_t DrainLogParser::parse_incremental(
+    const std::string& log_file,
+    const std::string& structured_table_name,
+    const std::string& templates_table_name,
+    std::int64_t       line_offset
+)
+{
     // 获取数据库连接
     auto& conn {get_connection()};
 
     auto rel {load_data(
-        conn, log_file, this->m_log_regex, this->m_named_fields, this->m_timestamp_fields, this->m_timestamp_format
+        conn,
+        log_file,
+        this->m_log_regex,
+        this->m_named_fields,
+        this->m_timestamp_fields,
+        this->m_timestamp_format,
+        line_offset,
+        true
     )};
-    rel = mask_log_rel(rel, this->m_masks);
-    rel = split_log_rel(rel, this->m_delimiters);
+    rel = mask_log_rel(conn, rel, this->m_masks);
+    rel = split_log_rel(conn, rel, this->m_delimiters);
 
-    // 缓存分词结果，避免重复计算
-    auto star_expr_1 {make_uniq<StarExpression>()};
-    star_expr_1->exclude_list.emplace("MaskedContent");
+    // 移除多余列
+    auto star_expr {make_uniq<StarExpression>()};
+    star_expr->exclude_list.emplace("MaskedContent");
+
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(std::move(star_expr));
+
+    rel = rel->Project(std::move(project_exprs), {});
+
+    // 边读取边聚类，相同的内容在批内只聚类一次，结果再展开到每一行
+    auto log_length {this->_stream_to_table(
+        conn,
+        rel,
+        line_offset,
+        structured_table_name,
+        templates_table_name,
+        [this](const UniqueContents& batch) -> std::vector<std::uint32_t>
+        {
+            return this->_learn(batch.contents, batch.counts);
+        }
+    )};
+    if (log_length < 0)
+    {
+        return -1;
+    }
+
+    write_templates(conn, this->_learned_templates(), templates_table_name);
+    return static_cast<std::int32_t>(log_length);
+}
+
+std::int32_t DrainLogParser::match_learned(
+    const std::string& log_file,
+    const std::string& structured_table_name,
+    const std::string& templates_table_name,
+    bool               learn_unmatched,
+    std::int64_t&      unmatched_count
+)
+{
+    auto matcher {this->_compile_matcher()};
+    return this->_match(
+        log_file, structured_table_name, templates_table_name, matcher, learn_unmatched, unmatched_count
+    );
+}
+
+bool DrainLogParser::save_snapshot(const std::string& snapshot_file) const
+{
+    SnapshotWriter writer {SnapshotKind::DRAIN};
 
-    ParsedExprVec project_exprs_1;
-    project_exprs_1.push_back(std::move(star_expr_1));
+    // 前缀树的形状取决于这些参数，加载时一并恢复
+    writer.write(this->m_depth);
+    writer.write(this->m_children);
+    writer.write(this->m_sim_thr);
+    this->m_token_dict.save(writer);
+    writer.write(this->m_template_count);
 
-    rel = rel->Project(std::move(project_exprs_1), {});
+    save_prefix_tree(writer, this->m_root.get(), this->m_shards);
 
-    auto ret {get_tmp(conn, rel)};
-    if (!ret)
+    return writer.save(snapshot_file);
+}
+
+bool DrainLogParser::load_snapshot(const std::string& snapshot_file)
+{
+    SnapshotReader reader {snapshot_file, SnapshotKind::DRAIN};
+
+    // 先恢复到局部变量中，全部读取成功后再替换当前状态
+    std::uint16_t          depth {0};
+    std::uint16_t          children {0};
+    float                  sim_thr {0.0F};
+    TokenDict              token_dict;
+    std::uint32_t          template_count {0};
+    std::unique_ptr<Node>  root;
+    ShardDeque<LogCluster> shards;
+    if (!reader.read(depth) || !reader.read(children) || !reader.read(sim_thr) || !token_dict.load(reader) ||
+        !reader.read(template_count) || !load_prefix_tree(reader, token_dict, root, shards))
     {
-        return -1;
+        return false;
     }
-    rel = ret.value();
 
-    ParsedExprVec project_exprs_2;
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("Tokens"));
+    this->m_depth          = depth;
+    this->m_children       = children;
+    this->m_sim_thr        = sim_thr;
+    this->m_token_dict     = std::move(token_dict);
+    this->m_template_count = template_count;
+    this->m_root           = std::move(root);
+    this->m_shards         = std::move(shards);
+    return true;
+}
 
-    auto result {to_m_result(rel->Project(std::move(project_exprs_2), {})->Execute())};
-    auto log_length {result->RowCount()};
-    for (auto&& data_chunk : result->Collection().Chunks())
+std::vector<std::uint32_t>
+DrainLogParser::_learn(const std::vector<TContent>& contents, const std::vector<std::int64_t>& counts)
+{
+    // 沿用已经学习到的前缀树和日志簇，尚未解析过时先初始化
+    if (!this->m_root)
     {
-        const auto& tokens_col {data_chunk.data[0]};
-        const auto& tokens_child {ListVector::GetEntry(tokens_col)};
+        this->m_root = std::make_unique<Node>();
+    }
 
-        const auto* const tokens_data {FlatVector::GetData<list_entry_t>(tokens_col)};
-        const auto* const tokens_child_data {FlatVector::GetData<string_t>(tokens_child)};
+    // 按长度分片后，每个分片独占一棵长度子树，可以在各自的线程上匹配
+    this->_build_shards(contents);
 
-        for (auto&& row : std::views::iota(0UL, data_chunk.size()))
+    return learn_by_shard(
+        this->m_shards,
+        contents.size(),
+        this->m_template_count,
+        [this, &contents, &counts](std::uint32_t row, Shard& shard) -> LogCluster*
         {
-            TContent    content;
-            const auto& entry {tokens_data[row]};
-            for (auto&& i : std::views::iota(0UL, entry.length))
-            {
-                const auto& token {tokens_child_data[entry.offset + i]};
-                content.emplace_back(token.GetString());
-            }
-            cluster_results.push_back(this->_add_content(content));
+            return this->_add_content(contents[row], counts[row], shard);
         }
-    }
+    );
+}
+
+std::vector<TemplateRecord> DrainLogParser::_learned_templates()
+{
+    return collect_templates(
+        this->m_shards,
+        [this](LogCluster& cluster) -> const std::string&
+        {
+            return this->_get_template(cluster.content, cluster.log_template);
+        }
+    );
+}
+
+TemplateMatcher DrainLogParser::_compile_matcher()
+{
+    return compile_matcher(
+        this->m_shards,
+        this->m_template_count,
+        [this](LogCluster& cluster) -> const std::string&
+        {
+            return this->_get_template(cluster.content, cluster.log_template);
+        }
+    );
+}
+
+void DrainLogParser::_build_shards(const std::vector<TContent>& contents)
+{
+    // 分片和日志簇在多次增量解析之间保留，这里只重新分配本次要处理的行
+    ShardLookup get_shard {this->m_shards};
 
-    templates.reserve(log_length);
-    for (auto&& cluster : cluster_results)
+    // 深度为 1 时所有日志簇都挂在根节点上，只能整体作为一个分片
+    if (this->m_depth == 1)
     {
-        templates.push_back(cluster->get_template());
+        auto& shard {this->m_shards[get_shard(this->m_root.get(), 0)]};
+        shard.rows = std::views::iota(0U, static_cast<std::uint32_t>(contents.size())) | std::ranges::to<std::vector>();
+        return;
     }
 
-    // 移除多余列
-    auto star_expr_2 {make_uniq<StarExpression>()};
-    star_expr_2->exclude_list.emplace("Tokens");
-
-    ParsedExprVec project_exprs_3;
-    project_exprs_3.push_back(std::move(star_expr_2));
+    // 第一层最多容纳 m_children - 1 个长度节点，之后出现的长度全部落入同一个通配符节点
+    // 长度节点只会在该长度第一次出现时创建，所以这里按首次出现的顺序预先建好第一层
+    auto&       root_children {this->m_root->children_node};
+    std::size_t max_length_nodes {this->m_children > 0 ? this->m_children - 1UL : 0UL};
+    std::size_t length_node_count {root_children.size() - root_children.count(WILDCARD)};
+    std::unordered_map<std::size_t, std::uint32_t> length_shards;
 
-    rel = rel->Project(std::move(project_exprs_3), {});
+    for (auto&& [row, content] : std::views::enumerate(contents))
+    {
+        auto length {content.size()};
+        auto [it, inserted] {length_shards.try_emplace(length, 0)};
+        if (inserted)
+        {
+            auto token {this->m_token_dict.intern(std::to_string(length))};
+            if (auto node_it {root_children.find(token)}; node_it != root_children.end())
+            {
+                it->second = get_shard(node_it->second.get(), 1);
+            }
+            else if (length_node_count < max_length_nodes)
+            {
+                auto [node_it, _] {root_children.emplace(token, std::make_unique<Node>())};
+                it->second = get_shard(node_it->second.get(), 1);
+                ++length_node_count;
+            }
+            else
+            {
+                auto [node_it, _] {root_children.try_emplace(WILDCARD, std::make_unique<Node>())};
+                it->second = get_shard(node_it->second.get(), 1);
+            }
+        }
 
-    to_table(conn, rel, templates, structured_table_name, templates_table_name);
-    return static_cast<std::int32_t>(log_length);
+        this->m_shards[it->second].rows.push_back(static_cast<std::uint32_t>(row));
+    }
 }
 
-DrainLogParser::LogCluster* DrainLogParser::_add_content(const TContent& content)
+DrainLogParser::LogCluster* DrainLogParser::_add_content(const TContent& content, std::int64_t count, Shard& shard)
 {
-    auto* match_cluster {this->_tree_search(content)};
+    auto* match_cluster {this->_tree_search(content, shard)};
 
     if (match_cluster == nullptr)
     {
-        this->m_cluster_pool.emplace_back(content);
-        match_cluster = &this->m_cluster_pool.back();
-        this->_add_to_prefix_tree(match_cluster);
+        shard.cluster_pool.emplace_back(content);
+        match_cluster = &shard.cluster_pool.back();
+        this->_add_to_prefix_tree(match_cluster, shard);
     }
     else
     {
-        auto new_content {DrainLogParser::_create_template(content, match_cluster->content)};
-        if (new_content != match_cluster->content)
+        // 直接在模板上原地更新，避免每行都构造一个新的模板
+        if (DrainLogParser::_update_template(content, match_cluster->content))
         {
-            match_cluster->content = std::move(new_content);
+            match_cluster->log_template.reset();
         }
     }
+    match_cluster->count += count;
 
     return match_cluster;
 }
 
-DrainLogParser::LogCluster* DrainLogParser::_tree_search(const TContent& content, bool include_params)
+DrainLogParser::LogCluster* DrainLogParser::_tree_search(const TContent& content, const Shard& shard, bool include_params)
 {
     auto  length {content.size()};
-    auto  length_token {std::to_string(length)};
-    auto* cur_node {this->m_root.get()};
+    auto* cur_node {shard.node};
 
-    for (auto&& [i, token] : std::views::enumerate(std::views::concat(std::views::single(length_token), content)))
+    // 分片节点位于第 1 层（长度节点），content 从第 2 层开始
+    // 分片节点是根节点时说明深度为 1，直接在根节点上匹配
+    if (cur_node != this->m_root.get())
     {
-        auto cur_node_depth {i + 1};
-
-        if (cur_node_depth == this->m_depth || std::cmp_equal(cur_node_depth, length + 2))
+        for (auto&& [i, token] : std::views::enumerate(content))
         {
-            break;
-        }
+            auto cur_node_depth {i + 2};
 
-        if (auto it {cur_node->children_node.find(token)}; it == cur_node->children_node.end())
-        {
-            it = cur_node->children_node.find(WILDCARD);
-            if (it == cur_node->children_node.end())
+            if (cur_node_depth == this->m_depth || std::cmp_equal(cur_node_depth, length + 2))
             {
-                return nullptr;
+                break;
+            }
+
+            if (auto it {cur_node->children_node.find(token)}; it == cur_node->children_node.end())
+            {
+                it = cur_node->children_node.find(WILDCARD);
+                if (it == cur_node->children_node.end())
+                {
+                    return nullptr;
+                }
+                cur_node = it->second.get();
+            }
+            else
+            {
+                cur_node = it->second.get();
             }
-            cur_node = it->second.get();
-        }
-        else
-        {
-            cur_node = it->second.get();
         }
     }
 
@@ -188,18 +333,20 @@ DrainLogParser::_fast_match(const TContent& content, const Node* node, bool incl
     return nullptr;
 }
 
-void DrainLogParser::_add_to_prefix_tree(LogCluster* cluster)
+void DrainLogParser::_add_to_prefix_tree(LogCluster* cluster, Shard& shard)
 {
     auto  length {cluster->content.size()};
-    auto  length_token {std::to_string(length)};
-    auto* cur_node {this->m_root.get()};
+    auto* cur_node {shard.node};
+
+    if (cur_node == this->m_root.get())
+    {
+        cur_node->clusters.push_back(cluster);
+        return;
+    }
 
-    for (
-        auto&& [i, token] :
-        std::views::enumerate(std::views::concat(std::views::single(length_token), cluster->content))
-    )
+    for (auto&& [i, token] : std::views::enumerate(cluster->content))
     {
-        auto cur_node_depth {i + 1};
+        auto cur_node_depth {i + 2};
 
         if (cur_node_depth == this->m_depth || std::cmp_equal(cur_node_depth, length + 2))
         {
@@ -269,23 +416,19 @@ DrainLogParser::_get_distance(const TContent& content1, const TContent& content2
     return {static_cast<float>(sim_tokens) / static_cast<float>(content1.size()), param_count};
 }
 
-TContent DrainLogParser::_create_template(const TContent& content1, const TContent& content2)
+bool DrainLogParser::_update_template(const TContent& content, TContent& template_content)
 {
-    TContent new_content {content1};
-    for (auto&& [token1, token2] : std::views::zip(new_content, content2))
+    bool updated {false};
+    for (auto&& [token1, token2] : std::views::zip(content, template_content))
     {
-        if (token1 != token2)
+        if (token1 != token2 && token2 != WILDCARD)
         {
-            token1 = WILDCARD;
+            token2  = WILDCARD;
+            updated = true;
         }
     }
 
-    return new_content;
-}
-
-std::string DrainLogParser::LogCluster::get_template() const
-{
-    return this->content | std::views::join_with(' ') | std::ranges::to<std::string>();
+    return updated;
 }
 
 }    // namespace logtt
@@ -2,11 +2,11 @@
 
 #include "base_log_parser.hxx"
 #include "precomp.hxx"
+#include "sharded_prefix_tree.hxx"
 #include <cstdint>
-#include <deque>
 #include <memory>
+#include <optional>
 #include <string>
-#include <unordered_map>
 #include <vector>
 
 namespace logtt
@@ -37,6 +37,31 @@ public:
     std::int32_t parse(
         const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
     ) override;
+    // 增量解析：保留已经学习到的前缀树和日志簇，只解析前 line_offset 行之后追加的日志
+    // 结果追加写入结构化表和模板表，返回本次解析的日志条数
+    // 结尾没有换行符的最后一行可能还在写入中，留到下一次解析，因此返回的条数总是可以作为下一次的 line_offset
+    std::int32_t parse_incremental(
+        const std::string& log_file,
+        const std::string& structured_table_name,
+        const std::string& templates_table_name,
+        std::int64_t       line_offset
+    );
+    using BaseLogParser::match;
+    using BaseLogParser::m_build_token_index;
+    // 匹配模式：用当前学习到的模板（例如刚加载的快照）匹配日志，匹配过程不更新任何日志簇
+    // learn_unmatched 为真时，未匹配的行再交给聚类学习；返回解析的日志条数
+    std::int32_t match_learned(
+        const std::string& log_file,
+        const std::string& structured_table_name,
+        const std::string& templates_table_name,
+        bool               learn_unmatched,
+        std::int64_t&      unmatched_count
+    );
+    // 把学习到的前缀树、日志簇和 token 字典保存为二进制快照，失败时返回 false
+    bool save_snapshot(const std::string& snapshot_file) const;
+    // 从快照恢复学习到的状态，之后可以直接调用 parse_incremental 继续解析
+    // 文件无法读取或格式不符时返回 false，原有状态保持不变
+    bool load_snapshot(const std::string& snapshot_file);
 
     virtual ~DrainLogParser() = default;
 
@@ -44,31 +69,42 @@ private:
     struct LogCluster
     {
         TContent content;
-
-        [[nodiscard]]
-        std::string get_template() const;
+        // 第一次写入模板表时分配，之后保持不变
+        std::optional<std::uint32_t> template_id;
+        // 累计匹配到的行数
+        std::int64_t count {0};
+        // 缓存的模板字符串，content 变化时置空
+        std::optional<std::string> log_template;
     };
 
-    struct Node
-    {
-        std::vector<LogCluster*>                         clusters;
-        std::unordered_map<Token, std::unique_ptr<Node>> children_node;
-    };
+    // 按长度划分的分片：每个分片独占第 1 层的一个长度节点及其子树，深度为 1 时整棵树是一个根节点分片
+    using Node  = PrefixTreeNode<LogCluster>;
+    using Shard = PrefixTreeShard<LogCluster>;
+
+    // 按首次出现的顺序学习一批去重后的日志，新的日志簇分配新的 TemplateID，返回每个内容的 TemplateID
+    std::vector<std::uint32_t>
+        _learn(const std::vector<TContent>& contents, const std::vector<std::int64_t>& counts) override;
+    std::vector<TemplateRecord> _learned_templates() override;
+    // 把当前的全部日志簇编译成只读的匹配器
+    TemplateMatcher _compile_matcher();
 
-    LogCluster* _add_content(const TContent& content);
-    LogCluster* _tree_search(const TContent& content, bool include_params = false);
+    void        _build_shards(const std::vector<TContent>& contents);
+    LogCluster* _add_content(const TContent& content, std::int64_t count, Shard& shard);
+    LogCluster* _tree_search(const TContent& content, const Shard& shard, bool include_params = false);
     LogCluster* _fast_match(const TContent& content, const Node* node, bool include_params = false) const;
-    void        _add_to_prefix_tree(LogCluster* cluster);
+    void        _add_to_prefix_tree(LogCluster* cluster, Shard& shard);
 
     static std::pair<float, std::uint16_t>
                     _get_distance(const TContent& content1, const TContent& content2, bool include_params = false);
-    static TContent _create_template(const TContent& content1, const TContent& content2);
+    // 返回模板是否发生了变化
+    static bool _update_template(const TContent& content, TContent& template_content);
 
     std::uint16_t          m_depth {4};
     std::uint16_t          m_children {100};
     float                  m_sim_thr {0.4F};
     std::unique_ptr<Node>  m_root;
-    std::deque<LogCluster> m_cluster_pool;
+    ShardDeque<LogCluster> m_shards;
+    std::uint32_t          m_template_count {0};
 };
 
 }    // namespace logtt
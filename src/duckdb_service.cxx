@@ -1,7 +1,11 @@
 #include "duckdb_service.hxx"
+#include "line_reader.hxx"
 #include "precomp.hxx"
+#include "token_index.hxx"
 #include "utils.hxx"
+#include <algorithm>
 #include <format>
+#include <mutex>
 #include <ranges>
 
 namespace logtt
@@ -22,6 +26,17 @@ Connection& get_connection()
     static DuckDB           db {DB_PATH, &config};
     thread_local Connection conn {db};
 
+    // 自定义的表函数和标量函数注册在数据库实例上，所有连接共用，只需注册一次
+    static std::once_flag functions_registered;
+    std::call_once(
+        functions_registered,
+        []
+        {
+            register_line_reader(db);
+            register_token_index_functions(db);
+        }
+    );
+
 #ifdef LOGTT_ENABLE_PROFILING
     conn.EnableProfiling();
 #endif
@@ -33,49 +48,169 @@ Connection& get_connection()
 namespace
 {
 
-std::vector<std::vector<std::string>> _to_df(const shared_ptr<Relation>& rel)
+ColumnType _column_type(const LogicalType& type)
 {
-    auto star_expr {make_uniq<StarExpression>()};
-    star_expr->columns = true;
+    switch (type.id())
+    {
+    case LogicalTypeId::TINYINT:
+    case LogicalTypeId::SMALLINT:
+    case LogicalTypeId::INTEGER:
+    case LogicalTypeId::BIGINT:
+    case LogicalTypeId::UTINYINT:
+    case LogicalTypeId::USMALLINT:
+    case LogicalTypeId::UINTEGER:
+        return ColumnType::INTEGER;
+    case LogicalTypeId::FLOAT:
+    case LogicalTypeId::DOUBLE:
+        return ColumnType::FLOAT;
+    case LogicalTypeId::TIMESTAMP:
+    case LogicalTypeId::TIMESTAMP_SEC:
+    case LogicalTypeId::TIMESTAMP_MS:
+    case LogicalTypeId::TIMESTAMP_NS:
+        return ColumnType::TIMESTAMP;
+    default:
+        // UBIGINT、HUGEINT 等放不进 int64 的类型也按字符串返回
+        return ColumnType::STRING;
+    }
+}
 
-    ParsedExprVec project_exprs;
-    project_exprs.push_back(make_uniq<CastExpression>(LogicalType::VARCHAR, std::move(star_expr)));
+std::vector<ResultColumn> _to_columns(const shared_ptr<Relation>& rel)
+{
+    // 整数统一为 BIGINT，浮点数统一为 DOUBLE，时间戳统一为微秒精度的 TIMESTAMP，其余列转换为 VARCHAR
+    std::vector<ResultColumn> columns;
+    ParsedExprVec             project_exprs;
+    for (auto&& col : rel->Columns())
+    {
+        auto& column {columns.emplace_back()};
+        column.name             = col.Name();
+        column.type             = _column_type(col.Type());
+        column.single_precision = col.Type().id() == LogicalTypeId::FLOAT;
 
-    auto                                  result {to_m_result(rel->Project(std::move(project_exprs), {})->Execute())};
-    auto                                  row_length {result->RowCount()};
-    auto                                  col_length {result->ColumnCount()};
-    std::vector<std::vector<std::string>> df;
-    df.reserve(row_length);
-    for (auto&& data_chunk : result->Collection().Chunks())
+        LogicalType target_type;
+        switch (column.type)
+        {
+        case ColumnType::INTEGER:
+            target_type = LogicalType::BIGINT;
+            break;
+        case ColumnType::FLOAT:
+            target_type = LogicalType::DOUBLE;
+            break;
+        case ColumnType::TIMESTAMP:
+            target_type = LogicalType::TIMESTAMP;
+            break;
+        case ColumnType::STRING:
+            target_type = LogicalType::VARCHAR;
+            break;
+        }
+
+        auto cast_expr {make_uniq<CastExpression>(target_type, make_uniq<ColumnRefExpression>(col.Name()))};
+        cast_expr->SetAlias(col.Name());
+        project_exprs.push_back(std::move(cast_expr));
+    }
+
+    auto result {to_m_result(rel->Project(std::move(project_exprs), {})->Execute())};
+    auto row_length {result->RowCount()};
+    for (auto&& column : columns)
     {
-        std::vector<const string_t*>     all_datas(col_length);
-        std::vector<const ValidityMask*> all_validitymasks(col_length);
-        for (auto&& col : std::views::iota(0UL, col_length))
+        column.validity.reserve(row_length);
+        if (column.type == ColumnType::FLOAT)
+        {
+            column.floats.reserve(row_length);
+        }
+        else if (column.type == ColumnType::STRING)
+        {
+            column.offsets.reserve(row_length + 1);
+            column.offsets.push_back(0);
+        }
+        else
         {
-            all_datas[col]         = FlatVector::GetData<string_t>(data_chunk.data[col]);
-            all_validitymasks[col] = &FlatVector::Validity(data_chunk.data[col]);
+            column.integers.reserve(row_length);
         }
+    }
 
-        for (auto&& row : std::views::iota(0UL, data_chunk.size()))
+    for (auto&& data_chunk : result->Collection().Chunks())
+    {
+        for (auto&& [column, vec] : std::views::zip(columns, data_chunk.data))
         {
-            auto& row_data {df.emplace_back()};
-            row_data.reserve(col_length);
-            for (auto&& col : std::views::iota(0UL, col_length))
+            const auto& validity {FlatVector::Validity(vec)};
+            for (auto&& row : std::views::iota(0UL, data_chunk.size()))
             {
-                if (!all_validitymasks[col]->RowIsValid(row))
-                {
-                    row_data.emplace_back();
-                }
-                else
+                auto valid {validity.RowIsValid(row)};
+                column.validity.push_back(valid ? 1 : 0);
+
+                // NULL 的位置写入 0 或空字符串，保持各个缓冲区的行数一致
+                switch (column.type)
                 {
-                    const auto& value {all_datas[col][row]};
-                    row_data.emplace_back(value.GetString());
+                case ColumnType::INTEGER:
+                    column.integers.push_back(valid ? FlatVector::GetData<std::int64_t>(vec)[row] : 0);
+                    break;
+                case ColumnType::FLOAT:
+                    column.floats.push_back(valid ? FlatVector::GetData<double>(vec)[row] : 0.0);
+                    break;
+                case ColumnType::TIMESTAMP:
+                    column.integers.push_back(valid ? FlatVector::GetData<timestamp_t>(vec)[row].value : 0);
+                    break;
+                case ColumnType::STRING:
+                    if (valid)
+                    {
+                        const auto& value {FlatVector::GetData<string_t>(vec)[row]};
+                        column.chars.append(value.GetData(), value.GetSize());
+                    }
+                    column.offsets.push_back(static_cast<std::int64_t>(column.chars.size()));
+                    break;
                 }
             }
         }
     }
 
-    return df;
+    return columns;
+}
+
+shared_ptr<Relation> _open_table(Connection& conn, const std::string& table_name)
+{
+    auto rel {conn.Table(table_name)};
+
+    // 结构化表只保存 TemplateID，显示时通过模板表换回模板文本
+    const auto& columns {rel->Columns()};
+    auto        has_template_id {std::ranges::any_of(
+        columns,
+        [](const auto& col) -> bool
+        {
+            return col.Name() == "TemplateID";
+        }
+    )};
+    if (!table_name.starts_with("s_") || !has_template_id)
+    {
+        return rel;
+    }
+
+    auto templates_table_name {std::format("t_{}", table_name.substr(2))};
+
+    ParsedExprVec arg_exprs;
+    arg_exprs.push_back(
+        make_uniq<ComparisonExpression>(
+            ExpressionType::COMPARE_EQUAL,
+            make_uniq<ColumnRefExpression>("TemplateID", table_name),
+            make_uniq<ColumnRefExpression>("TemplateID", templates_table_name)
+        )
+    );
+
+    ParsedExprVec project_exprs;
+    project_exprs.reserve(columns.size());
+    for (auto&& col : columns)
+    {
+        if (col.Name() == "TemplateID")
+        {
+            project_exprs.push_back(make_uniq<ColumnRefExpression>("Template", templates_table_name));
+        }
+        else
+        {
+            project_exprs.push_back(make_uniq<ColumnRefExpression>(col.Name(), table_name));
+        }
+    }
+
+    return rel->Join(conn.Table(templates_table_name), std::move(arg_exprs), JoinType::LEFT)
+        ->Project(std::move(project_exprs), {});
 }
 
 unique_ptr<ParsedExpression> _build_filter_expr(const Filters& filters)
@@ -109,8 +244,392 @@ unique_ptr<ParsedExpression> _build_like_filter_expr(const std::string& column_n
     return make_uniq<FunctionExpression>("contains", std::move(arg_exprs));
 }
 
+// 稀疏索引中相邻两个锚点之间的行数
+constexpr std::int64_t PAGE_INDEX_STRIDE {1024};
+// 每个线程最多缓存的过滤条件数，超出后全部清空
+constexpr std::size_t PAGE_INDEX_CACHE_SIZE {16};
+
+// 某个过滤条件下的行数，以及按 LineID 分页用的稀疏索引
+struct PageIndex
+{
+    // 建立索引时表的版本，版本变化后索引失效
+    std::string  version;
+    std::int64_t row_count {0};
+    // anchors[i] 是过滤后第 i * PAGE_INDEX_STRIDE 行的 LineID，为空时只能按 OFFSET 分页
+    std::vector<std::int64_t> anchors;
+};
+
+// 表的版本：重建表会得到新的 table_oid，追加写入会改变 estimated_size
+// 结构化表还要带上对应的模板表，模板文本变化时 Template 列上的过滤结果也会变化
+std::string _table_version(Connection& conn, const std::string& table_name)
+{
+    auto table_names {std::format("'{}'", table_name)};
+    if (table_name.starts_with("s_"))
+    {
+        table_names += std::format(", 't_{}'", table_name.substr(2));
+    }
+
+    auto result {conn.Query(
+        std::format(
+            R"(
+            SELECT string_agg(table_oid::STRING || ':' || estimated_size::STRING, ',' ORDER BY table_name)
+            FROM duckdb_tables()
+            WHERE table_name IN ({})
+        )",
+            table_names
+        )
+    )};
+    return result->GetValue(0, 0).ToString();
+}
+
+// 过滤条件的签名，每个字符串都带上长度前缀，避免不同的条件拼接出相同的签名
+std::string _filters_signature(const std::string& table_name, const Filters& filters)
+{
+    // unordered_map 的遍历顺序不固定，先排序
+    std::vector<std::pair<std::string, std::vector<std::string>>> sorted_filters {filters.begin(), filters.end()};
+    std::ranges::sort(sorted_filters);
+
+    auto signature {std::format("{}:{}", table_name.size(), table_name)};
+    for (auto&& [col, values] : sorted_filters)
+    {
+        std::ranges::sort(values);
+        signature += std::format("|{}:{}", col.size(), col);
+        for (auto&& value : values)
+        {
+            signature += std::format(",{}:{}", value.size(), value);
+        }
+    }
+    return signature;
+}
+
+// 按 LineID 升序排列，分页的各个路径都显式使用这个顺序
+vector<OrderByNode> _line_id_order()
+{
+    vector<OrderByNode> order_exprs;
+    order_exprs.emplace_back(
+        OrderType::ASCENDING, OrderByNullType::ORDER_DEFAULT, make_uniq<ColumnRefExpression>("LineID")
+    );
+    return order_exprs;
+}
+
+// 统计 rel 的行数；有 LineID 时同时按 LineID 的顺序流式读取 LineID，每隔 PAGE_INDEX_STRIDE 行记录一个锚点
+PageIndex _build_page_index(Connection& conn, const shared_ptr<Relation>& rel, std::string version, bool has_line_id)
+{
+    PageIndex index {std::move(version)};
+    if (!has_line_id)
+    {
+        index.row_count = get_rel_row_count(rel);
+        return index;
+    }
+
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(make_uniq<ColumnRefExpression>("LineID"));
+
+    // 扫描和连接都不保证输出的顺序，锚点要按 LineID 显式排序后再选取
+    rel->Project(std::move(project_exprs), {})
+        ->Order(_line_id_order())
+        ->CreateView("_page_index", true, true);
+    auto result {conn.SendQuery("SELECT * FROM _page_index")};
+    if (result->HasError())
+    {
+        result->ThrowError();
+    }
+
+    while (auto chunk {result->Fetch()})
+    {
+        chunk->Flatten();
+        const auto* line_id_data {FlatVector::GetData<std::int64_t>(chunk->data[0])};
+        for (auto&& row : std::views::iota(0UL, chunk->size()))
+        {
+            if (index.row_count % PAGE_INDEX_STRIDE == 0)
+            {
+                index.anchors.push_back(line_id_data[row]);
+            }
+            ++index.row_count;
+        }
+    }
+
+    return index;
+}
+
+// 搜索结果本身就是递增的 LineID，没有其他过滤条件时直接由它得到分页索引，不必扫描结构化表
+PageIndex _page_index_from_line_ids(const std::vector<std::int64_t>& line_ids, std::string version)
+{
+    PageIndex index {std::move(version), static_cast<std::int64_t>(line_ids.size())};
+    for (auto&& line_id : line_ids | std::views::stride(PAGE_INDEX_STRIDE))
+    {
+        index.anchors.push_back(line_id);
+    }
+    return index;
+}
+
+// 每个线程最多缓存的搜索结果数，超出后全部清空
+constexpr std::size_t SEARCH_RESULT_CACHE_SIZE {4};
+
+// 一组搜索词在倒排索引中命中的行
+struct SearchResult
+{
+    // 搜索时表的版本，版本变化后结果失效
+    std::string               version;
+    // 递增的 LineID
+    std::vector<std::int64_t> line_ids;
+    // 同样的 LineID 保存在临时表的 MatchedLineID 列中，用于与结构化表做半连接
+    ScratchTable              scratch;
+};
+
+// 搜索词的签名，拼接在过滤条件的签名之后，没有搜索词时为空
+std::string _search_signature(const std::vector<std::string>& search_terms, bool match_all)
+{
+    if (search_terms.empty())
+    {
+        return "";
+    }
+
+    auto signature {std::format("|{}", match_all ? "AND" : "OR")};
+    for (auto&& term : search_terms)
+    {
+        signature += std::format(",{}:{}", term.size(), term);
+    }
+    return signature;
+}
+
+// 在倒排索引中查找命中的行，结果按搜索词和表的版本缓存，翻页时不再重复查找；没有倒排索引时返回 nullptr
+// 返回的指针只在下一次调用之前有效
+const SearchResult* _search_lines(
+    Connection&                     conn,
+    const std::string&              table_name,
+    const std::vector<std::string>& search_terms,
+    bool                            match_all,
+    const std::string&              version
+)
+{
+    // 每个线程使用自己的连接，临时表也只对这个连接可见，因此按线程缓存
+    thread_local std::unordered_map<std::string, SearchResult> search_results;
+
+    auto signature {
+        std::format("{}:{}{}", table_name.size(), table_name, _search_signature(search_terms, match_all))
+    };
+    if (auto it {search_results.find(signature)}; it != search_results.end() && it->second.version == version)
+    {
+        return &it->second;
+    }
+
+    auto line_ids {search_token_index(conn, table_name, search_terms, match_all)};
+    if (!line_ids)
+    {
+        return nullptr;
+    }
+
+    auto scratch {
+        ScratchTable::create(conn, conn.RelationFromQuery("SELECT NULL::BIGINT AS MatchedLineID LIMIT 0")).value()
+    };
+    Appender appender {conn, "temp", "main", scratch.table_name()};
+    for (auto&& line_id : *line_ids)
+    {
+        appender.AppendRow(line_id);
+    }
+    appender.Close();
+
+    search_results.erase(signature);
+    if (search_results.size() >= SEARCH_RESULT_CACHE_SIZE)
+    {
+        search_results.clear();
+    }
+    auto [it, _] {
+        search_results.emplace(std::move(signature), SearchResult {version, std::move(*line_ids), std::move(scratch)})
+    };
+    return &it->second;
+}
+
+// 没有倒排索引时的搜索：逐行用 INDEX_KEYS_FUNCTION 算出 Content 的键，与倒排索引的搜索规则相同
+unique_ptr<ParsedExpression> _build_search_filter_expr(const std::vector<std::string>& search_terms, bool match_all)
+{
+    // 与倒排索引一致，没有任何键的搜索不命中任何行
+    auto keys {search_keys(search_terms)};
+    if (keys.empty())
+    {
+        return make_uniq<ConstantExpression>(Value::BOOLEAN(false));
+    }
+
+    ParsedExprVec index_keys_exprs;
+    index_keys_exprs.push_back(make_uniq<ColumnRefExpression>("Content"));
+
+    vector<Value> key_values;
+    for (auto&& key : keys)
+    {
+        key_values.emplace_back(key);
+    }
+
+    ParsedExprVec arg_exprs;
+    arg_exprs.push_back(make_uniq<FunctionExpression>(std::string {INDEX_KEYS_FUNCTION}, std::move(index_keys_exprs)));
+    arg_exprs.push_back(make_uniq<ConstantExpression>(Value::LIST(LogicalType::VARCHAR, std::move(key_values))));
+
+    return make_uniq<FunctionExpression>(match_all ? "list_has_all" : "list_has_any", std::move(arg_exprs));
+}
+
+// 每个线程最多缓存的分组结果数，超出后全部清空
+constexpr std::size_t VALUE_COUNTS_CACHE_SIZE {8};
+
+// 某个过滤条件下一列的取值计数，保存在临时表中
+struct ValueCounts
+{
+    // 分组时表的版本，版本变化后结果失效
+    std::string  version;
+    ScratchTable scratch;
+};
+
+// 抽取时生成的汇总表中该列的取值计数，没有可用的汇总时返回 nullptr
+shared_ptr<Relation>
+_summary_value_counts(Connection& conn, const std::string& table_name, const std::string& column_name)
+{
+    if (!table_name.starts_with("s_"))
+    {
+        return nullptr;
+    }
+    auto summary_table_name {value_summary_table_name(table_name)};
+    if (conn.TableInfo(summary_table_name) == nullptr)
+    {
+        return nullptr;
+    }
+
+    auto has_summary {
+        [&](const std::string& summary_column) -> bool
+        {
+            return conn
+                       .Query(
+                           std::format(
+                               "SELECT 1 FROM {} WHERE ColumnName = '{}' LIMIT 1", summary_table_name, summary_column
+                           )
+                       )
+                       ->RowCount() > 0;
+        }
+    };
+
+    if (has_summary(column_name))
+    {
+        return conn.RelationFromQuery(
+            std::format(
+                R"(
+                SELECT Value AS "{1}", sum(Count)::BIGINT AS Count
+                FROM {0}
+                WHERE ColumnName = '{1}'
+                GROUP BY Value
+            )",
+                summary_table_name,
+                column_name
+            )
+        );
+    }
+
+    // 结构化表只保存 TemplateID，Template 列的计数由 TemplateID 的计数按模板文本合并得到
+    if (column_name == "Template" && has_summary("TemplateID"))
+    {
+        return conn.RelationFromQuery(
+            std::format(
+                R"(
+                SELECT t.Template AS Template, sum(f.Count)::BIGINT AS Count
+                FROM {0} AS f
+                LEFT JOIN t_{1} AS t ON f.Value = t.TemplateID::STRING
+                WHERE f.ColumnName = 'TemplateID'
+                GROUP BY t.Template
+            )",
+                summary_table_name,
+                table_name.substr(2)
+            )
+        );
+    }
+
+    return nullptr;
+}
+
+// 一列的取值计数：没有其他过滤条件时直接读取汇总表
+// 否则按过滤条件分组一次并缓存在临时表中，之后输入关键字和翻页都只查询这张小表
+shared_ptr<Relation> _value_counts(
+    Connection&        conn,
+    const std::string& table_name,
+    const std::string& column_name,
+    const Filters&     other_filters
+)
+{
+    // 每个线程使用自己的连接，临时表也只对这个连接可见，因此按线程缓存
+    thread_local std::unordered_map<std::string, ValueCounts> value_counts_cache;
+
+    if (other_filters.empty())
+    {
+        if (auto rel {_summary_value_counts(conn, table_name, column_name)})
+        {
+            return rel;
+        }
+    }
+
+    auto version {_table_version(conn, table_name)};
+    auto signature {
+        std::format("{}:{}|{}", column_name.size(), column_name, _filters_signature(table_name, other_filters))
+    };
+    if (auto it {value_counts_cache.find(signature)};
+        it != value_counts_cache.end() && it->second.version == version)
+    {
+        return it->second.scratch.relation();
+    }
+
+    auto rel {_open_table(conn, table_name)};
+    if (!other_filters.empty())
+    {
+        rel = rel->Filter(_build_filter_expr(other_filters));
+    }
+
+    auto func_expr {make_uniq<FunctionExpression>("count", ParsedExprVec {})};
+    func_expr->SetAlias("Count");
+
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(make_uniq<ColumnRefExpression>(column_name));
+    project_exprs.push_back(std::move(func_expr));
+
+    auto scratch {ScratchTable::create(conn, rel->Aggregate(std::move(project_exprs), column_name)).value()};
+
+    value_counts_cache.erase(signature);
+    if (value_counts_cache.size() >= VALUE_COUNTS_CACHE_SIZE)
+    {
+        value_counts_cache.clear();
+    }
+    auto [it, _] {
+        value_counts_cache.emplace(std::move(signature), ValueCounts {std::move(version), std::move(scratch)})
+    };
+    return it->second.scratch.relation();
+}
+
 }    // namespace
 
+// ==================== 查询结果 ====================
+
+std::string format_result_cell(const ResultColumn& column, std::size_t row)
+{
+    if (column.validity[row] == 0)
+    {
+        return {};
+    }
+
+    switch (column.type)
+    {
+    case ColumnType::INTEGER:
+        return std::to_string(column.integers[row]);
+    case ColumnType::FLOAT:
+        // 单精度的值按 FLOAT 格式化，避免显示成转换为 DOUBLE 之后的长尾数
+        if (column.single_precision)
+        {
+            return Value::FLOAT(static_cast<float>(column.floats[row])).ToString();
+        }
+        return Value::DOUBLE(column.floats[row]).ToString();
+    case ColumnType::TIMESTAMP:
+        return Value::TIMESTAMP(timestamp_t {column.integers[row]}).ToString();
+    case ColumnType::STRING:
+        break;
+    }
+
+    auto begin {column.offsets[row]};
+    return column.chars.substr(begin, column.offsets[row + 1] - begin);
+}
+
 // ==================== 日志管理 ====================
 
 void create_log_table_if_not_exists()
@@ -128,8 +647,12 @@ void create_log_table_if_not_exists()
             extract_method        STRING      NOT NULL DEFAULT '',
             line_count            UINT32      NOT NULL DEFAULT 0,
             structured_table_name STRING AS ('s_' || id::STRING),
-            templates_table_name  STRING AS ('t_' || id::STRING)
+            templates_table_name  STRING AS ('t_' || id::STRING),
+            snapshot_path         STRING      NOT NULL DEFAULT '',
+            snapshot_line_count   UINT32      NOT NULL DEFAULT 0
         );
+        ALTER TABLE log ADD COLUMN IF NOT EXISTS snapshot_path STRING NOT NULL DEFAULT '';
+        ALTER TABLE log ADD COLUMN IF NOT EXISTS snapshot_line_count UINT32 NOT NULL DEFAULT 0;
     )");
 }
 
@@ -152,6 +675,8 @@ std::vector<LogEntry> get_log_table()
         const auto& line_count_col {data_chunk.data[6]};
         const auto& structured_table_name_col {data_chunk.data[7]};
         const auto& templates_table_name_col {data_chunk.data[8]};
+        const auto& snapshot_path_col {data_chunk.data[9]};
+        const auto& snapshot_line_count_col {data_chunk.data[10]};
 
         const auto* const id_data {FlatVector::GetData<std::uint32_t>(id_col)};
         const auto* const format_type_data {FlatVector::GetData<string_t>(format_type_col)};
@@ -162,6 +687,8 @@ std::vector<LogEntry> get_log_table()
         const auto* const line_count_data {FlatVector::GetData<std::uint32_t>(line_count_col)};
         const auto* const structured_table_name_data {FlatVector::GetData<string_t>(structured_table_name_col)};
         const auto* const templates_table_name_data {FlatVector::GetData<string_t>(templates_table_name_col)};
+        const auto* const snapshot_path_data {FlatVector::GetData<string_t>(snapshot_path_col)};
+        const auto* const snapshot_line_count_data {FlatVector::GetData<std::uint32_t>(snapshot_line_count_col)};
 
         for (auto&& row : std::views::iota(0UL, data_chunk.size()))
         {
@@ -174,6 +701,8 @@ std::vector<LogEntry> get_log_table()
             auto line_count {line_count_data[row]};
             auto structured_table_name {structured_table_name_data[row]};
             auto templates_table_name {templates_table_name_data[row]};
+            auto snapshot_path {snapshot_path_data[row]};
+            auto snapshot_line_count {snapshot_line_count_data[row]};
 
             log_table.emplace_back(
                 id,
@@ -184,7 +713,9 @@ std::vector<LogEntry> get_log_table()
                 std::string(extract_method.GetData(), extract_method.GetSize()),
                 line_count,
                 std::string(structured_table_name.GetData(), structured_table_name.GetSize()),
-                std::string(templates_table_name.GetData(), templates_table_name.GetSize())
+                std::string(templates_table_name.GetData(), templates_table_name.GetSize()),
+                std::string(snapshot_path.GetData(), snapshot_path.GetSize()),
+                snapshot_line_count
             );
         }
     }
@@ -344,6 +875,27 @@ void update_log_line_count(std::uint32_t log_id, std::uint32_t value)
     );
 }
 
+void update_log_snapshot(std::uint32_t log_id, const std::string& path, std::uint32_t line_count)
+{
+    auto& conn {get_connection()};
+    auto  rel {conn.Table("log")};
+
+    // 快照路径和它已经解析的行数一起更新，二者总是对应同一次解析
+    ParsedExprVec update_exprs;
+    update_exprs.push_back(make_uniq<ConstantExpression>(Value(path)));
+    update_exprs.push_back(make_uniq<ConstantExpression>(Value::UINTEGER(line_count)));
+
+    rel->Update(
+        {"snapshot_path", "snapshot_line_count"},
+        std::move(update_exprs),
+        make_uniq<ComparisonExpression>(
+            ExpressionType::COMPARE_EQUAL,
+            make_uniq<ColumnRefExpression>("id"),
+            make_uniq<ConstantExpression>(Value::UINTEGER(log_id))
+        )
+    );
+}
+
 void delete_log(std::uint32_t log_id)
 {
     auto& conn {get_connection()};
@@ -354,27 +906,139 @@ void delete_log(std::uint32_t log_id)
 
 // ==================== CSV表格显示 ====================
 
-std::pair<std::vector<std::vector<std::string>>, std::int64_t>
-fetch_csv_table(const std::string& table_name, std::int64_t offset, std::int64_t limit, const Filters& filters)
+std::pair<std::vector<ResultColumn>, std::int64_t> fetch_csv_table(
+    const std::string&              table_name,
+    std::int64_t                    offset,
+    std::int64_t                    limit,
+    const Filters&                  filters,
+    const std::string&              order_by,
+    bool                            descending,
+    const std::vector<std::string>& search_terms,
+    bool                            match_all
+)
 {
+    // 每个线程使用自己的连接，分页索引也按线程缓存
+    thread_local std::unordered_map<std::string, PageIndex> page_indexes;
+
     auto& conn {get_connection()};
-    auto  rel {conn.Table(table_name)};
+    auto  rel {_open_table(conn, table_name)};
     if (!filters.empty())
     {
         rel = rel->Filter(_build_filter_expr(filters));
     }
+    auto has_line_id {has_column(table_name, "LineID")};
+    auto version {_table_version(conn, table_name)};
 
-    rel = get_tmp(conn, rel).value();
+    // 搜索词先在倒排索引中查出命中的 LineID，再与结构化表做半连接；没有倒排索引时逐行计算 Content 的键
+    // 两种方式都按 token_index.hxx 中的搜索规则整词匹配，结果相同
+    const SearchResult* search {nullptr};
+    if (!search_terms.empty())
+    {
+        if (has_line_id && table_name.starts_with("s_"))
+        {
+            search = _search_lines(conn, table_name, search_terms, match_all, version);
+        }
 
-    auto log_length {get_rel_row_count(rel)};
+        if (search != nullptr)
+        {
+            ParsedExprVec arg_exprs;
+            arg_exprs.push_back(
+                make_uniq<ComparisonExpression>(
+                    ExpressionType::COMPARE_EQUAL,
+                    make_uniq<ColumnRefExpression>("LineID"),
+                    make_uniq<ColumnRefExpression>("MatchedLineID")
+                )
+            );
+            rel = rel->Join(search->scratch.relation(), std::move(arg_exprs), JoinType::SEMI);
+        }
+        else
+        {
+            rel = rel->Filter(_build_search_filter_expr(search_terms, match_all));
+        }
+    }
+
+    // 过滤后的行数和稀疏索引只在过滤条件、搜索词或表的版本变化时重新计算，翻页时直接复用
+    auto signature {_filters_signature(table_name, filters) + _search_signature(search_terms, match_all)};
+    auto it {page_indexes.find(signature)};
+    if (it == page_indexes.end() || it->second.version != version)
+    {
+        if (page_indexes.size() >= PAGE_INDEX_CACHE_SIZE)
+        {
+            page_indexes.clear();
+        }
+        auto index {
+            search != nullptr && filters.empty()
+                ? _page_index_from_line_ids(search->line_ids, std::move(version))
+                : _build_page_index(conn, rel, std::move(version), has_line_id)
+        };
+        it = page_indexes.insert_or_assign(std::move(signature), std::move(index)).first;
+    }
+    const auto& index {it->second};
+
+    if (!order_by.empty())
+    {
+        // 按任意列排序：ORDER BY + LIMIT 由 DuckDB 以 Top-N 执行，只保留前 offset + limit 行，不做完整排序
+        // 相同的值之间按 LineID 排列，保证翻页结果稳定
+        vector<OrderByNode> order_exprs;
+        order_exprs.emplace_back(
+            descending ? OrderType::DESCENDING : OrderType::ASCENDING,
+            OrderByNullType::ORDER_DEFAULT,
+            make_uniq<ColumnRefExpression>(order_by)
+        );
+        if (has_line_id && order_by != "LineID")
+        {
+            order_exprs.emplace_back(
+                OrderType::ASCENDING, OrderByNullType::ORDER_DEFAULT, make_uniq<ColumnRefExpression>("LineID")
+            );
+        }
 
-    rel = rel->Limit(limit, offset);
-    return {_to_df(rel), log_length};
+        rel = rel->Order(std::move(order_exprs))->Limit(limit, offset);
+    }
+    else if (offset / PAGE_INDEX_STRIDE < static_cast<std::int64_t>(index.anchors.size()))
+    {
+        // 按 LineID 分页：用前后两个锚点把扫描限制在目标行所在的 LineID 区间，区间内只剩很小的 OFFSET
+        auto first {offset / PAGE_INDEX_STRIDE};
+
+        ParsedExprVec range_exprs;
+        range_exprs.push_back(
+            make_uniq<ComparisonExpression>(
+                ExpressionType::COMPARE_GREATERTHANOREQUALTO,
+                make_uniq<ColumnRefExpression>("LineID"),
+                make_uniq<ConstantExpression>(Value::BIGINT(index.anchors[first]))
+            )
+        );
+        if (auto last {(offset + limit + PAGE_INDEX_STRIDE - 1) / PAGE_INDEX_STRIDE};
+            limit >= 0 && last < static_cast<std::int64_t>(index.anchors.size()))
+        {
+            range_exprs.push_back(
+                make_uniq<ComparisonExpression>(
+                    ExpressionType::COMPARE_LESSTHAN,
+                    make_uniq<ColumnRefExpression>("LineID"),
+                    make_uniq<ConstantExpression>(Value::BIGINT(index.anchors[last]))
+                )
+            );
+        }
+
+        rel = rel->Filter(make_uniq<ConjunctionExpression>(ExpressionType::CONJUNCTION_AND, std::move(range_exprs)))
+                  ->Order(_line_id_order())
+                  ->Limit(limit, offset - first * PAGE_INDEX_STRIDE);
+    }
+    else if (has_line_id)
+    {
+        // 超出稀疏索引的范围时退回到 OFFSET 分页，同样要按 LineID 显式排序
+        rel = rel->Order(_line_id_order())->Limit(limit, offset);
+    }
+    else
+    {
+        rel = rel->Limit(limit, offset);
+    }
+
+    return {_to_columns(rel), index.row_count};
 }
 
 // ==================== CSV表格过滤器 ====================
 
-std::pair<std::vector<std::vector<std::string>>, std::int64_t> fetch_filter_table(
+std::pair<std::vector<ResultColumn>, std::int64_t> fetch_filter_table(
     const std::string& table_name,
     const std::string& column_name,
     std::int64_t       offset,
@@ -384,37 +1048,27 @@ std::pair<std::vector<std::vector<std::string>>, std::int64_t> fetch_filter_tabl
 )
 {
     auto& conn {get_connection()};
-    auto  rel {conn.Table(table_name)};
+    auto  rel {_value_counts(conn, table_name, column_name, other_filters)};
 
+    // 关键字只在取值计数上过滤，不再扫描结构化表
     if (!keyword.empty())
     {
         rel = rel->Filter(_build_like_filter_expr(column_name, keyword));
     }
-    if (!other_filters.empty())
-    {
-        rel = rel->Filter(_build_filter_expr(other_filters));
-    }
 
-    auto func_expr {make_uniq<FunctionExpression>("count", ParsedExprVec {})};
-    func_expr->SetAlias("Count");
-
-    ParsedExprVec project_exprs;
-    project_exprs.push_back(make_uniq<ColumnRefExpression>(column_name));
-    project_exprs.push_back(std::move(func_expr));
+    auto log_length {get_rel_row_count(rel)};
 
+    // 计数相同的值按值排列，保证翻页结果稳定
     vector<OrderByNode> order_exprs;
     order_exprs.emplace_back(
         OrderType::DESCENDING, OrderByNullType::ORDER_DEFAULT, make_uniq<ColumnRefExpression>("Count")
     );
+    order_exprs.emplace_back(
+        OrderType::ASCENDING, OrderByNullType::ORDER_DEFAULT, make_uniq<ColumnRefExpression>(column_name)
+    );
 
-    rel = rel->Aggregate(std::move(project_exprs), column_name)->Order(std::move(order_exprs));
-
-    rel = get_tmp(conn, rel).value();
-
-    auto log_length {get_rel_row_count(rel)};
-
-    rel = rel->Limit(limit, offset);
-    return {_to_df(rel), log_length};
+    rel = rel->Order(std::move(order_exprs))->Limit(limit, offset);
+    return {_to_columns(rel), log_length};
 }
 
 // ==================== 通用方法 ====================
@@ -429,6 +1083,13 @@ void drop_table(const std::string& table_name)
 {
     auto& conn {get_connection()};
     conn.Query(std::format("DROP TABLE IF EXISTS {}", table_name));
+
+    // 取值计数汇总表和倒排索引表随结构化表一起删除
+    if (table_name.starts_with("s_"))
+    {
+        conn.Query(std::format("DROP TABLE IF EXISTS {}", value_summary_table_name(table_name)));
+        conn.Query(std::format("DROP TABLE IF EXISTS {}", token_index_table_name(table_name)));
+    }
 }
 
 bool has_column(const std::string& table_name, const std::string& column_name)
@@ -456,7 +1117,7 @@ std::int64_t get_table_row_count(const std::string& table_name)
 std::vector<std::string> get_table_columns(const std::string& table_name)
 {
     auto& conn {get_connection()};
-    auto  rel {conn.Table(table_name)};
+    auto  rel {_open_table(conn, table_name)};
 
     std::vector<std::string> columns;
     columns.reserve(rel->Columns().size());
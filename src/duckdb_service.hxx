@@ -13,6 +13,39 @@ duckdb::Connection& get_connection();
 
 using Filters = std::unordered_map<std::string, std::vector<std::string>>;
 
+// ==================== 查询结果 ====================
+
+enum class ColumnType : std::uint8_t
+{
+    // 所有整数类型，保存在 integers 中
+    INTEGER,
+    // FLOAT 和 DOUBLE，保存在 floats 中
+    FLOAT,
+    // 所有时间戳类型，以 1970-01-01 以来的微秒数保存在 integers 中
+    TIMESTAMP,
+    // 其他类型转换为字符串后保存在 chars 和 offsets 中
+    STRING,
+};
+
+// 按列返回的查询结果，每个缓冲区都是连续的内存，可以不经拷贝地交给 NumPy
+struct ResultColumn
+{
+    std::string               name;
+    ColumnType                type;
+    // 原始类型为单精度 FLOAT 时为 true，显示时按单精度格式化
+    bool                      single_precision;
+    std::vector<std::int64_t> integers;
+    std::vector<double>       floats;
+    // 所有字符串首尾相接，第 i 行为 chars[offsets[i], offsets[i + 1])，与 Arrow 的 large_string 布局相同
+    std::string               chars;
+    std::vector<std::int64_t> offsets;
+    // 非 NULL 为 1，NULL 为 0
+    std::vector<std::uint8_t> validity;
+};
+
+// 把一个单元格格式化为显示用的字符串，与 DuckDB 把原始类型转换为 VARCHAR 的结果一致，NULL 为空字符串
+std::string format_result_cell(const ResultColumn& column, std::size_t row);
+
 // ==================== 日志管理 ====================
 
 struct LogEntry
@@ -26,6 +59,9 @@ struct LogEntry
     std::uint32_t line_count;
     std::string   structured_table_name;
     std::string   templates_table_name;
+    // 解析器状态快照及其已经解析的行数，没有快照时为空串和 0
+    std::string   snapshot_path;
+    std::uint32_t snapshot_line_count;
 };
 
 struct EXLogEntry
@@ -44,16 +80,29 @@ void                    update_log_format_type(std::uint32_t log_id, const std::
 void                    update_log_is_extracted(std::uint32_t log_id, bool value);
 void                    update_log_extract_method(std::uint32_t log_id, const std::string& value);
 void                    update_log_line_count(std::uint32_t log_id, std::uint32_t value);
+void                    update_log_snapshot(std::uint32_t log_id, const std::string& path, std::uint32_t line_count);
 void                    delete_log(std::uint32_t log_id);
 
 // ==================== CSV表格显示 ====================
 
-std::pair<std::vector<std::vector<std::string>>, std::int64_t>
-fetch_csv_table(const std::string& table_name, std::int64_t offset, std::int64_t limit, const Filters& filters);
+// 返回过滤后从 offset 开始的 limit 行和过滤后的总行数，limit 为 -1 时返回之后的所有行
+// order_by 为空时按 LineID 排列（没有 LineID 的表按表中的顺序），否则按 order_by 排序
+// search_terms 不为空时只保留包含全部（match_all 为真）或任意一个搜索词的行
+// 搜索词按 token_index.hxx 中的搜索规则与 Content 中的词整词比较，有倒排索引时在索引中查找，否则逐行比较
+std::pair<std::vector<ResultColumn>, std::int64_t> fetch_csv_table(
+    const std::string&              table_name,
+    std::int64_t                    offset,
+    std::int64_t                    limit,
+    const Filters&                  filters,
+    const std::string&              order_by     = "",
+    bool                            descending   = false,
+    const std::vector<std::string>& search_terms = {},
+    bool                            match_all    = true
+);
 
 // ==================== CSV表格过滤器 ====================
 
-std::pair<std::vector<std::vector<std::string>>, std::int64_t> fetch_filter_table(
+std::pair<std::vector<ResultColumn>, std::int64_t> fetch_filter_table(
     const std::string& table_name,
     const std::string& column_name,
     std::int64_t       offset,
@@ -0,0 +1,129 @@
+#include "field_splitter.hxx"
+#include <ranges>
+
+namespace logtt
+{
+
+namespace
+{
+
+// parse 库只转义这些字符，未转义出现时说明是正则语法
+constexpr std::string_view REGEX_SPECIAL {"?\\.[]()*+^$!|{}"};
+constexpr std::string_view FIELD_BEGIN {"(?P<"};
+constexpr std::string_view FIELD_END {">.+?)"};
+
+}    // namespace
+
+std::optional<FieldSplitter>
+FieldSplitter::compile(std::string_view log_regex, const std::vector<std::string>& named_fields)
+{
+    if (named_fields.empty() || !log_regex.starts_with('^') || !log_regex.ends_with('$'))
+    {
+        return std::nullopt;
+    }
+    log_regex = log_regex.substr(1, log_regex.size() - 2);
+
+    FieldSplitter splitter;
+    std::string   literal;
+    std::size_t   field_count {0};
+    std::size_t   pos {0};
+    while (pos < log_regex.size())
+    {
+        if (log_regex.substr(pos).starts_with(FIELD_BEGIN))
+        {
+            auto name_begin {pos + FIELD_BEGIN.size()};
+            auto name_end {log_regex.find('>', name_begin)};
+            if (name_end == std::string_view::npos || !log_regex.substr(name_end).starts_with(FIELD_END) ||
+                field_count == named_fields.size() ||
+                log_regex.substr(name_begin, name_end - name_begin) != named_fields[field_count])
+            {
+                return std::nullopt;
+            }
+
+            if (field_count == 0)
+            {
+                splitter.m_prefix = std::move(literal);
+            }
+            else if (literal.empty())
+            {
+                // 相邻的两个惰性字段之间没有分隔符，无法按查找切分
+                return std::nullopt;
+            }
+            else
+            {
+                splitter.m_separators.push_back(std::move(literal));
+            }
+            literal.clear();
+
+            ++field_count;
+            pos = name_end + FIELD_END.size();
+            continue;
+        }
+
+        auto c {log_regex[pos]};
+        if (c == '\\')
+        {
+            if (pos + 1 >= log_regex.size() || !REGEX_SPECIAL.contains(log_regex[pos + 1]))
+            {
+                return std::nullopt;
+            }
+            literal.push_back(log_regex[pos + 1]);
+            pos += 2;
+        }
+        else if (REGEX_SPECIAL.contains(c))
+        {
+            return std::nullopt;
+        }
+        else
+        {
+            literal.push_back(c);
+            ++pos;
+        }
+    }
+
+    if (field_count != named_fields.size())
+    {
+        return std::nullopt;
+    }
+    splitter.m_separators.push_back(std::move(literal));
+
+    return splitter;
+}
+
+bool FieldSplitter::split(std::string_view line, std::vector<std::string_view>& fields) const
+{
+    if (!line.starts_with(this->m_prefix))
+    {
+        return false;
+    }
+
+    // 每个字段至少一个字符，分隔符取最早的出现位置，与惰性匹配 .+? 的结果一致
+    // 分隔符都是完整的 UTF-8 字符串，找到的位置一定在字符边界上
+    auto pos {this->m_prefix.size()};
+    auto last {this->m_separators.size() - 1};
+    for (auto&& [i, separator] : std::views::enumerate(this->m_separators))
+    {
+        if (static_cast<std::size_t>(i) == last)
+        {
+            // 最后一个字段延伸到结尾的字面量之前
+            if (line.size() < pos + 1 + separator.size() || !line.ends_with(separator))
+            {
+                return false;
+            }
+            fields[i] = line.substr(pos, line.size() - separator.size() - pos);
+            break;
+        }
+
+        auto end {line.find(separator, pos + 1)};
+        if (end == std::string_view::npos)
+        {
+            return false;
+        }
+        fields[i] = line.substr(pos, end - pos);
+        pos       = end + separator.size();
+    }
+
+    return true;
+}
+
+}    // namespace logtt
@@ -0,0 +1,32 @@
+#pragma once
+
+#include <optional>
+#include <string>
+#include <string_view>
+#include <vector>
+
+namespace logtt
+{
+
+// 简单日志格式的字段切分器
+// 日志格式只由字面分隔符和 (?P<name>.+?) 字段组成时，从左到右依次查找每个分隔符最早的出现位置，
+// 得到的字段与锚定的正则表达式完全相同，不需要运行带多个捕获组的正则
+class FieldSplitter
+{
+public:
+    // 从 parse 库生成的 "^...$" 正则编译切分器，字段名必须与 named_fields 依次相同
+    // 含有对齐、类型、重复字段或相邻字段之间没有分隔符时返回空，此时应使用正则提取
+    static std::optional<FieldSplitter>
+        compile(std::string_view log_regex, const std::vector<std::string>& named_fields);
+
+    // 匹配成功时把每个字段写入 fields 并返回 true，fields 引用 line 中的字符串
+    bool split(std::string_view line, std::vector<std::string_view>& fields) const;
+
+private:
+    // 第一个字段之前的字面量
+    std::string m_prefix;
+    // 每个字段之后的字面量，最后一个是整行结尾的字面量，可以为空
+    std::vector<std::string> m_separators;
+};
+
+}    // namespace logtt
@@ -1,6 +1,8 @@
 #include "jaccard_drain_log_parser.hxx"
 #include "duckdb_service.hxx"
 #include "utils.hxx"
+#include <algorithm>
+#include <limits>
 #include <ranges>
 
 namespace logtt
@@ -32,90 +34,239 @@ std::int32_t JaccardDrainLogParser::parse(
     const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
 )
 {
-    // 初始化前缀树和日志簇池
+    // 初始化前缀树、分片和 token 字典
     this->m_root = std::make_unique<Node>();
-    this->m_cluster_pool.clear();
-    std::vector<LogCluster*> cluster_results;
-    std::vector<std::string> templates;
+    this->m_shards.clear();
+    this->m_token_dict.clear();
+    this->m_template_count = 0;
+
+    return this->parse_incremental(log_file, structured_table_name, templates_table_name, 0);
+}
+
+std::int32_t JaccardDrainLogParser::parse_incremental(
+    const std::string& log_file,
+    const std::string& structured_table_name,
+    const std::string& templates_table_name,
+    std::int64_t       line_offset
+)
+{
     // 获取数据库连接
     auto& conn {get_connection()};
 
     auto rel {load_data(
-        conn, log_file, this->m_log_regex, this->m_named_fields, this->m_timestamp_fields, this->m_timestamp_format
+        conn,
+        log_file,
+        this->m_log_regex,
+        this->m_named_fields,
+        this->m_timestamp_fields,
+        this->m_timestamp_format,
+        line_offset,
+        true
     )};
-    rel = mask_log_rel(rel, this->m_masks);
-    rel = split_log_rel(rel, this->m_delimiters);
+    rel = mask_log_rel(conn, rel, this->m_masks);
+    rel = split_log_rel(conn, rel, this->m_delimiters);
+
+    // 移除多余列
+    auto star_expr {make_uniq<StarExpression>()};
+    star_expr->exclude_list.emplace("MaskedContent");
+
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(std::move(star_expr));
+
+    rel = rel->Project(std::move(project_exprs), {});
+
+    // 边读取边聚类，相同的内容在批内只聚类一次，结果再展开到每一行
+    auto log_length {this->_stream_to_table(
+        conn,
+        rel,
+        line_offset,
+        structured_table_name,
+        templates_table_name,
+        [this](const UniqueContents& batch) -> std::vector<std::uint32_t>
+        {
+            return this->_learn(batch.contents, batch.counts);
+        }
+    )};
+    if (log_length < 0)
+    {
+        return -1;
+    }
 
-    // 缓存分词结果，避免重复计算
-    auto star_expr_1 {make_uniq<StarExpression>()};
-    star_expr_1->exclude_list.emplace("MaskedContent");
+    write_templates(conn, this->_learned_templates(), templates_table_name);
+    return static_cast<std::int32_t>(log_length);
+}
 
-    ParsedExprVec project_exprs_1;
-    project_exprs_1.push_back(std::move(star_expr_1));
+std::int32_t JaccardDrainLogParser::match_learned(
+    const std::string& log_file,
+    const std::string& structured_table_name,
+    const std::string& templates_table_name,
+    bool               learn_unmatched,
+    std::int64_t&      unmatched_count
+)
+{
+    auto matcher {this->_compile_matcher()};
+    return this->_match(
+        log_file, structured_table_name, templates_table_name, matcher, learn_unmatched, unmatched_count
+    );
+}
+
+bool JaccardDrainLogParser::save_snapshot(const std::string& snapshot_file) const
+{
+    SnapshotWriter writer {SnapshotKind::JACCARD_DRAIN};
 
-    rel = rel->Project(std::move(project_exprs_1), {});
+    // 前缀树的形状取决于这些参数，加载时一并恢复
+    writer.write(this->m_depth);
+    writer.write(this->m_children);
+    writer.write(this->m_sim_thr);
+    this->m_token_dict.save(writer);
+    writer.write(this->m_template_count);
 
-    auto ret {get_tmp(conn, rel)};
-    if (!ret)
+    save_prefix_tree(writer, this->m_root.get(), this->m_shards);
+
+    return writer.save(snapshot_file);
+}
+
+bool JaccardDrainLogParser::load_snapshot(const std::string& snapshot_file)
+{
+    SnapshotReader reader {snapshot_file, SnapshotKind::JACCARD_DRAIN};
+
+    // 先恢复到局部变量中，全部读取成功后再替换当前状态
+    std::uint16_t          depth {0};
+    std::uint16_t          children {0};
+    float                  sim_thr {0.0F};
+    TokenDict              token_dict;
+    std::uint32_t          template_count {0};
+    std::unique_ptr<Node>  root;
+    ShardDeque<LogCluster> shards;
+    // 常量 token 集合可以由模板直接算出，不写入快照
+    auto update_token_set {[](LogCluster& cluster) -> void { cluster.update_token_set(); }};
+    if (!reader.read(depth) || !reader.read(children) || !reader.read(sim_thr) || !token_dict.load(reader) ||
+        !reader.read(template_count) || !load_prefix_tree(reader, token_dict, root, shards, update_token_set))
     {
-        return -1;
+        return false;
     }
-    rel = ret.value();
 
-    ParsedExprVec project_exprs_2;
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("Tokens"));
+    this->m_depth          = depth;
+    this->m_children       = children;
+    this->m_sim_thr        = sim_thr;
+    this->m_token_dict     = std::move(token_dict);
+    this->m_template_count = template_count;
+    this->m_root           = std::move(root);
+    this->m_shards         = std::move(shards);
+    return true;
+}
 
-    auto result {to_m_result(rel->Project(std::move(project_exprs_2), {})->Execute())};
-    auto log_length {result->RowCount()};
-    for (auto&& data_chunk : result->Collection().Chunks())
+std::vector<std::uint32_t>
+JaccardDrainLogParser::_learn(const std::vector<TContent>& contents, const std::vector<std::int64_t>& counts)
+{
+    // 沿用已经学习到的前缀树和日志簇，尚未解析过时先初始化
+    if (!this->m_root)
     {
-        const auto& tokens_col {data_chunk.data[0]};
-        const auto& tokens_child {ListVector::GetEntry(tokens_col)};
+        this->m_root = std::make_unique<Node>();
+    }
 
-        const auto* const tokens_data {FlatVector::GetData<list_entry_t>(tokens_col)};
-        const auto* const tokens_child_data {FlatVector::GetData<string_t>(tokens_child)};
+    // 按首个 token 分片后，每个分片独占第 1 层的一棵子树，可以在各自的线程上匹配
+    this->_build_shards(contents);
 
-        for (auto&& row : std::views::iota(0UL, data_chunk.size()))
+    return learn_by_shard(
+        this->m_shards,
+        contents.size(),
+        this->m_template_count,
+        [this, &contents, &counts](std::uint32_t row, Shard& shard) -> LogCluster*
         {
-            TContent    content;
-            const auto& entry {tokens_data[row]};
-            for (auto&& i : std::views::iota(0UL, entry.length))
-            {
-                const auto& token {tokens_child_data[entry.offset + i]};
-                content.emplace_back(token.GetString());
-            }
-            cluster_results.push_back(this->_add_content(content));
+            return this->_add_content(contents[row], counts[row], shard);
         }
-    }
+    );
+}
 
-    templates.reserve(log_length);
-    for (auto&& cluster : cluster_results)
+std::vector<TemplateRecord> JaccardDrainLogParser::_learned_templates()
+{
+    return collect_templates(
+        this->m_shards,
+        [this](LogCluster& cluster) -> const std::string&
+        {
+            return this->_get_template(cluster.content, cluster.log_template);
+        }
+    );
+}
+
+TemplateMatcher JaccardDrainLogParser::_compile_matcher()
+{
+    return compile_matcher(
+        this->m_shards,
+        this->m_template_count,
+        [this](LogCluster& cluster) -> const std::string&
+        {
+            return this->_get_template(cluster.content, cluster.log_template);
+        }
+    );
+}
+
+void JaccardDrainLogParser::_build_shards(const std::vector<TContent>& contents)
+{
+    // 分片和日志簇在多次增量解析之间保留，这里只重新分配本次要处理的行
+    ShardLookup get_shard {this->m_shards};
+
+    // 深度为 1 时所有日志簇都挂在根节点上；首个 token 是字面通配符时，第一层的形状取决于匹配结果
+    // 这两种情况都无法预先划分子树，只能整体作为一个从根节点开始的分片
+    if (this->m_depth == 1 ||
+        std::ranges::any_of(contents, [](const TContent& content) { return !content.empty() && content.front() == WILDCARD; }))
     {
-        templates.push_back(cluster->get_template());
+        auto& shard {this->m_shards[get_shard(this->m_root.get(), 0)]};
+        shard.rows = std::views::iota(0U, static_cast<std::uint32_t>(contents.size())) | std::ranges::to<std::vector>();
+        return;
     }
 
-    // 移除多余列
-    auto star_expr_2 {make_uniq<StarExpression>()};
-    star_expr_2->exclude_list.emplace("Tokens");
-
-    ParsedExprVec project_exprs_3;
-    project_exprs_3.push_back(std::move(star_expr_2));
+    // 第一层最多容纳 m_children - 1 个节点，之后出现的首个 token 全部落入同一个通配符节点
+    // 第一层节点只会在该 token 第一次出现时创建，所以这里按首次出现的顺序预先建好第一层
+    auto&       root_children {this->m_root->children_node};
+    std::size_t max_first_nodes {this->m_children > 0 ? this->m_children - 1UL : 0UL};
+    std::size_t first_node_count {root_children.size() - root_children.count(WILDCARD)};
+    std::unordered_map<Token, std::uint32_t> first_token_shards;
 
-    rel = rel->Project(std::move(project_exprs_3), {});
+    for (auto&& [row, content] : std::views::enumerate(contents))
+    {
+        std::uint32_t shard_idx {0};
+        if (content.empty())
+        {
+            // 空内容不会进入任何子树，只在根节点上匹配
+            shard_idx = get_shard(this->m_root.get(), 0);
+        }
+        else if (auto [it, inserted] {first_token_shards.try_emplace(content.front(), 0)}; !inserted)
+        {
+            shard_idx = it->second;
+        }
+        else if (auto node_it {root_children.find(content.front())}; node_it != root_children.end())
+        {
+            shard_idx = it->second = get_shard(node_it->second.get(), 1);
+        }
+        else if (first_node_count < max_first_nodes)
+        {
+            auto [new_node_it, _] {root_children.emplace(content.front(), std::make_unique<Node>())};
+            shard_idx = it->second = get_shard(new_node_it->second.get(), 1);
+            ++first_node_count;
+        }
+        else
+        {
+            auto [wildcard_node_it, _] {root_children.try_emplace(WILDCARD, std::make_unique<Node>())};
+            shard_idx = it->second = get_shard(wildcard_node_it->second.get(), 1);
+        }
 
-    to_table(conn, rel, templates, structured_table_name, templates_table_name);
-    return static_cast<std::int32_t>(log_length);
+        this->m_shards[shard_idx].rows.push_back(static_cast<std::uint32_t>(row));
+    }
 }
 
-JaccardDrainLogParser::LogCluster* JaccardDrainLogParser::_add_content(const TContent& content)
+JaccardDrainLogParser::LogCluster*
+JaccardDrainLogParser::_add_content(const TContent& content, std::int64_t count, Shard& shard)
 {
-    auto* match_cluster {this->_tree_search(content)};
+    auto* match_cluster {this->_tree_search(content, shard)};
 
     if (match_cluster == nullptr)
     {
-        this->m_cluster_pool.emplace_back(content);
-        match_cluster = &this->m_cluster_pool.back();
-        this->_add_to_prefix_tree(match_cluster);
+        shard.cluster_pool.emplace_back(content);
+        match_cluster = &shard.cluster_pool.back();
+        match_cluster->update_token_set();
+        this->_add_to_prefix_tree(match_cluster, shard);
     }
     else
     {
@@ -123,20 +274,25 @@ JaccardDrainLogParser::LogCluster* JaccardDrainLogParser::_add_content(const TCo
         if (new_content != match_cluster->content)
         {
             match_cluster->content = std::move(new_content);
+            match_cluster->log_template.reset();
+            match_cluster->update_token_set();
         }
     }
+    match_cluster->count += count;
 
     return match_cluster;
 }
 
-JaccardDrainLogParser::LogCluster* JaccardDrainLogParser::_tree_search(const TContent& content, bool include_params)
+JaccardDrainLogParser::LogCluster*
+JaccardDrainLogParser::_tree_search(const TContent& content, const Shard& shard, bool include_params)
 {
     auto  length {content.size()};
-    auto* cur_node {this->m_root.get()};
+    auto* cur_node {shard.node};
 
-    for (auto&& [i, token] : std::views::enumerate(content))
+    // 分片节点已经消耗了前 shard.depth 个 token
+    for (auto&& [i, token] : std::views::enumerate(content | std::views::drop(shard.depth)))
     {
-        auto cur_node_depth {i + 1};
+        auto cur_node_depth {i + 1 + shard.depth};
 
         if (cur_node_depth == this->m_depth || std::cmp_equal(cur_node_depth, length + 1))
         {
@@ -168,10 +324,13 @@ JaccardDrainLogParser::_fast_match(const TContent& content, const Node* node, bo
     std::uint16_t max_param_count {0};
     LogCluster*   max_cluster {nullptr};
 
+    // content 的有序去重 token 集合，与节点下的所有簇比较时共用
+    auto content_set {JaccardDrainLogParser::_to_token_set(content)};
+
     for (auto&& cluster : node->clusters)
     {
         auto [cur_sim, param_count] {
-            logtt::JaccardDrainLogParser::_get_distance(content, cluster->content, include_params)
+            this->_get_distance(content, content_set, cluster, include_params, max_sim, max_param_count)
         };
         if (cur_sim > max_sim || (cur_sim == max_sim && param_count > max_param_count))
         {
@@ -189,14 +348,14 @@ JaccardDrainLogParser::_fast_match(const TContent& content, const Node* node, bo
     return nullptr;
 }
 
-void JaccardDrainLogParser::_add_to_prefix_tree(LogCluster* cluster)
+void JaccardDrainLogParser::_add_to_prefix_tree(LogCluster* cluster, Shard& shard)
 {
     auto  length {cluster->content.size()};
-    auto* cur_node {this->m_root.get()};
+    auto* cur_node {shard.node};
 
-    for (auto&& [i, token] : std::views::enumerate(cluster->content))
+    for (auto&& [i, token] : std::views::enumerate(cluster->content | std::views::drop(shard.depth)))
     {
-        auto cur_node_depth {i + 1};
+        auto cur_node_depth {i + 1 + shard.depth};
 
         if (cur_node_depth == this->m_depth || std::cmp_equal(cur_node_depth, length + 1))
         {
@@ -231,87 +390,118 @@ void JaccardDrainLogParser::_add_to_prefix_tree(LogCluster* cluster)
     }
 }
 
-std::pair<float, std::uint16_t>
-JaccardDrainLogParser::_get_distance(const TContent& content1, const TContent& content2, bool include_params)
+std::pair<float, std::uint16_t> JaccardDrainLogParser::_get_distance(
+    const TContent&   content,
+    const TContent&   content_set,
+    const LogCluster* cluster,
+    bool              include_params,
+    float             max_sim,
+    std::uint16_t     max_param_count
+) const
 {
-    // content1 是原始日志内容，content2 是模板内容
-    if (content1.empty())
+    // content 是原始日志内容，cluster 是模板
+    if (content.empty())
     {
         return {1.0F, 0};
     }
 
-    std::uint16_t param_count {0};
-    for (auto&& token : content2)
-    {
-        if (token == WILDCARD)
-        {
-            ++param_count;
-        }
-    }
+    auto param_count {cluster->param_count};
 
-    TContent filtered_content1;
-    TContent filtered_content2;
+    const auto* set1 {&content_set};
+    const auto* set2 {&cluster->token_set};
+    TContent    filtered_set1;
+    TContent    filtered_set2;
 
-    if (include_params && content1.size() == content2.size() && param_count > 0)
+    if (include_params && content.size() == cluster->content.size() && param_count > 0)
     {
-        filtered_content1.reserve(content1.size() - param_count);
-        filtered_content2.reserve(content2.size() - param_count);
+        filtered_set1.reserve(content.size() - param_count);
+        filtered_set2.reserve(content.size() - param_count);
 
-        for (auto&& [token1, token2] : std::views::zip(content1, content2))
+        for (auto&& [token1, token2] : std::views::zip(content, cluster->content))
         {
             if (token2 == WILDCARD)
             {
                 continue;
             }
 
-            filtered_content1.push_back(token1);
-            filtered_content2.push_back(token2);
+            filtered_set1.push_back(token1);
+            filtered_set2.push_back(token2);
         }
+
+        filtered_set1 = JaccardDrainLogParser::_to_token_set(filtered_set1);
+        filtered_set2 = JaccardDrainLogParser::_to_token_set(filtered_set2);
+        set1          = &filtered_set1;
+        set2          = &filtered_set2;
     }
-    else
-    {
-        filtered_content1 = content1;
-        filtered_content2.reserve(content2.size());
 
-        for (auto&& token : content2)
-        {
-            if (token != WILDCARD)
-            {
-                filtered_content2.push_back(token);
-            }
-        }
+    // 只有超过阈值、并且能在比较规则下胜过当前最优的相似度才有意义
+    // 相似度随交集大小单调递增，由此得到交集大小的下限，合并求交时一旦达不到就提前结束
+    auto is_useful {[&](float sim)
+    {
+        return sim > this->m_sim_thr && (sim > max_sim || (sim == max_sim && param_count > max_param_count));
+    }};
+    auto size1 {set1->size()};
+    auto size2 {set2->size()};
+    auto max_inter {std::min(size1, size2)};
+
+    constexpr auto USELESS_SIM {-std::numeric_limits<float>::infinity()};
+    if (!is_useful(JaccardDrainLogParser::_to_sim(max_inter, size1, size2)))
+    {
+        return {USELESS_SIM, param_count};
     }
 
-    std::unordered_set<Token> set1 {filtered_content1.begin(), filtered_content1.end()};
-    std::unordered_set<Token> set2 {filtered_content2.begin(), filtered_content2.end()};
-    std::uint32_t             inter_size {0};
+    auto min_inter {*std::ranges::partition_point(
+        std::views::iota(0UL, max_inter + 1),
+        [&](std::size_t inter) { return !is_useful(JaccardDrainLogParser::_to_sim(inter, size1, size2)); }
+    )};
 
-    if (set1.size() <= set2.size())
+    std::size_t inter {0};
+    for (std::size_t i {0}, j {0}; i < size1 && j < size2;)
     {
-        for (auto&& token : set1)
+        if (inter + std::min(size1 - i, size2 - j) < min_inter)
         {
-            if (set2.contains(token))
-            {
-                ++inter_size;
-            }
+            return {USELESS_SIM, param_count};
         }
-    }
-    else
-    {
-        for (auto&& token : set2)
+
+        if ((*set1)[i] < (*set2)[j])
         {
-            if (set1.contains(token))
-            {
-                ++inter_size;
-            }
+            ++i;
+        }
+        else if ((*set2)[j] < (*set1)[i])
+        {
+            ++j;
         }
+        else
+        {
+            ++inter;
+            ++i;
+            ++j;
+        }
+    }
+
+    if (inter < min_inter)
+    {
+        return {USELESS_SIM, param_count};
     }
 
-    auto union_size {set1.size() + set2.size() - inter_size};
+    return {JaccardDrainLogParser::_to_sim(inter, size1, size2), param_count};
+}
+
+float JaccardDrainLogParser::_to_sim(std::size_t inter_size, std::size_t size1, std::size_t size2)
+{
+    auto union_size {size1 + size2 - inter_size};
     auto sim {union_size == 0 ? 1.0F : static_cast<float>(inter_size) / static_cast<float>(union_size)};
 
-    sim = std::min(sim * 1.3F, 1.0F);
-    return {sim, param_count};
+    return std::min(sim * 1.3F, 1.0F);
+}
+
+TContent JaccardDrainLogParser::_to_token_set(const TContent& content)
+{
+    auto token_set {content};
+    std::ranges::sort(token_set);
+    auto [first, last] {std::ranges::unique(token_set)};
+    token_set.erase(first, last);
+    return token_set;
 }
 
 TContent JaccardDrainLogParser::_create_template(const TContent& content1, const TContent& content2)
@@ -359,9 +549,15 @@ TContent JaccardDrainLogParser::_create_template(const TContent& content1, const
     return new_content;
 }
 
-std::string JaccardDrainLogParser::LogCluster::get_template() const
+void JaccardDrainLogParser::LogCluster::update_token_set()
 {
-    return this->content | std::views::join_with(' ') | std::ranges::to<std::string>();
+    // 模板中的通配符不参与 Jaccard 计算，WILDCARD 是最小的 ID，去重后只会出现在开头
+    token_set = JaccardDrainLogParser::_to_token_set(content);
+    if (!token_set.empty() && token_set.front() == WILDCARD)
+    {
+        token_set.erase(token_set.begin());
+    }
+    param_count = static_cast<std::uint16_t>(std::ranges::count(content, WILDCARD));
 }
 
 }    // namespace logtt
@@ -0,0 +1,303 @@
+#include "line_reader.hxx"
+#include <algorithm>
+#include <atomic>
+#include <cerrno>
+#include <cstring>
+#include <fcntl.h>
+#include <format>
+#include <limits>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+namespace logtt
+{
+
+namespace
+{
+
+constexpr std::string_view FUNCTION_NAME {"read_log_lines"};
+// 每个字节区间的目标大小，实际的区间会延伸到其后第一个换行符之后
+constexpr std::size_t RANGE_BYTES {8UL << 20};
+constexpr std::size_t NO_RANGE {std::numeric_limits<std::size_t>::max()};
+
+// 只读映射到内存中的文件，空文件不做映射
+class MappedFile
+{
+public:
+    explicit MappedFile(const std::string& path)
+    {
+        auto fd {open(path.c_str(), O_RDONLY)};
+        if (fd < 0)
+        {
+            throw IOException(std::format("Cannot open file \"{}\": {}", path, std::strerror(errno)));
+        }
+
+        struct stat file_stat {};
+        if (fstat(fd, &file_stat) == 0 && file_stat.st_size > 0)
+        {
+            auto* data {mmap(nullptr, file_stat.st_size, PROT_READ, MAP_PRIVATE, fd, 0)};
+            if (data != MAP_FAILED)
+            {
+                madvise(data, file_stat.st_size, MADV_SEQUENTIAL);
+                this->m_data = static_cast<const char*>(data);
+                this->m_size = static_cast<std::size_t>(file_stat.st_size);
+            }
+        }
+        auto error {errno};
+        close(fd);
+
+        if (file_stat.st_size > 0 && this->m_data == nullptr)
+        {
+            throw IOException(std::format("Cannot map file \"{}\": {}", path, std::strerror(error)));
+        }
+    }
+
+    MappedFile(const MappedFile&)            = delete;
+    MappedFile& operator=(const MappedFile&) = delete;
+
+    ~MappedFile()
+    {
+        if (this->m_data != nullptr)
+        {
+            munmap(const_cast<char*>(this->m_data), this->m_size);
+        }
+    }
+
+    [[nodiscard]]
+    std::string_view text() const
+    {
+        return {this->m_data, this->m_size};
+    }
+
+private:
+    const char* m_data {nullptr};
+    std::size_t m_size {0};
+};
+
+// 文件中的一个字节区间，除最后一个区间外都以换行符结尾
+struct LineRange
+{
+    std::size_t  begin;
+    std::size_t  end;
+    std::int64_t first_line_id {0};
+    std::int64_t line_count {0};
+};
+
+struct LineReaderBindData: public TableFunctionData
+{
+    std::string  path;
+    std::int64_t skip {0};
+    bool         complete_lines {false};
+
+    [[nodiscard]]
+    unique_ptr<FunctionData> Copy() const override
+    {
+        return make_uniq<LineReaderBindData>(*this);
+    }
+
+    [[nodiscard]]
+    bool Equals(const FunctionData& other) const override
+    {
+        const auto& other_data {other.Cast<LineReaderBindData>()};
+        return this->path == other_data.path && this->skip == other_data.skip &&
+               this->complete_lines == other_data.complete_lines;
+    }
+};
+
+struct LineReaderGlobalState: public GlobalTableFunctionState
+{
+    explicit LineReaderGlobalState(const std::string& path):
+        file {path}
+    {}
+
+    [[nodiscard]]
+    idx_t MaxThreads() const override
+    {
+        return std::max<idx_t>(this->ranges.size(), 1);
+    }
+
+    MappedFile               file;
+    std::vector<LineRange>   ranges;
+    std::atomic<std::size_t> next_range {0};
+};
+
+struct LineReaderLocalState: public LocalTableFunctionState
+{
+    // 正在扫描的区间，同时作为输出块的批次号，使下游能按区间顺序还原行的顺序
+    std::size_t  range {NO_RANGE};
+    std::size_t  pos {0};
+    std::int64_t line_id {0};
+};
+
+unique_ptr<FunctionData> _bind(
+    [[maybe_unused]] ClientContext& context,
+    TableFunctionBindInput&         input,
+    vector<LogicalType>&            return_types,
+    vector<string>&                 names
+)
+{
+    auto bind_data {make_uniq<LineReaderBindData>()};
+    bind_data->path = input.inputs[0].GetValue<std::string>();
+    if (auto it {input.named_parameters.find("skip")}; it != input.named_parameters.end())
+    {
+        bind_data->skip = it->second.GetValue<std::int64_t>();
+    }
+    if (auto it {input.named_parameters.find("complete_lines")}; it != input.named_parameters.end())
+    {
+        bind_data->complete_lines = it->second.GetValue<bool>();
+    }
+
+    return_types = {LogicalType::BIGINT, LogicalType::BIGINT, LogicalType::VARCHAR};
+    names        = {"LineID", "ByteOffset", "_raw"};
+    return bind_data;
+}
+
+unique_ptr<GlobalTableFunctionState>
+_init_global([[maybe_unused]] ClientContext& context, TableFunctionInitInput& input)
+{
+    const auto& bind_data {input.bind_data->Cast<LineReaderBindData>()};
+    auto        state {make_uniq<LineReaderGlobalState>(bind_data.path)};
+    auto        text {state->file.text()};
+
+    // 只读取完整的行时，区间在最后一个换行符之后结束，没有换行符时整个文件都不读取
+    if (bind_data.complete_lines)
+    {
+        text = text.substr(0, text.rfind('\n') + 1);
+    }
+
+    // 按目标大小切分，区间的结尾对齐到换行符之后，一行不会被拆到两个区间中
+    std::size_t begin {0};
+    while (begin < text.size())
+    {
+        auto end {std::min(begin + RANGE_BYTES, text.size())};
+        if (end < text.size())
+        {
+            auto newline {text.find('\n', end - 1)};
+            end = newline == std::string_view::npos ? text.size() : newline + 1;
+        }
+        state->ranges.push_back({begin, end});
+        begin = end;
+    }
+
+    // 并行统计每个区间的行数，std::ranges::count 会被编译成向量化的字节比较
+    // 只有最后一个区间可能没有结尾的换行符，此时最后一行也要计入
+    auto& ranges {state->ranges};
+#pragma omp parallel for schedule(dynamic, 1)
+    for (std::size_t i = 0; i < ranges.size(); ++i)
+    {
+        auto range_text {text.substr(ranges[i].begin, ranges[i].end - ranges[i].begin)};
+        ranges[i].line_count = std::ranges::count(range_text, '\n') + (range_text.back() != '\n' ? 1 : 0);
+    }
+
+    // 行数的前缀和就是每个区间第一行的 LineID
+    std::int64_t line_id {1};
+    for (auto&& range : ranges)
+    {
+        range.first_line_id = line_id;
+        line_id += range.line_count;
+    }
+
+    return state;
+}
+
+unique_ptr<LocalTableFunctionState> _init_local(
+    [[maybe_unused]] ExecutionContext&         context,
+    [[maybe_unused]] TableFunctionInitInput&   input,
+    [[maybe_unused]] GlobalTableFunctionState* global_state
+)
+{
+    return make_uniq<LineReaderLocalState>();
+}
+
+void _scan([[maybe_unused]] ClientContext& context, TableFunctionInput& input, DataChunk& output)
+{
+    const auto& bind_data {input.bind_data->Cast<LineReaderBindData>()};
+    auto&       global_state {input.global_state->Cast<LineReaderGlobalState>()};
+    auto&       local_state {input.local_state->Cast<LineReaderLocalState>()};
+    auto        text {global_state.file.text()};
+
+    // 当前区间读完后领取下一个区间，整个区间都在 skip 之内时直接跳过
+    // 一个输出块只包含同一个区间的行，保证批次号与区间一一对应
+    while (local_state.range == NO_RANGE || local_state.pos == global_state.ranges[local_state.range].end)
+    {
+        auto next {global_state.next_range.fetch_add(1)};
+        if (next >= global_state.ranges.size())
+        {
+            output.SetCardinality(0);
+            return;
+        }
+
+        const auto& range {global_state.ranges[next]};
+        if (range.first_line_id + range.line_count - 1 <= bind_data.skip)
+        {
+            continue;
+        }
+        local_state.range   = next;
+        local_state.pos     = range.begin;
+        local_state.line_id = range.first_line_id;
+    }
+
+    auto* line_id_data {FlatVector::GetData<std::int64_t>(output.data[0])};
+    auto* byte_offset_data {FlatVector::GetData<std::int64_t>(output.data[1])};
+    auto* raw_data {FlatVector::GetData<string_t>(output.data[2])};
+
+    const auto& range {global_state.ranges[local_state.range]};
+    idx_t       count {0};
+    while (count < STANDARD_VECTOR_SIZE && local_state.pos < range.end)
+    {
+        // 区间内的换行符查找由 memchr 完成；最后一个区间的最后一行可能没有换行符
+        auto line_end {std::min(text.find('\n', local_state.pos), range.end)};
+        auto next_pos {std::min(line_end + 1, range.end)};
+
+        if (local_state.line_id > bind_data.skip)
+        {
+            auto line {text.substr(local_state.pos, line_end - local_state.pos)};
+            if (!Value::StringIsValid(line.data(), line.size()))
+            {
+                throw InvalidInputException(
+                    std::format("Invalid UTF-8 in line {} of file \"{}\"", local_state.line_id, bind_data.path)
+                );
+            }
+
+            line_id_data[count]     = local_state.line_id;
+            byte_offset_data[count] = static_cast<std::int64_t>(local_state.pos);
+            raw_data[count]         = StringVector::AddString(output.data[2], line.data(), line.size());
+            ++count;
+        }
+
+        ++local_state.line_id;
+        local_state.pos = next_pos;
+    }
+
+    output.SetCardinality(count);
+}
+
+OperatorPartitionData
+_get_partition_data([[maybe_unused]] ClientContext& context, TableFunctionGetPartitionInput& input)
+{
+    return OperatorPartitionData {input.local_state->Cast<LineReaderLocalState>().range};
+}
+
+}    // namespace
+
+void register_line_reader(DuckDB& db)
+{
+    TableFunction function {
+        std::string {FUNCTION_NAME},
+        {LogicalType::VARCHAR},
+        _scan,
+        _bind,
+        _init_global,
+        _init_local,
+    };
+    function.named_parameters["skip"]           = LogicalType::BIGINT;
+    function.named_parameters["complete_lines"] = LogicalType::BOOLEAN;
+    function.get_partition_data                 = _get_partition_data;
+
+    CreateTableFunctionInfo info {std::move(function)};
+    Connection              conn {db};
+    conn.context->RegisterFunction(info);
+}
+
+}    // namespace logtt
@@ -0,0 +1,16 @@
+#pragma once
+
+#include "precomp.hxx"
+
+namespace logtt
+{
+
+// 注册按行读取日志文件的表函数 read_log_lines(path, skip := 0, complete_lines := false)
+// 返回 LineID、ByteOffset、_raw 三列
+// 文件以内存映射的方式打开，按换行符对齐切分成若干字节区间，各区间由多个线程并行扫描
+// LineID 由各区间行数的前缀和得到，与物理行号一致；ByteOffset 是行首在文件中的字节偏移
+// 行内容原样保留（包括空行和任何控制字符），只跳过 LineID 不大于 skip 的行
+// complete_lines 为真时不读取结尾没有换行符的最后一行，它可能还在写入中，等换行符写入后再由下一次读取得到
+void register_line_reader(DuckDB& db);
+
+}    // namespace logtt
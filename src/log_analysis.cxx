@@ -5,6 +5,32 @@
 namespace logtt
 {
 
+namespace
+{
+
+// 相邻两行都匹配到模板时才算一次转移：LEAD 在全部行上计算，之后再去掉当前行或下一行未匹配的转移
+// 匹配模式下未匹配到模板的行 TemplateID 为 NULL；最后一行没有下一行，next_id 为默认值 -1
+unique_ptr<ParsedExpression> _matched_transition_expr()
+{
+    ParsedExprVec exprs;
+    exprs.push_back(
+        make_uniq<OperatorExpression>(ExpressionType::OPERATOR_IS_NOT_NULL, make_uniq<ColumnRefExpression>("curr_id"))
+    );
+    exprs.push_back(
+        make_uniq<OperatorExpression>(ExpressionType::OPERATOR_IS_NOT_NULL, make_uniq<ColumnRefExpression>("next_id"))
+    );
+    exprs.push_back(
+        make_uniq<ComparisonExpression>(
+            ExpressionType::COMPARE_NOTEQUAL,
+            make_uniq<ColumnRefExpression>("next_id"),
+            make_uniq<ConstantExpression>(Value::BIGINT(-1))
+        )
+    );
+    return make_uniq<ConjunctionExpression>(ExpressionType::CONJUNCTION_AND, std::move(exprs));
+}
+
+}    // namespace
+
 std::pair<std::vector<std::string>, std::vector<std::int64_t>>
 get_level_distribution(const std::string& structured_table_name)
 {
@@ -87,7 +113,7 @@ std::pair<std::vector<std::int64_t>, std::vector<std::int64_t>> get_template_fre
     func_expr_1->SetAlias("Timestamp_bucket");
 
     ParsedExprVec arg_exprs_2;
-    arg_exprs_2.push_back(make_uniq<ColumnRefExpression>("Template"));
+    arg_exprs_2.push_back(make_uniq<ColumnRefExpression>("TemplateID"));
 
     auto func_expr_2 {make_uniq<FunctionExpression>("count", std::move(arg_exprs_2))};
     func_expr_2->distinct = true;
@@ -179,20 +205,14 @@ get_template_transition_matrix(const std::string& structured_table_name, const s
 
     auto template_count {get_rel_row_count(t_rel)};
 
-    ParsedExprVec arg_exprs;
-    arg_exprs.push_back(
-        make_uniq<ComparisonExpression>(
-            ExpressionType::COMPARE_EQUAL,
-            make_uniq<ColumnRefExpression>("Template", structured_table_name),
-            make_uniq<ColumnRefExpression>("Template", template_table_name)
-        )
-    );
-
-    auto col_expr {make_uniq<ColumnRefExpression>("rowid", template_table_name)};
+    // TemplateID 从 0 开始连续编号，可以直接作为矩阵下标，无需连接模板表
+    auto col_expr {make_uniq<CastExpression>(LogicalType::BIGINT, make_uniq<ColumnRefExpression>("TemplateID"))};
     col_expr->SetAlias("curr_id");
 
     auto window_expr {make_uniq<WindowExpression>(ExpressionType::WINDOW_LEAD, "", "", "lead")};
-    window_expr->children.push_back(make_uniq<ColumnRefExpression>("rowid", template_table_name));
+    window_expr->children.push_back(
+        make_uniq<CastExpression>(LogicalType::BIGINT, make_uniq<ColumnRefExpression>("TemplateID"))
+    );
     window_expr->orders.emplace_back(
         OrderType::ASCENDING, OrderByNullType::INVALID, make_uniq<ColumnRefExpression>("LineID")
     );
@@ -210,15 +230,8 @@ get_template_transition_matrix(const std::string& structured_table_name, const s
     project_exprs_2.push_back(make_uniq<ColumnRefExpression>("next_id"));
     project_exprs_2.push_back(make_uniq<FunctionExpression>("count", ParsedExprVec {}));
 
-    auto rel {s_rel->Join(t_rel, std::move(arg_exprs))
-                  ->Project(std::move(project_exprs_1), {})
-                  ->Filter(
-                      make_uniq<ComparisonExpression>(
-                          ExpressionType::COMPARE_NOTEQUAL,
-                          make_uniq<ColumnRefExpression>("next_id"),
-                          make_uniq<ConstantExpression>(Value::BIGINT(-1))
-                      )
-                  )
+    auto rel {s_rel->Project(std::move(project_exprs_1), {})
+                  ->Filter(_matched_transition_expr())
                   ->Aggregate(std::move(project_exprs_2), "curr_id, next_id")};
 
     auto                              result {to_m_result(rel->Execute())};
@@ -261,27 +274,18 @@ std::pair<std::vector<std::vector<std::int64_t>>, std::int64_t> get_template_coo
     auto template_count {get_rel_row_count(t_rel)};
 
     ParsedExprVec arg_exprs_1;
-    arg_exprs_1.push_back(
-        make_uniq<ComparisonExpression>(
-            ExpressionType::COMPARE_EQUAL,
-            make_uniq<ColumnRefExpression>("Template", structured_table_name),
-            make_uniq<ColumnRefExpression>("Template", template_table_name)
-        )
-    );
-
-    ParsedExprVec arg_exprs_2;
-    arg_exprs_2.push_back(make_uniq<ConstantExpression>(Value::INTERVAL(months, days, micros)));
-    arg_exprs_2.push_back(make_uniq<ColumnRefExpression>("Timestamp"));
+    arg_exprs_1.push_back(make_uniq<ConstantExpression>(Value::INTERVAL(months, days, micros)));
+    arg_exprs_1.push_back(make_uniq<ColumnRefExpression>("Timestamp"));
 
-    auto func_expr {make_uniq<FunctionExpression>("time_bucket", std::move(arg_exprs_2))};
+    auto func_expr {make_uniq<FunctionExpression>("time_bucket", std::move(arg_exprs_1))};
     func_expr->SetAlias("Timestamp_bucket");
 
     ParsedExprVec project_exprs_1;
     project_exprs_1.push_back(std::move(func_expr));
-    project_exprs_1.push_back(make_uniq<ColumnRefExpression>("rowid", template_table_name));
+    project_exprs_1.push_back(make_uniq<ColumnRefExpression>("TemplateID"));
 
-    ParsedExprVec arg_exprs_3;
-    arg_exprs_3.push_back(
+    ParsedExprVec arg_exprs_2;
+    arg_exprs_2.push_back(
         make_uniq<ConjunctionExpression>(
             ExpressionType::CONJUNCTION_AND,
             make_uniq<ComparisonExpression>(
@@ -291,23 +295,29 @@ std::pair<std::vector<std::vector<std::int64_t>>, std::int64_t> get_template_coo
             ),
             make_uniq<ComparisonExpression>(
                 ExpressionType::COMPARE_LESSTHAN,
-                make_uniq<ColumnRefExpression>("rowid", "a"),
-                make_uniq<ColumnRefExpression>("rowid", "b")
+                make_uniq<ColumnRefExpression>("TemplateID", "a"),
+                make_uniq<ColumnRefExpression>("TemplateID", "b")
             )
         )
     );
 
     ParsedExprVec project_exprs_2;
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("rowid", "a"));
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("rowid", "b"));
+    project_exprs_2.push_back(
+        make_uniq<CastExpression>(LogicalType::BIGINT, make_uniq<ColumnRefExpression>("TemplateID", "a"))
+    );
+    project_exprs_2.push_back(
+        make_uniq<CastExpression>(LogicalType::BIGINT, make_uniq<ColumnRefExpression>("TemplateID", "b"))
+    );
     project_exprs_2.push_back(make_uniq<FunctionExpression>("count", ParsedExprVec {}));
 
-    auto dedup {s_rel->Join(t_rel, std::move(arg_exprs_1))->Project(std::move(project_exprs_1), {})->Distinct()};
+    auto dedup {s_rel->Project(std::move(project_exprs_1), {})->Distinct()};
 
     auto a_rel {dedup->Alias("a")};
     auto b_rel {dedup->Alias("b")};
 
-    auto rel {a_rel->Join(b_rel, std::move(arg_exprs_3))->Aggregate(std::move(project_exprs_2), "a.rowid, b.rowid")};
+    auto rel {
+        a_rel->Join(b_rel, std::move(arg_exprs_2))->Aggregate(std::move(project_exprs_2), "a.TemplateID, b.TemplateID")
+    };
 
     auto                              result {to_m_result(rel->Execute())};
     std::vector<std::vector<int64_t>> cooccurrence_counts;
@@ -343,20 +353,13 @@ get_template_avg_time_matrix(const std::string& structured_table_name, const std
 
     auto template_count {get_rel_row_count(t_rel)};
 
-    ParsedExprVec arg_exprs_1;
-    arg_exprs_1.push_back(
-        make_uniq<ComparisonExpression>(
-            ExpressionType::COMPARE_EQUAL,
-            make_uniq<ColumnRefExpression>("Template", structured_table_name),
-            make_uniq<ColumnRefExpression>("Template", template_table_name)
-        )
-    );
-
-    auto col_expr_1 {make_uniq<ColumnRefExpression>("rowid", template_table_name)};
+    auto col_expr_1 {make_uniq<CastExpression>(LogicalType::BIGINT, make_uniq<ColumnRefExpression>("TemplateID"))};
     col_expr_1->SetAlias("curr_id");
 
     auto window_expr_1 {make_uniq<WindowExpression>(ExpressionType::WINDOW_LEAD, "", "", "lead")};
-    window_expr_1->children.push_back(make_uniq<ColumnRefExpression>("rowid", template_table_name));
+    window_expr_1->children.push_back(
+        make_uniq<CastExpression>(LogicalType::BIGINT, make_uniq<ColumnRefExpression>("TemplateID"))
+    );
     window_expr_1->orders.emplace_back(
         OrderType::ASCENDING, OrderByNullType::INVALID, make_uniq<ColumnRefExpression>("LineID")
     );
@@ -383,27 +386,20 @@ get_template_avg_time_matrix(const std::string& structured_table_name, const std
     project_exprs_1.push_back(std::move(col_expr_2));
     project_exprs_1.push_back(std::move(window_expr_2));
 
-    ParsedExprVec arg_exprs_2;
-    arg_exprs_2.push_back(make_uniq<ColumnRefExpression>("next_timestamp"));
-    arg_exprs_2.push_back(make_uniq<ColumnRefExpression>("curr_timestamp"));
+    ParsedExprVec arg_exprs_1;
+    arg_exprs_1.push_back(make_uniq<ColumnRefExpression>("next_timestamp"));
+    arg_exprs_1.push_back(make_uniq<ColumnRefExpression>("curr_timestamp"));
 
-    ParsedExprVec arg_exprs_3;
-    arg_exprs_3.push_back(make_uniq<FunctionExpression>("subtract", std::move(arg_exprs_2)));
+    ParsedExprVec arg_exprs_2;
+    arg_exprs_2.push_back(make_uniq<FunctionExpression>("subtract", std::move(arg_exprs_1)));
 
     ParsedExprVec project_exprs_2;
     project_exprs_2.push_back(make_uniq<ColumnRefExpression>("curr_id"));
     project_exprs_2.push_back(make_uniq<ColumnRefExpression>("next_id"));
-    project_exprs_2.push_back(make_uniq<FunctionExpression>("avg", std::move(arg_exprs_3)));
-
-    auto rel {s_rel->Join(t_rel, std::move(arg_exprs_1))
-                  ->Project(std::move(project_exprs_1), {})
-                  ->Filter(
-                      make_uniq<ComparisonExpression>(
-                          ExpressionType::COMPARE_NOTEQUAL,
-                          make_uniq<ColumnRefExpression>("next_id"),
-                          make_uniq<ConstantExpression>(Value::BIGINT(-1))
-                      )
-                  )
+    project_exprs_2.push_back(make_uniq<FunctionExpression>("avg", std::move(arg_exprs_2)));
+
+    auto rel {s_rel->Project(std::move(project_exprs_1), {})
+                  ->Filter(_matched_transition_expr())
                   ->Aggregate(std::move(project_exprs_2), "curr_id, next_id")};
 
     auto                                   result {to_m_result(rel->Execute())};
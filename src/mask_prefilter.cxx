@@ -0,0 +1,296 @@
+#include "mask_prefilter.hxx"
+#include <algorithm>
+#include <cctype>
+#include <optional>
+#include <ranges>
+#include <string>
+
+namespace logtt
+{
+
+namespace
+{
+
+using CharSet = MaskPrefilter::CharSet;
+
+CharSet _char_range(unsigned char first, unsigned char last)
+{
+    CharSet chars;
+    for (auto&& c : std::views::iota(first, static_cast<unsigned char>(last + 1)))
+    {
+        chars.set(c);
+    }
+    return chars;
+}
+
+CharSet _chars(std::string_view str)
+{
+    CharSet chars;
+    for (auto&& c : str)
+    {
+        chars.set(static_cast<unsigned char>(c));
+    }
+    return chars;
+}
+
+// 跳过从 pos 开始的字符类 [...]，返回其后的位置，不完整时返回 npos
+std::size_t _skip_class(std::string_view regex, std::size_t pos)
+{
+    ++pos;
+    if (pos < regex.size() && regex[pos] == '^')
+    {
+        ++pos;
+    }
+    // 紧跟在开头的 ] 是普通字符
+    if (pos < regex.size() && regex[pos] == ']')
+    {
+        ++pos;
+    }
+
+    while (pos < regex.size())
+    {
+        if (regex[pos] == '\\')
+        {
+            pos += 2;
+        }
+        else if (regex.substr(pos).starts_with("[:"))
+        {
+            auto end {regex.find(":]", pos + 2)};
+            if (end == std::string_view::npos)
+            {
+                return end;
+            }
+            pos = end + 2;
+        }
+        else if (regex[pos] == ']')
+        {
+            return pos + 1;
+        }
+        else
+        {
+            ++pos;
+        }
+    }
+
+    return std::string_view::npos;
+}
+
+// 跳过从 pos 开始的分组 (...)，返回其后的位置，不完整时返回 npos
+std::size_t _skip_group(std::string_view regex, std::size_t pos)
+{
+    std::size_t depth {0};
+    while (pos < regex.size())
+    {
+        switch (regex[pos])
+        {
+        case '\\':
+            pos += 2;
+            break;
+        case '[':
+            pos = _skip_class(regex, pos);
+            break;
+        case '(':
+            ++depth;
+            ++pos;
+            break;
+        case ')':
+            ++pos;
+            if (--depth == 0)
+            {
+                return pos;
+            }
+            break;
+        default:
+            ++pos;
+        }
+    }
+
+    return std::string_view::npos;
+}
+
+// 返回 regex 的任何匹配中都必须出现的字符条件，每个字符集合中至少有一个字符出现在匹配里
+// 只分析最外层不可省略的原子；含有最外层 |、影响后续原子的修饰符或无法识别的转义时返回 nullopt
+std::optional<std::vector<CharSet>> _required_chars(std::string_view regex)
+{
+    static const CharSet DIGITS {_char_range('0', '9')};
+    static const CharSet WORDS {DIGITS | _char_range('A', 'Z') | _char_range('a', 'z') | _chars("_")};
+    static const CharSet SPACES {_chars(" \t\n\v\f\r")};
+
+    std::vector<CharSet> required;
+    std::size_t          pos {0};
+    while (pos < regex.size())
+    {
+        std::optional<CharSet> atom;
+        auto                   c {static_cast<unsigned char>(regex[pos])};
+        switch (c)
+        {
+        case '|':
+            return std::nullopt;
+        case '(':
+            // (?i) 这类修饰符会改变之后所有原子的含义
+            if (regex.substr(pos).starts_with("(?"))
+            {
+                auto flags_end {regex.find_first_not_of("imsU-", pos + 2)};
+                if (flags_end != std::string_view::npos && flags_end > pos + 2 && regex[flags_end] == ')')
+                {
+                    return std::nullopt;
+                }
+            }
+            pos = _skip_group(regex, pos);
+            break;
+        case '[':
+            pos = _skip_class(regex, pos);
+            break;
+        case '\\':
+            if (pos + 1 >= regex.size())
+            {
+                return std::nullopt;
+            }
+            c = static_cast<unsigned char>(regex[pos + 1]);
+            pos += 2;
+            if (c == 'd')
+            {
+                atom = DIGITS;
+            }
+            else if (c == 'w')
+            {
+                atom = WORDS;
+            }
+            else if (c == 's')
+            {
+                atom = SPACES;
+            }
+            else if (std::string_view {"xpPQC0123456789"}.contains(static_cast<char>(c)))
+            {
+                // 这些转义会吞下后续字符，无法逐字符分析
+                return std::nullopt;
+            }
+            else if (c < 0x80 && !std::isalnum(c))
+            {
+                atom = CharSet {}.set(c);
+            }
+            break;
+        case '.':
+        case '^':
+        case '$':
+            ++pos;
+            break;
+        default:
+            // 多字节字符上的量词作用于整个字符，不把它的字节当作必需字符
+            if (c < 0x80)
+            {
+                atom = CharSet {}.set(c);
+            }
+            ++pos;
+        }
+
+        if (pos == std::string_view::npos)
+        {
+            return std::nullopt;
+        }
+
+        // 允许出现 0 次的原子不是必需的
+        auto optional {false};
+        if (pos < regex.size())
+        {
+            auto quantified {true};
+            switch (regex[pos])
+            {
+            case '?':
+            case '*':
+                optional = true;
+                ++pos;
+                break;
+            case '+':
+                ++pos;
+                break;
+            case '{':
+                if (auto end {regex.find('}', pos)}; end != std::string_view::npos)
+                {
+                    optional = regex[pos + 1] == '0' || regex[pos + 1] == ',';
+                    pos      = end + 1;
+                }
+                else
+                {
+                    return std::nullopt;
+                }
+                break;
+            default:
+                quantified = false;
+            }
+
+            // 非贪婪量词
+            if (quantified && pos < regex.size() && regex[pos] == '?')
+            {
+                ++pos;
+            }
+        }
+
+        if (atom && !optional && !std::ranges::contains(required, *atom))
+        {
+            required.push_back(*atom);
+        }
+    }
+
+    return required;
+}
+
+}    // namespace
+
+MaskPrefilter::MaskPrefilter(const std::vector<Mask>& masks):
+    m_bits(masks.size(), NO_BIT)
+{
+    // 规则按顺序作用在上一条规则的结果上，前面的替换串可能引入后面规则需要的字符
+    CharSet introduced;
+    for (auto&& [rule, mask] : std::views::enumerate(masks))
+    {
+        const auto& [regex, replacement] {mask};
+
+        auto required {_required_chars(regex)};
+        if (required && this->m_filters.size() < MAX_FILTERED_RULES)
+        {
+            std::erase_if(
+                *required, [&introduced](const CharSet& chars) -> bool { return (chars & introduced).any(); }
+            );
+            if (!required->empty())
+            {
+                this->m_bits[rule] = static_cast<std::uint32_t>(this->m_filters.size());
+                this->m_filters.push_back(std::move(*required));
+            }
+        }
+
+        introduced |= _chars(replacement);
+    }
+}
+
+std::uint32_t MaskPrefilter::bit(std::size_t rule) const
+{
+    return this->m_bits[rule];
+}
+
+bool MaskPrefilter::empty() const
+{
+    return this->m_filters.empty();
+}
+
+std::uint64_t MaskPrefilter::candidates(std::string_view content) const
+{
+    CharSet present;
+    for (auto&& c : content)
+    {
+        present.set(static_cast<unsigned char>(c));
+    }
+
+    std::uint64_t rules {0};
+    for (auto&& [bit, required] : std::views::enumerate(this->m_filters))
+    {
+        if (std::ranges::all_of(required, [&present](const CharSet& chars) -> bool { return (chars & present).any(); }))
+        {
+            rules |= 1ULL << bit;
+        }
+    }
+
+    return rules;
+}
+
+}    // namespace logtt
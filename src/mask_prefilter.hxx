@@ -0,0 +1,43 @@
+#pragma once
+
+#include "precomp.hxx"
+#include <bitset>
+#include <cstdint>
+#include <limits>
+#include <string_view>
+#include <vector>
+
+namespace logtt
+{
+
+// 掩码规则的字符预过滤器：分析每条正则的任何匹配中都必须出现的字符，
+// 日志中缺少这些字符时该规则不可能匹配，可以跳过对应的 regexp_replace
+// 一行日志只扫描一遍就能得到所有可能生效的规则；分析是保守的，无法确定时不过滤
+class MaskPrefilter
+{
+public:
+    // 最多为 64 条规则建立过滤位，超出的规则总是执行
+    static constexpr std::size_t   MAX_FILTERED_RULES {64};
+    static constexpr std::uint32_t NO_BIT {std::numeric_limits<std::uint32_t>::max()};
+
+    using CharSet = std::bitset<256>;
+
+    explicit MaskPrefilter(const std::vector<Mask>& masks);
+
+    // 第 rule 条规则在 candidates 结果中的位，规则无法预过滤时返回 NO_BIT
+    [[nodiscard]]
+    std::uint32_t bit(std::size_t rule) const;
+    // 是否有任何规则可以预过滤
+    [[nodiscard]]
+    bool empty() const;
+    // 返回 content 上可能生效的规则位
+    [[nodiscard]]
+    std::uint64_t candidates(std::string_view content) const;
+
+private:
+    // 每个可过滤规则必须满足的条件：每个字符集合中至少有一个字符出现在日志中
+    std::vector<std::vector<CharSet>> m_filters;
+    std::vector<std::uint32_t>        m_bits;
+};
+
+}    // namespace logtt
@@ -1,17 +1,23 @@
 #pragma once
 
 #include "duckdb.hpp"
+#include <cstdint>
+#include <limits>
 #include <string>
+#include <string_view>
 #include <vector>
 
 namespace logtt
 {
 
 using Mask     = std::pair<std::string, std::string>;
-using Token    = std::string;
+using Token    = std::uint32_t;
 using TContent = std::vector<Token>;
 
-inline constexpr std::string WILDCARD {"<#*#>"};
+inline constexpr std::string_view WILDCARD_STR {"<#*#>"};
+inline constexpr Token            WILDCARD {0};
+// 表示没有对应的模板：日志簇尚未分配 TemplateID，或匹配模式下未匹配到模板的行
+inline constexpr std::uint32_t NO_TEMPLATE_ID {std::numeric_limits<std::uint32_t>::max()};
 
 using namespace duckdb;
 using ParsedExprVec = vector<unique_ptr<ParsedExpression>>;
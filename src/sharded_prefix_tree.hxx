@@ -0,0 +1,367 @@
+#pragma once
+
+#include "precomp.hxx"
+#include "snapshot.hxx"
+#include "template_matcher.hxx"
+#include "token_dict.hxx"
+#include "utils.hxx"
+#include <algorithm>
+#include <cstdint>
+#include <deque>
+#include <functional>
+#include <memory>
+#include <ranges>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+namespace logtt
+{
+
+// Drain 和 JaccardDrain 共用的分片前缀树：节点与分片的结构、按分片并行学习，以及它们在快照中的读写
+// Cluster 是解析器各自的日志簇，需要提供 content、template_id、count 和 log_template 成员
+
+template <typename Cluster>
+struct PrefixTreeNode
+{
+    std::vector<Cluster*>                                      clusters;
+    std::unordered_map<Token, std::unique_ptr<PrefixTreeNode>> children_node;
+};
+
+// 每个分片独占第 1 层的一个节点及其子树，日志簇也由分片各自持有
+// 前缀树节点直接保存日志簇的指针，分片放在 std::deque 中，追加新分片时已有日志簇的地址保持不变
+// depth 为分片节点所在的层数，根节点分片为 0
+template <typename Cluster>
+struct PrefixTreeShard
+{
+    PrefixTreeNode<Cluster>*   node;
+    std::uint16_t              depth;
+    std::vector<std::uint32_t> rows;
+    std::deque<Cluster>        cluster_pool;
+};
+
+template <typename Cluster>
+using ShardDeque = std::deque<PrefixTreeShard<Cluster>>;
+
+// 把前缀树节点映射到分片序号：构造时清空已有分片上一批分配的行，节点第一次出现时在末尾追加新的分片
+// 分片和日志簇在多次增量解析之间保留，已有日志簇的地址不变，前缀树中保存的指针在后续解析中仍然有效
+template <typename Cluster>
+class ShardLookup
+{
+public:
+    explicit ShardLookup(ShardDeque<Cluster>& shards): m_shards {shards}
+    {
+        for (auto&& [idx, shard] : std::views::enumerate(shards))
+        {
+            shard.rows.clear();
+            this->m_node_shards.emplace(shard.node, static_cast<std::uint32_t>(idx));
+        }
+    }
+
+    std::uint32_t operator()(PrefixTreeNode<Cluster>* node, std::uint16_t depth)
+    {
+        auto [it, inserted] {this->m_node_shards.try_emplace(node, static_cast<std::uint32_t>(this->m_shards.size()))};
+        if (inserted)
+        {
+            this->m_shards.emplace_back(node, depth);
+        }
+        return it->second;
+    }
+
+private:
+    ShardDeque<Cluster>&                                              m_shards;
+    std::unordered_map<const PrefixTreeNode<Cluster>*, std::uint32_t> m_node_shards;
+};
+
+// 尚未分配 TemplateID 的日志簇按分片顺序分配新的 TemplateID，已有日志簇的 TemplateID 保持不变
+template <typename Cluster>
+void assign_template_ids(ShardDeque<Cluster>& shards, std::uint32_t& template_count)
+{
+    for (auto&& shard : shards)
+    {
+        for (auto&& cluster : shard.cluster_pool)
+        {
+            if (!cluster.template_id)
+            {
+                cluster.template_id = template_count++;
+            }
+        }
+    }
+}
+
+// 每个分片在各自的线程上处理分配给它的行，add_content(row, shard) 返回该行归入的日志簇
+// 分片内部仍按行号顺序处理，因此结果与单线程完全一致；返回每一行的 TemplateID
+template <typename Cluster, typename AddContent>
+std::vector<std::uint32_t> learn_by_shard(
+    ShardDeque<Cluster>& shards, std::size_t row_count, std::uint32_t& template_count, AddContent&& add_content
+)
+{
+    auto shard_order {std::views::iota(0UL, shards.size()) | std::ranges::to<std::vector>()};
+    // 大分片优先调度，减少尾部等待
+    std::ranges::sort(
+        shard_order, std::greater {}, [&shards](std::size_t idx) -> std::size_t { return shards[idx].rows.size(); }
+    );
+
+    std::vector<Cluster*> cluster_results(row_count);
+#pragma omp parallel for schedule(dynamic, 1)
+    for (std::size_t i = 0; i < shard_order.size(); ++i)
+    {
+        auto& shard {shards[shard_order[i]]};
+        for (auto&& row : shard.rows)
+        {
+            cluster_results[row] = add_content(row, shard);
+        }
+    }
+
+    // 模板变化时只需覆盖模板表中的一行
+    assign_template_ids(shards, template_count);
+
+    std::vector<std::uint32_t> template_ids;
+    template_ids.reserve(row_count);
+    for (auto&& cluster : cluster_results)
+    {
+        template_ids.push_back(cluster->template_id.value());
+    }
+
+    return template_ids;
+}
+
+// get_template(cluster) 返回日志簇的模板字符串，TemplateRecord 直接引用它
+template <typename Cluster, typename GetTemplate>
+std::vector<TemplateRecord> collect_templates(ShardDeque<Cluster>& shards, GetTemplate&& get_template)
+{
+    std::vector<TemplateRecord> templates;
+    for (auto&& shard : shards)
+    {
+        for (auto&& cluster : shard.cluster_pool)
+        {
+            templates.emplace_back(cluster.template_id.value(), get_template(cluster), cluster.count);
+        }
+    }
+
+    return templates;
+}
+
+// 把全部日志簇编译成只读的匹配器，尚未分配 TemplateID 的日志簇先分配
+template <typename Cluster, typename GetTemplate>
+TemplateMatcher
+    compile_matcher(ShardDeque<Cluster>& shards, std::uint32_t& template_count, GetTemplate&& get_template)
+{
+    assign_template_ids(shards, template_count);
+
+    TemplateMatcher matcher;
+    for (auto&& shard : shards)
+    {
+        for (auto&& cluster : shard.cluster_pool)
+        {
+            matcher.add(cluster.template_id.value(), cluster.content, get_template(cluster));
+        }
+    }
+
+    matcher.build();
+    return matcher;
+}
+
+// 前缀树按先序写入快照，节点上的日志簇以其在所有分片中的全局序号表示
+template <typename Cluster>
+void _save_prefix_tree_node(
+    SnapshotWriter&                                          writer,
+    const PrefixTreeNode<Cluster>&                           node,
+    const std::unordered_map<const Cluster*, std::uint32_t>& cluster_ids
+)
+{
+    std::vector<std::uint32_t> ids;
+    ids.reserve(node.clusters.size());
+    for (auto&& cluster : node.clusters)
+    {
+        ids.push_back(cluster_ids.at(cluster));
+    }
+    writer.write_array<std::uint32_t>(ids);
+
+    writer.write<std::uint64_t>(node.children_node.size());
+    for (auto&& [token, child] : node.children_node)
+    {
+        writer.write(token);
+        _save_prefix_tree_node(writer, *child, cluster_ids);
+    }
+}
+
+// 节点的 token 必须由 token_dict 分配，否则视为快照损坏
+template <typename Cluster>
+bool _load_prefix_tree_node(
+    SnapshotReader&              reader,
+    PrefixTreeNode<Cluster>&     node,
+    const std::vector<Cluster*>& clusters,
+    const TokenDict&             token_dict
+)
+{
+    std::vector<std::uint32_t> ids;
+    std::uint64_t              child_count {0};
+    if (!reader.read_array(ids))
+    {
+        return false;
+    }
+
+    node.clusters.reserve(ids.size());
+    for (auto&& id : ids)
+    {
+        if (id >= clusters.size())
+        {
+            return false;
+        }
+        node.clusters.push_back(clusters[id]);
+    }
+
+    if (!reader.read(child_count) || child_count > reader.remaining())
+    {
+        return false;
+    }
+    node.children_node.reserve(child_count);
+    for (auto&& _ : std::views::iota(0UL, child_count))
+    {
+        Token token {WILDCARD};
+        auto  child {std::make_unique<PrefixTreeNode<Cluster>>()};
+        if (!reader.read(token) || !token_dict.contains(token) ||
+            !_load_prefix_tree_node(reader, *child, clusters, token_dict))
+        {
+            return false;
+        }
+        node.children_node.emplace(token, std::move(child));
+    }
+
+    return true;
+}
+
+// 分片依次写入：分片所在的层数、分片节点在第一层的 token（根节点分片写 WILDCARD），以及分片持有的日志簇
+// 之后写入整棵前缀树；root 为空时写入一棵空树
+template <typename Cluster>
+void save_prefix_tree(SnapshotWriter& writer, const PrefixTreeNode<Cluster>* root, const ShardDeque<Cluster>& shards)
+{
+    std::unordered_map<const Cluster*, std::uint32_t> cluster_ids;
+    writer.write<std::uint64_t>(shards.size());
+    for (auto&& shard : shards)
+    {
+        Token token {WILDCARD};
+        if (shard.depth > 0)
+        {
+            for (auto&& [child_token, child] : root->children_node)
+            {
+                if (child.get() == shard.node)
+                {
+                    token = child_token;
+                    break;
+                }
+            }
+        }
+        writer.write(shard.depth);
+        writer.write(token);
+
+        writer.write<std::uint64_t>(shard.cluster_pool.size());
+        for (auto&& cluster : shard.cluster_pool)
+        {
+            cluster_ids.emplace(&cluster, static_cast<std::uint32_t>(cluster_ids.size()));
+            writer.write_array<Token>(cluster.content);
+            writer.write(cluster.template_id.value_or(NO_TEMPLATE_ID));
+            writer.write(cluster.count);
+        }
+    }
+
+    if (root != nullptr)
+    {
+        _save_prefix_tree_node(writer, *root, cluster_ids);
+    }
+    else
+    {
+        _save_prefix_tree_node(writer, PrefixTreeNode<Cluster> {}, cluster_ids);
+    }
+}
+
+// 读取 save_prefix_tree 写入的分片和前缀树，on_load(cluster) 在每个日志簇读取完成后调用
+// 读取失败时返回 false，此时 root 和 shards 的内容无效，调用方应当丢弃
+template <typename Cluster, typename OnLoad>
+bool load_prefix_tree(
+    SnapshotReader&                           reader,
+    const TokenDict&                          token_dict,
+    std::unique_ptr<PrefixTreeNode<Cluster>>& root,
+    ShardDeque<Cluster>&                      shards,
+    OnLoad&&                                  on_load
+)
+{
+    std::uint64_t shard_count {0};
+    if (!reader.read(shard_count) || shard_count > reader.remaining())
+    {
+        return false;
+    }
+
+    // 分片节点在前缀树恢复之后才能确定，这里先记下第一层的 token
+    std::vector<Token>    shard_tokens;
+    std::vector<Cluster*> clusters;
+    shard_tokens.reserve(shard_count);
+    for (auto&& _ : std::views::iota(0UL, shard_count))
+    {
+        std::uint16_t shard_depth {0};
+        Token         token {WILDCARD};
+        std::uint64_t cluster_count {0};
+        if (!reader.read(shard_depth) || !reader.read(token) || !reader.read(cluster_count) || shard_depth > 1)
+        {
+            return false;
+        }
+        shard_tokens.push_back(token);
+
+        auto& shard {shards.emplace_back(nullptr, shard_depth)};
+        for (auto&& _ : std::views::iota(0UL, cluster_count))
+        {
+            auto&         cluster {shard.cluster_pool.emplace_back()};
+            std::uint32_t template_id {NO_TEMPLATE_ID};
+            if (!reader.read_array(cluster.content) || !token_dict.contains(cluster.content) ||
+                !reader.read(template_id) || !reader.read(cluster.count))
+            {
+                return false;
+            }
+            if (template_id != NO_TEMPLATE_ID)
+            {
+                cluster.template_id = template_id;
+            }
+            on_load(cluster);
+            clusters.push_back(&cluster);
+        }
+    }
+
+    root = std::make_unique<PrefixTreeNode<Cluster>>();
+    if (!_load_prefix_tree_node(reader, *root, clusters, token_dict))
+    {
+        return false;
+    }
+
+    for (auto&& [shard, token] : std::views::zip(shards, shard_tokens))
+    {
+        if (shard.depth == 0)
+        {
+            shard.node = root.get();
+            continue;
+        }
+
+        auto it {root->children_node.find(token)};
+        if (it == root->children_node.end())
+        {
+            return false;
+        }
+        shard.node = it->second.get();
+    }
+
+    return true;
+}
+
+// 日志簇不需要额外恢复的字段时使用
+template <typename Cluster>
+bool load_prefix_tree(
+    SnapshotReader&                           reader,
+    const TokenDict&                          token_dict,
+    std::unique_ptr<PrefixTreeNode<Cluster>>& root,
+    ShardDeque<Cluster>&                      shards
+)
+{
+    return load_prefix_tree(reader, token_dict, root, shards, [](Cluster&) -> void {});
+}
+
+}    // namespace logtt
@@ -0,0 +1,85 @@
+#include "snapshot.hxx"
+#include <fstream>
+
+namespace logtt
+{
+
+namespace
+{
+
+// 文件头：魔数、格式版本、解析器类型
+constexpr std::uint32_t SNAPSHOT_MAGIC {0x5354'544C};    // "LTTS"
+constexpr std::uint32_t SNAPSHOT_VERSION {1};
+
+}    // namespace
+
+SnapshotWriter::SnapshotWriter(SnapshotKind kind)
+{
+    this->write(SNAPSHOT_MAGIC);
+    this->write(SNAPSHOT_VERSION);
+    this->write(kind);
+}
+
+void SnapshotWriter::write_bytes(std::string_view bytes)
+{
+    this->m_buffer.append(bytes);
+}
+
+bool SnapshotWriter::save(const std::string& path) const
+{
+    std::ofstream out {path, std::ios::binary | std::ios::trunc};
+    out.write(this->m_buffer.data(), static_cast<std::streamsize>(this->m_buffer.size()));
+    return out.good();
+}
+
+SnapshotReader::SnapshotReader(const std::string& path, SnapshotKind kind)
+{
+    std::ifstream in {path, std::ios::binary | std::ios::ate};
+    if (!in)
+    {
+        return;
+    }
+
+    auto size {static_cast<std::size_t>(in.tellg())};
+    this->m_buffer.resize(size);
+    in.seekg(0);
+    if (!in.read(this->m_buffer.data(), static_cast<std::streamsize>(size)))
+    {
+        return;
+    }
+
+    this->m_good = true;
+    std::uint32_t magic {0};
+    std::uint32_t version {0};
+    SnapshotKind  file_kind {};
+    if (!this->read(magic) || !this->read(version) || !this->read(file_kind) || magic != SNAPSHOT_MAGIC ||
+        version != SNAPSHOT_VERSION || file_kind != kind)
+    {
+        this->m_good = false;
+    }
+}
+
+std::string_view SnapshotReader::read_bytes(std::size_t size)
+{
+    if (!this->m_good || size > this->remaining())
+    {
+        this->m_good = false;
+        return {};
+    }
+
+    std::string_view bytes {this->m_buffer.data() + this->m_pos, size};
+    this->m_pos += size;
+    return bytes;
+}
+
+std::size_t SnapshotReader::remaining() const
+{
+    return this->m_buffer.size() - this->m_pos;
+}
+
+bool SnapshotReader::good() const
+{
+    return this->m_good;
+}
+
+}    // namespace logtt
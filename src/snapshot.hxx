@@ -0,0 +1,114 @@
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
+#include <limits>
+#include <span>
+#include <string>
+#include <string_view>
+#include <type_traits>
+#include <vector>
+
+namespace logtt
+{
+
+// 快照对应的解析器类型，写在文件头中，加载时必须与目标解析器一致
+enum class SnapshotKind : std::uint32_t
+{
+    DRAIN         = 1,
+    JACCARD_DRAIN = 2,
+    SPELL         = 3,
+};
+
+// 快照中表示前缀树节点上没有挂载日志簇
+inline constexpr std::uint32_t NO_CLUSTER_ID {std::numeric_limits<std::uint32_t>::max()};
+
+// 解析器状态快照的写入器：定长整数和数组按本机字节序直接追加到缓冲区，最后一次性写入文件
+class SnapshotWriter
+{
+public:
+    explicit SnapshotWriter(SnapshotKind kind);
+
+    template <typename T>
+        requires std::is_trivially_copyable_v<T>
+    void write(const T& value)
+    {
+        this->write_bytes({reinterpret_cast<const char*>(&value), sizeof(T)});
+    }
+
+    // 先写元素个数，再写连续的元素
+    template <typename T>
+        requires std::is_trivially_copyable_v<T>
+    void write_array(std::span<const T> values)
+    {
+        this->write<std::uint64_t>(values.size());
+        this->write_bytes({reinterpret_cast<const char*>(values.data()), values.size_bytes()});
+    }
+
+    void write_bytes(std::string_view bytes);
+
+    // 写入失败时返回 false
+    [[nodiscard]]
+    bool save(const std::string& path) const;
+
+private:
+    std::string m_buffer;
+};
+
+// 解析器状态快照的读取器：整个文件一次读入内存，之后按写入顺序顺序读取
+// 任何一次读取越界都会使读取器进入失败状态，之后的读取全部返回 false
+class SnapshotReader
+{
+public:
+    // 文件不存在或文件头与 kind 不匹配时 good() 返回 false
+    SnapshotReader(const std::string& path, SnapshotKind kind);
+
+    template <typename T>
+        requires std::is_trivially_copyable_v<T>
+    bool read(T& value)
+    {
+        auto bytes {this->read_bytes(sizeof(T))};
+        if (bytes.size() != sizeof(T))
+        {
+            return false;
+        }
+        std::memcpy(&value, bytes.data(), sizeof(T));
+        return true;
+    }
+
+    template <typename T>
+        requires std::is_trivially_copyable_v<T>
+    bool read_array(std::vector<T>& values)
+    {
+        std::uint64_t size {0};
+        // 先检查剩余字节数，避免损坏的文件导致超大分配
+        if (!this->read(size) || size > this->remaining() / sizeof(T))
+        {
+            this->m_good = false;
+            return false;
+        }
+        auto bytes {this->read_bytes(size * sizeof(T))};
+        values.resize(size);
+        if (!bytes.empty())
+        {
+            std::memcpy(values.data(), bytes.data(), bytes.size());
+        }
+        return true;
+    }
+
+    // 返回接下来 size 个字节的视图，生命周期与读取器相同
+    std::string_view read_bytes(std::size_t size);
+
+    [[nodiscard]]
+    std::size_t remaining() const;
+    [[nodiscard]]
+    bool good() const;
+
+private:
+    std::vector<char> m_buffer;
+    std::size_t       m_pos {0};
+    bool              m_good {false};
+};
+
+}    // namespace logtt
@@ -2,13 +2,101 @@
 #include "duckdb_service.hxx"
 #include "utils.hxx"
 #include <algorithm>
+#include <bit>
 #include <cmath>
 #include <mdspan>
 #include <ranges>
+#include <tuple>
 
 namespace logtt
 {
 
+SpellLogParser::LcsPattern::LcsPattern(const TContent& content):
+    length {content.size()}, word_count {(content.size() + 63) / 64}, keys {content}
+{
+    // 按 token 排序去重，masks 中第 k 组字是 keys[k] 在 content 中出现位置的位掩码
+    std::ranges::sort(keys);
+    auto [first, last] {std::ranges::unique(keys)};
+    keys.erase(first, last);
+
+    masks.resize(keys.size() * word_count);
+    for (auto&& [j, token] : std::views::enumerate(content))
+    {
+        auto k {std::ranges::lower_bound(keys, token) - keys.begin()};
+        masks[(k * word_count) + (j / 64)] |= std::uint64_t {1} << (j % 64);
+    }
+
+    v.resize(word_count);
+    // 最高字中超出 content 长度的比特不参与计数
+    last_word_mask = length % 64 == 0 ? ~std::uint64_t {0} : (std::uint64_t {1} << (length % 64)) - 1;
+}
+
+std::uint16_t SpellLogParser::LcsPattern::lcs_length(const TContent& content, std::uint16_t min_required_lcs)
+{
+    if (length == 0 || content.empty() || min_required_lcs > std::min(length, content.size()))
+    {
+        return 0;
+    }
+
+    // v 中为 0 的比特数就是当前的 LCS 长度
+    std::ranges::fill(v, ~std::uint64_t {0});
+    std::uint16_t cur_lcs {0};
+
+    for (auto&& [i, token] : std::views::enumerate(content))
+    {
+        // 不在模式串中的 token 不会改变 v
+        if (auto it {std::ranges::lower_bound(keys, token)}; it != keys.end() && *it == token)
+        {
+            const auto* const pm {&masks[(it - keys.begin()) * word_count]};
+
+            if (word_count == 1)
+            {
+                auto u {v[0] & pm[0]};
+                v[0]    = (v[0] + u) | (v[0] - u);
+                cur_lcs = static_cast<std::uint16_t>(std::popcount(~v[0] & last_word_mask));
+            }
+            else
+            {
+                // 多字时 v + u 与 v - u 需要逐字传递进位和借位
+                std::uint64_t carry {0};
+                std::uint64_t borrow {0};
+                std::uint16_t zeros {0};
+                for (auto&& w : std::views::iota(0UL, word_count))
+                {
+                    auto u {v[w] & pm[w]};
+
+                    auto sum {v[w] + u};
+                    auto next_carry {static_cast<std::uint64_t>(sum < u)};
+                    sum += carry;
+                    next_carry |= static_cast<std::uint64_t>(sum < carry);
+
+                    auto diff {v[w] - u};
+                    auto next_borrow {static_cast<std::uint64_t>(v[w] < u)};
+                    next_borrow |= static_cast<std::uint64_t>(diff < borrow);
+                    diff -= borrow;
+
+                    carry  = next_carry;
+                    borrow = next_borrow;
+                    v[w]   = sum | diff;
+
+                    auto valid_mask {w + 1 == word_count ? last_word_mask : ~std::uint64_t {0}};
+                    zeros += static_cast<std::uint16_t>(std::popcount(~v[w] & valid_mask));
+                }
+                cur_lcs = zeros;
+            }
+        }
+
+        auto remain_rows {content.size() - static_cast<std::size_t>(i) - 1};
+        // 阈值剪枝
+        if (cur_lcs + remain_rows < min_required_lcs)
+        {
+            return 0;
+        }
+    }
+
+    return cur_lcs;
+}
+
 SpellLogParser::SpellLogParser(
     std::string              log_regex,
     std::vector<std::string> named_fields,
@@ -33,93 +121,219 @@ std::int32_t SpellLogParser::parse(
     const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
 )
 {
-    // 初始化前缀树和日志簇池
+    // 初始化前缀树、日志簇池、倒排索引和 token 字典
     this->m_root = std::make_unique<Node>();
     this->m_cluster_pool.clear();
-    std::vector<LogCluster*> cluster_results;
-    std::vector<std::string> templates;
+    this->m_index.clear();
+    this->m_empty_clusters.clear();
+    this->m_token_dict.clear();
+
+    return this->parse_incremental(log_file, structured_table_name, templates_table_name, 0);
+}
+
+std::int32_t SpellLogParser::parse_incremental(
+    const std::string& log_file,
+    const std::string& structured_table_name,
+    const std::string& templates_table_name,
+    std::int64_t       line_offset
+)
+{
     // 获取数据库连接
     auto& conn {get_connection()};
 
     auto rel {load_data(
-        conn, log_file, this->m_log_regex, this->m_named_fields, this->m_timestamp_fields, this->m_timestamp_format
+        conn,
+        log_file,
+        this->m_log_regex,
+        this->m_named_fields,
+        this->m_timestamp_fields,
+        this->m_timestamp_format,
+        line_offset,
+        true
+    )};
+    rel = mask_log_rel(conn, rel, this->m_masks);
+    rel = split_log_rel(conn, rel, this->m_delimiters);
+
+    // 移除多余列
+    auto star_expr {make_uniq<StarExpression>()};
+    star_expr->exclude_list.emplace("MaskedContent");
+
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(std::move(star_expr));
+
+    rel = rel->Project(std::move(project_exprs), {});
+
+    // 边读取边聚类，相同的内容在批内只聚类一次，结果再展开到每一行
+    auto log_length {this->_stream_to_table(
+        conn,
+        rel,
+        line_offset,
+        structured_table_name,
+        templates_table_name,
+        [this](const UniqueContents& batch) -> std::vector<std::uint32_t>
+        {
+            return this->_learn(batch.contents, batch.counts);
+        }
     )};
-    rel = mask_log_rel(rel, this->m_masks);
-    rel = split_log_rel(rel, this->m_delimiters);
+    if (log_length < 0)
+    {
+        return -1;
+    }
 
-    // 缓存分词结果，避免重复计算
-    auto star_expr_1 {make_uniq<StarExpression>()};
-    star_expr_1->exclude_list.emplace("MaskedContent");
+    write_templates(conn, this->_learned_templates(), templates_table_name);
+    return static_cast<std::int32_t>(log_length);
+}
+
+std::int32_t SpellLogParser::match_learned(
+    const std::string& log_file,
+    const std::string& structured_table_name,
+    const std::string& templates_table_name,
+    bool               learn_unmatched,
+    std::int64_t&      unmatched_count
+)
+{
+    auto matcher {this->_compile_matcher()};
+    return this->_match(
+        log_file, structured_table_name, templates_table_name, matcher, learn_unmatched, unmatched_count
+    );
+}
 
-    ParsedExprVec project_exprs_1;
-    project_exprs_1.push_back(std::move(star_expr_1));
+bool SpellLogParser::save_snapshot(const std::string& snapshot_file) const
+{
+    SnapshotWriter writer {SnapshotKind::SPELL};
 
-    rel = rel->Project(std::move(project_exprs_1), {});
+    writer.write(this->m_sim_thr);
+    this->m_token_dict.save(writer);
 
-    auto ret {get_tmp(conn, rel)};
-    if (!ret)
+    // 日志簇按 ID 顺序写入，加载后 ID 即在池中的位置
+    writer.write<std::uint64_t>(this->m_cluster_pool.size());
+    for (auto&& cluster : this->m_cluster_pool)
     {
-        return -1;
+        writer.write_array<Token>(cluster.content);
+        writer.write(cluster.count);
     }
-    rel = ret.value();
-
-    ParsedExprVec project_exprs_2;
-    project_exprs_2.push_back(make_uniq<ColumnRefExpression>("Tokens"));
 
-    auto result {to_m_result(rel->Project(std::move(project_exprs_2), {})->Execute())};
-    auto log_length {result->RowCount()};
-    for (auto&& data_chunk : result->Collection().Chunks())
+    if (this->m_root)
+    {
+        SpellLogParser::_save_node(writer, *this->m_root);
+    }
+    else
     {
-        const auto& tokens_col {data_chunk.data[0]};
-        const auto& tokens_child {ListVector::GetEntry(tokens_col)};
+        SpellLogParser::_save_node(writer, Node {});
+    }
+
+    return writer.save(snapshot_file);
+}
 
-        const auto* const tokens_data {FlatVector::GetData<list_entry_t>(tokens_col)};
-        const auto* const tokens_child_data {FlatVector::GetData<string_t>(tokens_child)};
+bool SpellLogParser::load_snapshot(const std::string& snapshot_file)
+{
+    SnapshotReader reader {snapshot_file, SnapshotKind::SPELL};
+
+    // 先恢复到局部变量中，全部读取成功后再替换当前状态
+    float                  sim_thr {0.0F};
+    TokenDict              token_dict;
+    std::uint64_t          cluster_count {0};
+    std::deque<LogCluster> cluster_pool;
+    if (!reader.read(sim_thr) || !token_dict.load(reader) || !reader.read(cluster_count) ||
+        cluster_count > reader.remaining())
+    {
+        return false;
+    }
 
-        for (auto&& row : std::views::iota(0UL, data_chunk.size()))
+    for (auto&& id : std::views::iota(0UL, cluster_count))
+    {
+        auto& cluster {cluster_pool.emplace_back()};
+        cluster.id = static_cast<std::uint32_t>(id);
+        if (!reader.read_array(cluster.content) || !token_dict.contains(cluster.content) || !reader.read(cluster.count))
         {
-            TContent    content;
-            const auto& entry {tokens_data[row]};
-            for (auto&& i : std::views::iota(0UL, entry.length))
-            {
-                const auto& token {tokens_child_data[entry.offset + i]};
-                content.emplace_back(token.GetString());
-            }
-            cluster_results.push_back(this->_add_content(content));
+            return false;
         }
     }
 
-    templates.reserve(log_length);
-    for (auto&& cluster : cluster_results)
+    auto root {std::make_unique<Node>()};
+    if (!SpellLogParser::_load_node(reader, *root, cluster_pool, token_dict))
     {
-        templates.push_back(cluster->get_template());
+        return false;
     }
 
-    // 移除多余列
-    auto star_expr_2 {make_uniq<StarExpression>()};
-    star_expr_2->exclude_list.emplace("Tokens");
+    this->m_sim_thr      = sim_thr;
+    this->m_token_dict   = std::move(token_dict);
+    this->m_root         = std::move(root);
+    this->m_cluster_pool = std::move(cluster_pool);
+
+    // 按簇 ID 顺序重建倒排索引，倒排列表自然有序
+    this->m_index.clear();
+    this->m_empty_clusters.clear();
+    for (auto&& cluster : this->m_cluster_pool)
+    {
+        this->_add_to_index(&cluster);
+    }
 
-    ParsedExprVec project_exprs_3;
-    project_exprs_3.push_back(std::move(star_expr_2));
+    return true;
+}
+
+std::vector<std::uint32_t>
+SpellLogParser::_learn(const std::vector<TContent>& contents, const std::vector<std::int64_t>& counts)
+{
+    // 沿用已经学习到的前缀树、日志簇和倒排索引，尚未解析过时先初始化
+    if (!this->m_root)
+    {
+        this->m_root = std::make_unique<Node>();
+    }
 
-    rel = rel->Project(std::move(project_exprs_3), {});
+    std::vector<std::uint32_t> template_ids;
+    template_ids.reserve(contents.size());
+    for (auto&& [content, count] : std::views::zip(contents, counts))
+    {
+        template_ids.push_back(this->_add_content(content, count)->id);
+    }
 
-    to_table(conn, rel, templates, structured_table_name, templates_table_name);
-    return static_cast<std::int32_t>(log_length);
+    return template_ids;
 }
 
-SpellLogParser::LogCluster* SpellLogParser::_add_content(const TContent& content)
+std::vector<TemplateRecord> SpellLogParser::_learned_templates()
 {
-    auto* match_cluster {
-        this->_tree_subseq_match(content) ?: (this->_subseq_match(content) ?: this->_lcs_match(content))
-    };
+    // 簇编号即 TemplateID，增量解析时保持不变，模板变化时只需覆盖模板表中的一行
+    std::vector<TemplateRecord> templates;
+    templates.reserve(this->m_cluster_pool.size());
+    for (auto&& cluster : this->m_cluster_pool)
+    {
+        templates.emplace_back(cluster.id, this->_get_template(cluster.content, cluster.log_template), cluster.count);
+    }
+
+    return templates;
+}
+
+TemplateMatcher SpellLogParser::_compile_matcher()
+{
+    TemplateMatcher matcher;
+    for (auto&& cluster : this->m_cluster_pool)
+    {
+        matcher.add(cluster.id, cluster.content, this->_get_template(cluster.content, cluster.log_template));
+    }
+
+    matcher.build();
+    return matcher;
+}
 
+SpellLogParser::LogCluster* SpellLogParser::_add_content(const TContent& content, std::int64_t count)
+{
+    auto* match_cluster {this->_tree_subseq_match(content)};
     if (match_cluster == nullptr)
     {
-        this->m_cluster_pool.emplace_back(content);
-        match_cluster = &this->m_cluster_pool.back();
-        this->_add_seq_to_prefix_tree(match_cluster);
-        return match_cluster;
+        // 前缀树未命中时，先通过倒排索引找出与 content 有共同 token 的候选簇，之后的两种匹配都只检查候选簇
+        this->_collect_candidates(content);
+        match_cluster = this->_subseq_match(content) ?: this->_lcs_match(content);
+    }
+
+    if (match_cluster == nullptr)
+    {
+        auto* cluster {&this->m_cluster_pool.emplace_back(content)};
+        cluster->id    = static_cast<std::uint32_t>(this->m_cluster_pool.size() - 1);
+        cluster->count = count;
+        this->_add_seq_to_prefix_tree(cluster);
+        this->_add_to_index(cluster);
+        return cluster;
     }
 
     auto lcs {SpellLogParser::_lcs_content(content, match_cluster->content)};
@@ -127,9 +341,13 @@ SpellLogParser::LogCluster* SpellLogParser::_add_content(const TContent& content
     if (new_content != match_cluster->content)
     {
         this->_remove_seq_from_prefix_tree(match_cluster);
+        this->_remove_from_index(match_cluster);
         match_cluster->content = std::move(new_content);
+        match_cluster->log_template.reset();
         this->_add_seq_to_prefix_tree(match_cluster);
+        this->_add_to_index(match_cluster);
     }
+    match_cluster->count += count;
 
     return match_cluster;
 }
@@ -160,12 +378,64 @@ SpellLogParser::LogCluster* SpellLogParser::_tree_subseq_match(const TContent& c
     return nullptr;
 }
 
+void SpellLogParser::_collect_candidates(const TContent& content)
+{
+    auto cluster_count {this->m_cluster_pool.size()};
+    this->m_shared_distinct.resize(cluster_count);
+    this->m_shared_bound.resize(cluster_count);
+    this->m_candidates.clear();
+
+    // 累加每个簇与 content 共有的不同 token 数，以及按出现次数取小求和得到的 LCS 上界
+    for (auto&& [token, count] : SpellLogParser::_count_tokens(content))
+    {
+        auto it {this->m_index.find(token)};
+        if (it == this->m_index.end())
+        {
+            continue;
+        }
+
+        for (auto&& [id, cluster_count] : it->second)
+        {
+            if (this->m_shared_distinct[id] == 0)
+            {
+                this->m_candidates.emplace_back(id);
+            }
+            ++this->m_shared_distinct[id];
+            this->m_shared_bound[id] += std::min(count, cluster_count);
+        }
+    }
+
+    for (auto&& candidate : this->m_candidates)
+    {
+        candidate.shared_distinct             = this->m_shared_distinct[candidate.id];
+        candidate.lcs_bound                   = this->m_shared_bound[candidate.id];
+        this->m_shared_distinct[candidate.id] = 0;
+        this->m_shared_bound[candidate.id]    = 0;
+    }
+
+    // 没有任何 token 的簇是所有内容的子序列，也要参与子序列匹配
+    for (auto&& id : this->m_empty_clusters)
+    {
+        this->m_candidates.emplace_back(id);
+    }
+
+    // 按簇 ID（即在日志簇池中的顺序）排列，保证与顺序扫描的结果一致
+    std::ranges::sort(this->m_candidates, {}, &Candidate::id);
+}
+
 SpellLogParser::LogCluster* SpellLogParser::_subseq_match(const TContent& content)
 {
     auto required_length {this->m_sim_thr * static_cast<float>(content.size())};
 
-    for (auto&& cluster : this->m_cluster_pool)
+    for (auto&& candidate : this->m_candidates)
     {
+        auto& cluster {this->m_cluster_pool[candidate.id]};
+        // 模板中的每个 token 都必须出现在 content 中，才可能是它的子序列
+        if (candidate.shared_distinct != cluster.token_counts.size())
+        {
+            continue;
+        }
+
         if (static_cast<float>(cluster.content.size()) < required_length)
         {
             continue;
@@ -173,7 +443,7 @@ SpellLogParser::LogCluster* SpellLogParser::_subseq_match(const TContent& conten
 
         if (SpellLogParser::_is_subsequence(content, cluster.content))
         {
-            return const_cast<LogCluster*>(&cluster);
+            return &cluster;
         }
     }
 
@@ -187,25 +457,64 @@ SpellLogParser::LogCluster* SpellLogParser::_lcs_match(const TContent& content)
     };
     std::uint16_t max_lcs_length {0};
     LogCluster*   max_cluster {nullptr};
+    // 同一行要与多个候选簇比较，位掩码只构建一次
+    LcsPattern pattern {content};
 
-    for (auto&& cluster : this->m_cluster_pool)
+    // 按 LCS 上界从大到小尝试，上界相同时与最终的比较规则一致：模板短的优先，再按池中顺序
+    std::ranges::sort(
+        this->m_candidates,
+        [this](const Candidate& candidate1, const Candidate& candidate2)
+        {
+            return std::tuple {
+                       -static_cast<std::int32_t>(candidate1.lcs_bound),
+                       this->m_cluster_pool[candidate1.id].content.size(),
+                       candidate1.id
+                   } <
+                   std::tuple {
+                       -static_cast<std::int32_t>(candidate2.lcs_bound),
+                       this->m_cluster_pool[candidate2.id].content.size(),
+                       candidate2.id
+                   };
+        }
+    );
+
+    for (auto&& candidate : this->m_candidates)
     {
-        auto required_cluster_lcs {
+        // 剩余候选的上界都达不到当前最优，提前结束
+        if (candidate.lcs_bound < max_lcs_length)
+        {
+            break;
+        }
+
+        auto& cluster {this->m_cluster_pool[candidate.id]};
+        auto  required_cluster_lcs {
             static_cast<std::uint16_t>(std::ceil(this->m_sim_thr * static_cast<float>(cluster.content.size())))
         };
-        auto lcs_length {
-            SpellLogParser::_lcs_length(content, cluster.content, std::max(required_content_lcs, required_cluster_lcs))
-        };
+        auto min_required_lcs {std::max(required_content_lcs, required_cluster_lcs)};
+        if (candidate.lcs_bound < min_required_lcs || candidate.lcs_bound == 0)
+        {
+            continue;
+        }
+
+        // 上界恰好等于当前最优时，只有能在平局规则下胜出的候选才值得计算
+        if (max_cluster != nullptr && candidate.lcs_bound == max_lcs_length &&
+            std::tuple {cluster.content.size(), cluster.id} >=
+                std::tuple {max_cluster->content.size(), max_cluster->id})
+        {
+            continue;
+        }
 
+        auto lcs_length {pattern.lcs_length(cluster.content, min_required_lcs)};
         if (lcs_length == 0)
         {
             continue;
         }
 
         if (lcs_length > max_lcs_length ||
-            (lcs_length == max_lcs_length && cluster.content.size() < max_cluster->content.size()))
+            (lcs_length == max_lcs_length && std::tuple {cluster.content.size(), cluster.id} <
+                                                 std::tuple {max_cluster->content.size(), max_cluster->id}))
         {
-            max_cluster    = const_cast<LogCluster*>(&cluster);
+            max_cluster    = &cluster;
             max_lcs_length = lcs_length;
         }
     }
@@ -213,6 +522,43 @@ SpellLogParser::LogCluster* SpellLogParser::_lcs_match(const TContent& content)
     return max_cluster;
 }
 
+void SpellLogParser::_add_to_index(LogCluster* cluster)
+{
+    cluster->token_counts = SpellLogParser::_count_tokens(cluster->content);
+    if (cluster->token_counts.empty())
+    {
+        this->m_empty_clusters.push_back(cluster->id);
+        return;
+    }
+
+    // 倒排列表按簇 ID 有序，新簇的 ID 最大，通常直接追加到末尾
+    for (auto&& [token, count] : cluster->token_counts)
+    {
+        auto& postings {this->m_index[token]};
+        auto  it {std::ranges::lower_bound(postings, cluster->id, {}, &Posting::first)};
+        postings.emplace(it, cluster->id, count);
+    }
+}
+
+void SpellLogParser::_remove_from_index(const LogCluster* cluster)
+{
+    if (cluster->token_counts.empty())
+    {
+        std::erase(this->m_empty_clusters, cluster->id);
+        return;
+    }
+
+    for (auto&& [token, _] : cluster->token_counts)
+    {
+        auto& postings {this->m_index[token]};
+        auto  it {std::ranges::lower_bound(postings, cluster->id, {}, &Posting::first)};
+        if (it != postings.end() && it->first == cluster->id)
+        {
+            postings.erase(it);
+        }
+    }
+}
+
 void SpellLogParser::_add_seq_to_prefix_tree(LogCluster* cluster)
 {
     auto* cur_node {this->m_root.get()};
@@ -269,91 +615,84 @@ void SpellLogParser::_remove_seq_from_prefix_tree(const LogCluster* cluster)
     }
 }
 
-bool SpellLogParser::_is_subsequence(const TContent& source, const TContent& target)
+void SpellLogParser::_save_node(SnapshotWriter& writer, const Node& node)
 {
-    // 判断 target 是不是 source 的子序列
-    if (target.empty())
+    writer.write(node.cluster != nullptr ? node.cluster->id : NO_CLUSTER_ID);
+    writer.write(node.template_no);
+
+    writer.write<std::uint64_t>(node.children_node.size());
+    for (auto&& [token, child] : node.children_node)
     {
-        return true;
+        writer.write(token);
+        SpellLogParser::_save_node(writer, *child);
     }
-    if (source.size() < target.size())
+}
+
+bool SpellLogParser::_load_node(
+    SnapshotReader& reader, Node& node, std::deque<LogCluster>& cluster_pool, const TokenDict& token_dict
+)
+{
+    std::uint32_t cluster_id {NO_CLUSTER_ID};
+    std::uint64_t child_count {0};
+    if (!reader.read(cluster_id) || !reader.read(node.template_no) || !reader.read(child_count) ||
+        child_count > reader.remaining())
     {
         return false;
     }
 
-    std::uint16_t target_idx {0};
-    for (auto&& token : source)
+    if (cluster_id != NO_CLUSTER_ID)
     {
-        if (token != target[target_idx])
+        if (cluster_id >= cluster_pool.size())
         {
-            continue;
+            return false;
         }
+        node.cluster = &cluster_pool[cluster_id];
+    }
 
-        ++target_idx;
-        if (target_idx == target.size())
+    node.children_node.reserve(child_count);
+    for (auto&& _ : std::views::iota(0UL, child_count))
+    {
+        Token token {WILDCARD};
+        auto  child {std::make_unique<Node>()};
+        if (!reader.read(token) || !token_dict.contains(token) ||
+            !SpellLogParser::_load_node(reader, *child, cluster_pool, token_dict))
         {
-            return true;
+            return false;
         }
+        node.children_node.emplace(token, std::move(child));
     }
 
-    return false;
+    return true;
 }
 
-std::uint16_t
-SpellLogParser::_lcs_length(const TContent& content1, const TContent& content2, std::uint16_t min_required_lcs)
+bool SpellLogParser::_is_subsequence(const TContent& source, const TContent& target)
 {
-    auto length1 {content1.size()};
-    auto length2 {content2.size()};
-
-    auto long_content {std::cref(content1)};
-    auto short_content {std::cref(content2)};
-    auto long_length {length1};
-    auto short_length {length2};
-
-    // 确定长短序列
-    if (length2 > length1)
+    // 判断 target 是不是 source 的子序列
+    if (target.empty())
     {
-        long_content  = content2;
-        short_content = content1;
-        long_length   = length2;
-        short_length  = length1;
+        return true;
     }
-
-    if (short_length == 0 || min_required_lcs > short_length)
+    if (source.size() < target.size())
     {
-        return 0;
+        return false;
     }
 
-    // 单行滚动数组
-    std::vector<std::uint16_t> dp(short_length + 1);
-    for (auto&& i : std::views::iota(0UL, long_length))
+    std::uint16_t target_idx {0};
+    for (auto&& token : source)
     {
-        std::uint16_t prev_diag {0};
-
-        for (auto&& j : std::views::iota(0UL, short_length))
+        if (token != target[target_idx])
         {
-            auto prev_up {dp[j + 1]};
-            if (long_content.get()[i] == short_content.get()[j])
-            {
-                dp[j + 1] = prev_diag + 1;
-            }
-            else if (dp[j] >= dp[j + 1])
-            {
-                dp[j + 1] = dp[j];
-            }
-            prev_diag = prev_up;
+            continue;
         }
 
-        auto cur_lcs {dp[short_length]};
-        auto remain_rows {long_length - i - 1};
-        // 阈值剪枝
-        if (cur_lcs + remain_rows < min_required_lcs)
+        ++target_idx;
+        if (target_idx == target.size())
         {
-            return 0;
+            return true;
         }
     }
 
-    return dp[short_length];
+    return false;
 }
 
 TContent SpellLogParser::_lcs_content(const TContent& content1, const TContent& content2)
@@ -384,7 +723,8 @@ TContent SpellLogParser::_lcs_content(const TContent& content1, const TContent&
     }
 
     auto     lcs_length {lengths[length1, length2]};
-    TContent lcs {lcs_length};
+    // Token 是整数，这里必须用圆括号构造定长数组，花括号会变成单元素列表初始化
+    TContent lcs(lcs_length);
     auto     lcs_idx {lcs_length};
 
     auto i {length1};
@@ -452,6 +792,27 @@ TContent SpellLogParser::_create_template(const TContent& lcs, const TContent& c
     return SpellLogParser::_merge_wildcards(new_content);
 }
 
+std::vector<SpellLogParser::TokenCount> SpellLogParser::_count_tokens(const TContent& content)
+{
+    auto sorted_content {content};
+    std::ranges::sort(sorted_content);
+
+    std::vector<TokenCount> token_counts;
+    for (auto&& token : sorted_content)
+    {
+        if (!token_counts.empty() && token_counts.back().first == token)
+        {
+            ++token_counts.back().second;
+        }
+        else
+        {
+            token_counts.emplace_back(token, 1);
+        }
+    }
+
+    return token_counts;
+}
+
 TContent SpellLogParser::_merge_wildcards(const TContent& content)
 {
     TContent merged_content;
@@ -469,9 +830,4 @@ TContent SpellLogParser::_merge_wildcards(const TContent& content)
     return merged_content;
 }
 
-std::string SpellLogParser::LogCluster::get_template() const
-{
-    return this->content | std::views::join_with(' ') | std::ranges::to<std::string>();
-}
-
 }    // namespace logtt
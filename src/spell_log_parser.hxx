@@ -2,8 +2,10 @@
 
 #include "base_log_parser.hxx"
 #include "precomp.hxx"
+#include "snapshot.hxx"
 #include <deque>
 #include <memory>
+#include <optional>
 #include <string>
 #include <unordered_map>
 #include <vector>
@@ -34,16 +36,56 @@ public:
     std::int32_t parse(
         const std::string& log_file, const std::string& structured_table_name, const std::string& templates_table_name
     ) override;
+    // 增量解析：保留已经学习到的前缀树、日志簇和倒排索引，只解析前 line_offset 行之后追加的日志
+    // 结果追加写入结构化表和模板表，返回本次解析的日志条数
+    // 结尾没有换行符的最后一行可能还在写入中，留到下一次解析，因此返回的条数总是可以作为下一次的 line_offset
+    std::int32_t parse_incremental(
+        const std::string& log_file,
+        const std::string& structured_table_name,
+        const std::string& templates_table_name,
+        std::int64_t       line_offset
+    );
+    using BaseLogParser::match;
+    using BaseLogParser::m_build_token_index;
+    // 匹配模式：用当前学习到的模板（例如刚加载的快照）匹配日志，匹配过程不更新任何日志簇
+    // learn_unmatched 为真时，未匹配的行再交给聚类学习；返回解析的日志条数
+    std::int32_t match_learned(
+        const std::string& log_file,
+        const std::string& structured_table_name,
+        const std::string& templates_table_name,
+        bool               learn_unmatched,
+        std::int64_t&      unmatched_count
+    );
+    // 把学习到的前缀树、日志簇和 token 字典保存为二进制快照，失败时返回 false
+    bool save_snapshot(const std::string& snapshot_file) const;
+    // 从快照恢复学习到的状态，之后可以直接调用 parse_incremental 继续解析
+    // 文件无法读取或格式不符时返回 false，原有状态保持不变
+    bool load_snapshot(const std::string& snapshot_file);
 
     virtual ~SpellLogParser() = default;
 
 private:
+    // (token, 出现次数) 或 (簇 ID, 出现次数)
+    using TokenCount = std::pair<Token, std::uint16_t>;
+    using Posting    = std::pair<std::uint32_t, std::uint16_t>;
+
     struct LogCluster
     {
-        TContent content;
+        TContent      content;
+        std::uint32_t id {0};
+        std::int64_t  count {0};
+        // 缓存的模板字符串，content 变化时置空
+        std::optional<std::string> log_template;
+        // 模板中每个不同 token 及其出现次数，按 token 排序，用于维护倒排索引
+        std::vector<TokenCount> token_counts;
+    };
 
-        [[nodiscard]]
-        std::string get_template() const;
+    // 倒排索引给出的候选簇：共有的不同 token 数，以及按出现次数取小求和得到的 LCS 上界
+    struct Candidate
+    {
+        std::uint32_t id;
+        std::uint16_t shared_distinct {0};
+        std::uint16_t lcs_bound {0};
     };
 
     struct Node
@@ -53,23 +95,64 @@ private:
         std::unordered_map<Token, std::unique_ptr<Node>> children_node;
     };
 
-    LogCluster* _add_content(const TContent& content);
+    // 按首次出现的顺序学习一批去重后的日志，返回每个内容的 TemplateID（即簇 ID）
+    std::vector<std::uint32_t>
+        _learn(const std::vector<TContent>& contents, const std::vector<std::int64_t>& counts) override;
+    std::vector<TemplateRecord> _learned_templates() override;
+    // 把当前的全部日志簇编译成只读的匹配器
+    TemplateMatcher _compile_matcher();
+
+    LogCluster* _add_content(const TContent& content, std::int64_t count);
     LogCluster* _tree_subseq_match(const TContent& content);
+    void        _collect_candidates(const TContent& content);
     LogCluster* _subseq_match(const TContent& content);
     LogCluster* _lcs_match(const TContent& content);
     void        _add_seq_to_prefix_tree(LogCluster* cluster);
     void        _remove_seq_from_prefix_tree(const LogCluster* cluster);
+    void        _add_to_index(LogCluster* cluster);
+    void        _remove_from_index(const LogCluster* cluster);
+
+    // 前缀树按先序写入快照，节点上的日志簇以簇 ID 表示；倒排索引可以由日志簇重建，不写入快照
+    static void _save_node(SnapshotWriter& writer, const Node& node);
+    // 节点的 token 必须由 token_dict 分配，否则视为快照损坏
+    static bool _load_node(
+        SnapshotReader& reader, Node& node, std::deque<LogCluster>& cluster_pool, const TokenDict& token_dict
+    );
+
+    // 位并行 LCS（Hyyrö）的模式串：记录每个不同 token 在 content 中出现位置的位掩码
+    // 超过 64 个 token 时按多个字存放，同一行与多个簇比较时只需构建一次
+    struct LcsPattern
+    {
+        std::size_t                length;
+        std::size_t                word_count;
+        TContent                   keys;
+        std::vector<std::uint64_t> masks;
+        std::uint64_t              last_word_mask {0};
+        // 计算时复用的状态向量
+        std::vector<std::uint64_t> v;
+
+        explicit LcsPattern(const TContent& content);
+
+        // 返回与 content 的 LCS 长度，确定达不到 min_required_lcs 时提前返回 0
+        std::uint16_t lcs_length(const TContent& content, std::uint16_t min_required_lcs);
+    };
 
     static bool _is_subsequence(const TContent& source, const TContent& target);
-    static std::uint16_t
-                    _lcs_length(const TContent& content1, const TContent& content2, std::uint16_t min_required_lcs);
     static TContent _lcs_content(const TContent& content1, const TContent& content2);
     static TContent _create_template(const TContent& lcs, const TContent& content);
     static TContent _merge_wildcards(const TContent& content);
+    static std::vector<TokenCount> _count_tokens(const TContent& content);
 
     float                  m_sim_thr {0.5F};
     std::unique_ptr<Node>  m_root;
     std::deque<LogCluster> m_cluster_pool;
+    // 倒排索引：token -> 包含它的簇（按簇 ID 有序）
+    std::unordered_map<Token, std::vector<Posting>> m_index;
+    std::vector<std::uint32_t>                      m_empty_clusters;
+    // 收集候选簇时使用的临时缓冲区，按簇 ID 索引，避免每行重新分配
+    std::vector<Candidate>     m_candidates;
+    std::vector<std::uint16_t> m_shared_distinct;
+    std::vector<std::uint16_t> m_shared_bound;
 };
 
 }    // namespace logtt
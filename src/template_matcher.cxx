@@ -0,0 +1,164 @@
+#include "template_matcher.hxx"
+#include "utils.hxx"
+#include <algorithm>
+#include <format>
+#include <ranges>
+#include <span>
+
+namespace logtt
+{
+
+TemplateMatcher::TemplateMatcher():
+    m_nodes(1), m_pending_edges(1)
+{}
+
+void TemplateMatcher::add(std::uint32_t template_id, const TContent& content, std::string log_template)
+{
+    std::uint32_t cur_node {0};
+    for (auto&& token : content)
+    {
+        auto next_node {static_cast<std::uint32_t>(this->m_nodes.size())};
+        if (token == WILDCARD)
+        {
+            if (this->m_nodes[cur_node].wildcard_child == NO_NODE)
+            {
+                this->m_nodes[cur_node].wildcard_child = next_node;
+                this->m_nodes.emplace_back();
+                this->m_pending_edges.emplace_back();
+            }
+            cur_node = this->m_nodes[cur_node].wildcard_child;
+            continue;
+        }
+
+        auto& edges {this->m_pending_edges[cur_node]};
+        if (auto it {std::ranges::find(edges, token, &Edge::first)}; it != edges.end())
+        {
+            cur_node = it->second;
+            continue;
+        }
+
+        edges.emplace_back(token, next_node);
+        this->m_nodes.emplace_back();
+        this->m_pending_edges.emplace_back();
+        cur_node = next_node;
+    }
+
+    // 内容完全相同的模板只保留第一个
+    if (this->m_nodes[cur_node].template_id == NO_TEMPLATE_ID)
+    {
+        this->m_nodes[cur_node].template_id = template_id;
+    }
+    this->m_templates.emplace_back(template_id, std::move(log_template));
+}
+
+void TemplateMatcher::build()
+{
+    this->m_edges.clear();
+    for (auto&& [node, edges] : std::views::zip(this->m_nodes, this->m_pending_edges))
+    {
+        std::ranges::sort(edges, {}, &Edge::first);
+        node.edge_begin = static_cast<std::uint32_t>(this->m_edges.size());
+        this->m_edges.append_range(edges);
+        node.edge_end = static_cast<std::uint32_t>(this->m_edges.size());
+    }
+
+    this->m_pending_edges.clear();
+    this->m_pending_edges.shrink_to_fit();
+}
+
+std::uint32_t TemplateMatcher::match(const TContent& content) const
+{
+    std::unordered_set<std::uint64_t> failed;
+    return this->_match(content, 0, 0, failed);
+}
+
+const std::vector<TemplateMatcher::Template>& TemplateMatcher::templates() const
+{
+    return this->m_templates;
+}
+
+std::optional<TemplateMatcher>
+TemplateMatcher::from_table(Connection& conn, const std::string& templates_table_name, TokenDict& token_dict)
+{
+    if (conn.TableInfo(templates_table_name) == nullptr)
+    {
+        return std::nullopt;
+    }
+
+    auto result {to_m_result(
+        conn.Query(std::format("SELECT TemplateID, Template FROM {} ORDER BY TemplateID", templates_table_name))
+    )};
+
+    TemplateMatcher matcher;
+    TContent        content;
+    for (auto&& data_chunk : result->Collection().Chunks())
+    {
+        const auto* const id_data {FlatVector::GetData<std::uint32_t>(data_chunk.data[0])};
+        const auto* const template_data {FlatVector::GetData<string_t>(data_chunk.data[1])};
+
+        for (auto&& row : std::views::iota(0UL, data_chunk.size()))
+        {
+            std::string_view log_template {template_data[row].GetData(), template_data[row].GetSize()};
+
+            // 模板由 token 以空格拼接而成，通配符的字面值在字典中固定映射为 WILDCARD
+            content.clear();
+            if (!log_template.empty())
+            {
+                for (auto&& token : std::views::split(log_template, ' '))
+                {
+                    content.push_back(token_dict.intern(std::string_view {token}));
+                }
+            }
+            matcher.add(id_data[row], content, std::string {log_template});
+        }
+    }
+
+    matcher.build();
+    return matcher;
+}
+
+std::uint32_t TemplateMatcher::_match(
+    const TContent& content, std::size_t pos, std::uint32_t node, std::unordered_set<std::uint64_t>& failed
+) const
+{
+    const auto& cur_node {this->m_nodes[node]};
+    if (pos == content.size())
+    {
+        return cur_node.template_id;
+    }
+
+    auto key {(static_cast<std::uint64_t>(node) << 32) | pos};
+    if (failed.contains(key))
+    {
+        return NO_TEMPLATE_ID;
+    }
+
+    // 先沿常量边匹配
+    auto edges {std::span {this->m_edges}.subspan(cur_node.edge_begin, cur_node.edge_end - cur_node.edge_begin)};
+    if (auto it {std::ranges::lower_bound(edges, content[pos], {}, &Edge::first)};
+        it != edges.end() && it->first == content[pos])
+    {
+        if (auto template_id {this->_match(content, pos + 1, it->second, failed)}; template_id != NO_TEMPLATE_ID)
+        {
+            return template_id;
+        }
+    }
+
+    // 再让通配符依次吞下 1 个、2 个……token
+    if (cur_node.wildcard_child != NO_NODE)
+    {
+        for (auto&& end : std::views::iota(pos + 1, content.size() + 1))
+        {
+            if (auto template_id {this->_match(content, end, cur_node.wildcard_child, failed)};
+                template_id != NO_TEMPLATE_ID)
+            {
+                return template_id;
+            }
+        }
+    }
+
+    failed.insert(key);
+    return NO_TEMPLATE_ID;
+}
+
+}    // namespace logtt
@@ -0,0 +1,69 @@
+#pragma once
+
+#include "precomp.hxx"
+#include "token_dict.hxx"
+#include <cstdint>
+#include <optional>
+#include <string>
+#include <unordered_set>
+#include <vector>
+
+namespace logtt
+{
+
+// 只读的模板匹配器：把一组模板编译成带通配符边的 token 前缀树，只做匹配，不会修改任何模板
+// 通配符匹配一个或多个 token；多个模板都能匹配时，优先沿常量边走，通配符优先匹配更少的 token
+// 编译完成后不再有任何写操作，可以在多个线程上同时匹配
+class TemplateMatcher
+{
+public:
+    struct Template
+    {
+        std::uint32_t id;
+        std::string   log_template;
+    };
+
+    TemplateMatcher();
+
+    // 添加一个模板，全部添加完成后调用 build
+    void add(std::uint32_t template_id, const TContent& content, std::string log_template);
+    // 把每个节点的子边按 token 排序后放入连续的边数组
+    void build();
+
+    // 返回匹配到的 TemplateID，匹配不到时返回 NO_TEMPLATE_ID
+    [[nodiscard]]
+    std::uint32_t match(const TContent& content) const;
+    [[nodiscard]]
+    const std::vector<Template>& templates() const;
+
+    // 从模板表编译匹配器，模板按空格切分成 token 后写入 token_dict，表不存在时返回空
+    static std::optional<TemplateMatcher>
+        from_table(Connection& conn, const std::string& templates_table_name, TokenDict& token_dict);
+
+private:
+    static constexpr std::uint32_t NO_NODE {std::numeric_limits<std::uint32_t>::max()};
+
+    using Edge = std::pair<Token, std::uint32_t>;
+
+    struct Node
+    {
+        // 常量边在 m_edges 中的范围
+        std::uint32_t edge_begin {0};
+        std::uint32_t edge_end {0};
+        std::uint32_t wildcard_child {NO_NODE};
+        std::uint32_t template_id {NO_TEMPLATE_ID};
+    };
+
+    // 从 node 开始匹配 content[pos:]，failed 记录已经确定匹配不到的 (节点, 位置)，避免通配符回溯时重复搜索
+    std::uint32_t _match(
+        const TContent& content, std::size_t pos, std::uint32_t node, std::unordered_set<std::uint64_t>& failed
+    ) const;
+
+    std::vector<Node>     m_nodes;
+    std::vector<Edge>     m_edges;
+    std::vector<Template> m_templates;
+    // 编译期间每个节点的常量边，build 之后清空
+    std::vector<std::vector<Edge>> m_pending_edges;
+};
+
+}    // namespace logtt
@@ -0,0 +1,459 @@
+#include "timestamp_parser.hxx"
+#include <algorithm>
+#include <array>
+#include <cctype>
+#include <charconv>
+#include <chrono>
+#include <ranges>
+
+namespace logtt
+{
+
+namespace
+{
+
+constexpr std::array<std::string_view, 12> MONTH_NAMES {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november",
+    "december"
+};
+constexpr std::array<std::string_view, 7> WEEKDAY_NAMES {
+    "sunday", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday"
+};
+
+// 依次读取多个字段的游标，字段之间视为一个空格，与 concat_ws(' ', ...) 的结果一致
+class Cursor
+{
+public:
+    struct Mark
+    {
+        std::size_t field;
+        std::size_t pos;
+    };
+
+    explicit Cursor(std::span<const std::string_view> fields):
+        m_fields {fields}
+    {}
+
+    [[nodiscard]]
+    bool at_end() const
+    {
+        return this->m_field >= this->m_fields.size() ||
+               (this->m_field + 1 == this->m_fields.size() && this->m_pos == this->m_fields[this->m_field].size());
+    }
+
+    // 当前字符，到达结尾时返回 '\0'
+    [[nodiscard]]
+    char peek() const
+    {
+        if (this->at_end())
+        {
+            return '\0';
+        }
+        const auto& field {this->m_fields[this->m_field]};
+        return this->m_pos < field.size() ? field[this->m_pos] : ' ';
+    }
+
+    void advance()
+    {
+        if (this->m_pos < this->m_fields[this->m_field].size())
+        {
+            ++this->m_pos;
+        }
+        else
+        {
+            ++this->m_field;
+            this->m_pos = 0;
+        }
+    }
+
+    // 当前位置之后是 text 时跳过它并返回 true，否则不移动
+    bool consume(std::string_view text)
+    {
+        auto cursor {*this};
+        for (auto&& c : text)
+        {
+            if (cursor.at_end() || cursor.peek() != c)
+            {
+                return false;
+            }
+            cursor.advance();
+        }
+        *this = cursor;
+        return true;
+    }
+
+    [[nodiscard]]
+    Mark mark() const
+    {
+        return {this->m_field, this->m_pos};
+    }
+
+    // 从 begin 到当前位置的原文
+    [[nodiscard]]
+    std::string text_from(Mark begin) const
+    {
+        Cursor      cursor {this->m_fields};
+        std::string text;
+        cursor.m_field = begin.field;
+        cursor.m_pos   = begin.pos;
+        while (cursor.m_field != this->m_field || cursor.m_pos != this->m_pos)
+        {
+            text.push_back(cursor.peek());
+            cursor.advance();
+        }
+        return text;
+    }
+
+private:
+    std::span<const std::string_view> m_fields;
+    std::size_t                       m_field {0};
+    std::size_t                       m_pos {0};
+};
+
+// 读取 1 到 width 位数字
+std::optional<std::int64_t> _read_number(Cursor& cursor, std::uint8_t width)
+{
+    std::int64_t number {0};
+    std::uint8_t digits {0};
+    while (digits < width && std::isdigit(static_cast<unsigned char>(cursor.peek())))
+    {
+        number = number * 10 + (cursor.peek() - '0');
+        cursor.advance();
+        ++digits;
+    }
+    if (digits == 0)
+    {
+        return std::nullopt;
+    }
+    return number;
+}
+
+// 不区分大小写地匹配名称，返回其下标
+template <std::size_t N>
+std::optional<std::size_t> _read_name(Cursor& cursor, const std::array<std::string_view, N>& names, std::uint8_t width)
+{
+    for (auto&& [i, name] : std::views::enumerate(names))
+    {
+        auto expected {width == 0 ? name : name.substr(0, width)};
+
+        auto candidate {cursor};
+        auto matched {true};
+        for (auto&& c : expected)
+        {
+            if (std::tolower(static_cast<unsigned char>(candidate.peek())) != c)
+            {
+                matched = false;
+                break;
+            }
+            candidate.advance();
+        }
+        if (matched)
+        {
+            cursor = candidate;
+            return static_cast<std::size_t>(i);
+        }
+    }
+    return std::nullopt;
+}
+
+}    // namespace
+
+std::optional<TimestampParser> TimestampParser::compile(std::string_view timestamp_format, std::int32_t default_year)
+{
+    TimestampParser parser;
+    parser.m_default_year = default_year;
+    if (timestamp_format == "epoch")
+    {
+        parser.m_epoch = true;
+        return parser;
+    }
+
+    for (std::size_t pos {0}; pos < timestamp_format.size(); ++pos)
+    {
+        auto c {timestamp_format[pos]};
+        if (std::isspace(static_cast<unsigned char>(c)))
+        {
+            // 连续的空白只需要一步
+            if (parser.m_steps.empty() || parser.m_steps.back().item != Item::SPACE)
+            {
+                parser.m_steps.push_back({Item::SPACE});
+            }
+            continue;
+        }
+        if (c != '%')
+        {
+            parser.m_steps.push_back({Item::LITERAL, c});
+            continue;
+        }
+
+        // %-d 这类不补零的写法解析方式相同
+        if (++pos < timestamp_format.size() && timestamp_format[pos] == '-')
+        {
+            ++pos;
+        }
+        if (pos >= timestamp_format.size())
+        {
+            return std::nullopt;
+        }
+
+        switch (timestamp_format[pos])
+        {
+        case 'Y':
+            parser.m_steps.push_back({Item::YEAR, 0, 4});
+            break;
+        case 'y':
+            parser.m_steps.push_back({Item::YEAR_2, 0, 2});
+            break;
+        case 'm':
+            parser.m_steps.push_back({Item::MONTH, 0, 2});
+            break;
+        case 'b':
+        case 'h':
+            parser.m_steps.push_back({Item::MONTH_NAME, 0, 3});
+            break;
+        case 'B':
+            parser.m_steps.push_back({Item::MONTH_NAME, 0, 0});
+            break;
+        case 'd':
+            parser.m_steps.push_back({Item::DAY, 0, 2});
+            break;
+        case 'a':
+            parser.m_steps.push_back({Item::WEEKDAY_NAME, 0, 3});
+            break;
+        case 'A':
+            parser.m_steps.push_back({Item::WEEKDAY_NAME, 0, 0});
+            break;
+        case 'H':
+            parser.m_steps.push_back({Item::HOUR, 0, 2});
+            break;
+        case 'M':
+            parser.m_steps.push_back({Item::MINUTE, 0, 2});
+            break;
+        case 'S':
+            parser.m_steps.push_back({Item::SECOND, 0, 2});
+            break;
+        case 'g':
+            parser.m_steps.push_back({Item::FRACTION, 0, 3});
+            break;
+        case 'f':
+            parser.m_steps.push_back({Item::FRACTION, 0, 6});
+            break;
+        case 'n':
+            parser.m_steps.push_back({Item::FRACTION, 0, 9});
+            break;
+        case '%':
+            parser.m_steps.push_back({Item::LITERAL, '%'});
+            break;
+        default:
+            return std::nullopt;
+        }
+    }
+
+    // 日期说明符全部位于时间说明符之前时，日期部分的原文可以在相邻行之间复用
+    std::size_t date_end {0};
+    std::size_t time_begin {parser.m_steps.size()};
+    for (auto&& [i, step] : std::views::enumerate(parser.m_steps))
+    {
+        if (step.item == Item::LITERAL || step.item == Item::SPACE)
+        {
+            continue;
+        }
+        if (step.item <= Item::WEEKDAY_NAME)
+        {
+            date_end = static_cast<std::size_t>(i) + 1;
+        }
+        else
+        {
+            time_begin = std::min(time_begin, static_cast<std::size_t>(i));
+        }
+    }
+    parser.m_date_steps = date_end <= time_begin ? date_end : 0;
+
+    return parser;
+}
+
+std::optional<std::int64_t>
+TimestampParser::parse(std::span<const std::string_view> fields, DateCache& cache) const
+{
+    if (this->m_epoch)
+    {
+        return this->_parse_epoch(fields);
+    }
+
+    Cursor                      cursor {fields};
+    std::int64_t                year {this->m_default_year};
+    std::int64_t                month {1};
+    std::int64_t                day {1};
+    std::int64_t                seconds {0};
+    std::optional<std::int64_t> days;
+    std::size_t                 step_begin {0};
+
+    // 日期部分连同其后的一个字符都与上一行相同时，解析结果一定相同
+    // 缓存的最后一个字符只用于比较，不属于日期部分
+    if (this->m_date_steps > 0 && cache.valid && Cursor {cursor}.consume(cache.text))
+    {
+        cursor.consume(std::string_view {cache.text}.substr(0, cache.text.size() - 1));
+        days       = cache.days;
+        step_begin = this->m_date_steps;
+    }
+
+    auto date_begin {cursor.mark()};
+    auto finish_date {
+        [&]() -> bool
+        {
+            std::chrono::year_month_day ymd {
+                std::chrono::year {static_cast<int>(year)},
+                std::chrono::month {static_cast<unsigned>(month)},
+                std::chrono::day {static_cast<unsigned>(day)}
+            };
+            if (!ymd.ok())
+            {
+                return false;
+            }
+            days = std::chrono::sys_days {ymd}.time_since_epoch().count();
+
+            if (this->m_date_steps > 0)
+            {
+                cache.text = cursor.text_from(date_begin);
+                cache.text.push_back(cursor.peek());
+                cache.days  = *days;
+                cache.valid = true;
+            }
+            return true;
+        }
+    };
+
+    for (auto&& i : std::views::iota(step_begin, this->m_steps.size()))
+    {
+        if (i == this->m_date_steps && !days && !finish_date())
+        {
+            return std::nullopt;
+        }
+
+        const auto& step {this->m_steps[i]};
+        if (step.item == Item::LITERAL)
+        {
+            if (cursor.at_end() || cursor.peek() != step.literal)
+            {
+                return std::nullopt;
+            }
+            cursor.advance();
+            continue;
+        }
+        if (step.item == Item::SPACE)
+        {
+            while (!cursor.at_end() && std::isspace(static_cast<unsigned char>(cursor.peek())))
+            {
+                cursor.advance();
+            }
+            continue;
+        }
+        if (step.item == Item::MONTH_NAME || step.item == Item::WEEKDAY_NAME)
+        {
+            auto index {
+                step.item == Item::MONTH_NAME ? _read_name(cursor, MONTH_NAMES, step.width)
+                                              : _read_name(cursor, WEEKDAY_NAMES, step.width)
+            };
+            if (!index)
+            {
+                return std::nullopt;
+            }
+            if (step.item == Item::MONTH_NAME)
+            {
+                month = static_cast<std::int64_t>(*index) + 1;
+            }
+            continue;
+        }
+
+        auto number {_read_number(cursor, step.width)};
+        if (!number)
+        {
+            return std::nullopt;
+        }
+        switch (step.item)
+        {
+        case Item::YEAR:
+            year = *number;
+            break;
+        case Item::YEAR_2:
+            // 与 POSIX 一致：69-99 为 19xx，00-68 为 20xx
+            year = *number + (*number >= 69 ? 1900 : 2000);
+            break;
+        case Item::MONTH:
+            month = *number;
+            break;
+        case Item::DAY:
+            day = *number;
+            break;
+        case Item::HOUR:
+            if (*number > 23)
+            {
+                return std::nullopt;
+            }
+            seconds += *number * 3600;
+            break;
+        case Item::MINUTE:
+            if (*number > 59)
+            {
+                return std::nullopt;
+            }
+            seconds += *number * 60;
+            break;
+        case Item::SECOND:
+            if (*number > 59)
+            {
+                return std::nullopt;
+            }
+            seconds += *number;
+            break;
+        default:
+            // 秒以下的部分在 TIMESTAMP_S 中会被截掉
+            break;
+        }
+    }
+
+    // 结尾只允许空白
+    while (!cursor.at_end() && std::isspace(static_cast<unsigned char>(cursor.peek())))
+    {
+        cursor.advance();
+    }
+    if (!cursor.at_end() || (!days && !finish_date()))
+    {
+        return std::nullopt;
+    }
+
+    return *days * 86400 + seconds;
+}
+
+std::optional<std::int64_t> TimestampParser::_parse_epoch(std::span<const std::string_view> fields) const
+{
+    if (fields.empty())
+    {
+        return std::nullopt;
+    }
+
+    // 与 CAST(... AS BIGINT) 一致：允许首尾空白和正号
+    auto text {fields[0]};
+    while (!text.empty() && std::isspace(static_cast<unsigned char>(text.front())))
+    {
+        text.remove_prefix(1);
+    }
+    while (!text.empty() && std::isspace(static_cast<unsigned char>(text.back())))
+    {
+        text.remove_suffix(1);
+    }
+    if (text.starts_with('+'))
+    {
+        text.remove_prefix(1);
+    }
+
+    std::int64_t epoch {0};
+    auto [end, ec] {std::from_chars(text.data(), text.data() + text.size(), epoch)};
+    if (ec != std::errc {} || end != text.data() + text.size())
+    {
+        return std::nullopt;
+    }
+    return epoch;
+}
+
+}    // namespace logtt
@@ -0,0 +1,69 @@
+#pragma once
+
+#include <cstdint>
+#include <optional>
+#include <span>
+#include <string>
+#include <string_view>
+#include <vector>
+
+namespace logtt
+{
+
+// 按 strptime 格式预先编译的时间戳解析器，结果为 1970-01-01 以来的秒数（TIMESTAMP_S）
+// 多个时间戳字段按以空格连接后的文本解析，但不会真的拼接字符串；格式为 "epoch" 时第一个字段是 Unix 时间戳
+// 格式中没有年份时使用 default_year；秒以下的部分只校验不保留
+class TimestampParser
+{
+public:
+    // 同一批中相邻的行常常落在同一天，缓存上一行日期部分的原文和对应的天数，原文相同时直接复用
+    struct DateCache
+    {
+        std::string  text;
+        std::int64_t days {0};
+        bool         valid {false};
+    };
+
+    // 格式中有不支持的说明符时返回空，此时应使用 strptime
+    static std::optional<TimestampParser> compile(std::string_view timestamp_format, std::int32_t default_year);
+
+    // 解析失败时返回空
+    [[nodiscard]]
+    std::optional<std::int64_t> parse(std::span<const std::string_view> fields, DateCache& cache) const;
+
+private:
+    enum class Item : std::uint8_t
+    {
+        LITERAL,
+        SPACE,
+        YEAR,
+        YEAR_2,
+        MONTH,
+        MONTH_NAME,
+        DAY,
+        WEEKDAY_NAME,
+        HOUR,
+        MINUTE,
+        SECOND,
+        FRACTION,
+    };
+
+    struct Step
+    {
+        Item item;
+        // LITERAL 的字符
+        char literal {0};
+        // 数字的最大位数；名称为 3 时只匹配缩写，为 0 时只匹配全称
+        std::uint8_t width {0};
+    };
+
+    std::optional<std::int64_t> _parse_epoch(std::span<const std::string_view> fields) const;
+
+    std::vector<Step> m_steps;
+    // 前 m_date_steps 步只涉及日期，这部分的原文可以在相邻行之间复用，为 0 时不复用
+    std::size_t  m_date_steps {0};
+    std::int32_t m_default_year {1900};
+    bool         m_epoch {false};
+};
+
+}    // namespace logtt
@@ -0,0 +1,180 @@
+#include "token_dict.hxx"
+#include <algorithm>
+#include <cstring>
+#include <ranges>
+#include <span>
+
+namespace logtt
+{
+
+TokenDict::TokenDict()
+{
+    this->clear();
+}
+
+Token TokenDict::intern(std::string_view token)
+{
+    if (auto it {this->m_ids.find(token)}; it != this->m_ids.end())
+    {
+        return it->second;
+    }
+
+    auto id {static_cast<Token>(this->m_tokens.size())};
+    auto stored {this->_store(token)};
+    this->m_tokens.push_back(stored);
+    this->m_ids.emplace(stored, id);
+    return id;
+}
+
+std::string_view TokenDict::get(Token id) const
+{
+    return this->m_tokens[id];
+}
+
+std::string TokenDict::to_string(const TContent& content) const
+{
+    std::size_t length {content.empty() ? 0 : content.size() - 1};
+    for (auto&& id : content)
+    {
+        length += this->m_tokens[id].size();
+    }
+
+    std::string str;
+    str.reserve(length);
+    for (auto&& [i, id] : std::views::enumerate(content))
+    {
+        if (i > 0)
+        {
+            str.push_back(' ');
+        }
+        str.append(this->m_tokens[id]);
+    }
+
+    return str;
+}
+
+std::size_t TokenDict::size() const
+{
+    return this->m_tokens.size();
+}
+
+bool TokenDict::contains(Token id) const
+{
+    return id < this->m_tokens.size();
+}
+
+bool TokenDict::contains(const TContent& content) const
+{
+    return std::ranges::all_of(
+        content,
+        [this](Token id) -> bool
+        {
+            return this->contains(id);
+        }
+    );
+}
+
+void TokenDict::clear()
+{
+    this->m_blocks.clear();
+    this->m_cur_block  = nullptr;
+    this->m_block_used = ARENA_BLOCK_SIZE;
+    this->m_tokens.clear();
+    this->m_ids.clear();
+
+    // WILDCARD 是保留 ID，字面值为 <#*#> 的 token 也会映射到它
+    this->m_tokens.push_back(WILDCARD_STR);
+    this->m_ids.emplace(WILDCARD_STR, WILDCARD);
+}
+
+void TokenDict::save(SnapshotWriter& writer) const
+{
+    // WILDCARD 在 clear() 中固定插入，不需要写入快照
+    auto tokens {std::span {this->m_tokens}.subspan(1)};
+
+    std::vector<std::uint32_t> lengths;
+    lengths.reserve(tokens.size());
+    for (auto&& token : tokens)
+    {
+        lengths.push_back(static_cast<std::uint32_t>(token.size()));
+    }
+    writer.write_array<std::uint32_t>(lengths);
+
+    for (auto&& token : tokens)
+    {
+        writer.write_bytes(token);
+    }
+}
+
+bool TokenDict::load(SnapshotReader& reader)
+{
+    std::vector<std::uint32_t> lengths;
+    if (!reader.read_array(lengths))
+    {
+        return false;
+    }
+
+    std::size_t total {0};
+    for (auto&& length : lengths)
+    {
+        total += length;
+    }
+    auto bytes {reader.read_bytes(total)};
+    if (!reader.good())
+    {
+        return false;
+    }
+
+    this->clear();
+    this->m_tokens.reserve(lengths.size() + 1);
+    this->m_ids.reserve(lengths.size() + 1);
+
+    char* block {nullptr};
+    if (total > 0)
+    {
+        block = this->m_blocks.emplace_back(std::make_unique_for_overwrite<char[]>(total)).get();
+        std::memcpy(block, bytes.data(), total);
+    }
+
+    std::size_t offset {0};
+    for (auto&& length : lengths)
+    {
+        std::string_view token {length > 0 ? block + offset : nullptr, length};
+        this->m_ids.emplace(token, static_cast<Token>(this->m_tokens.size()));
+        this->m_tokens.push_back(token);
+        offset += length;
+    }
+
+    return true;
+}
+
+std::string_view TokenDict::_store(std::string_view token)
+{
+    auto length {token.size()};
+    if (length == 0)
+    {
+        return {};
+    }
+
+    // 超长 token 单独分配一块，不占用当前块的剩余空间
+    if (length > ARENA_BLOCK_SIZE / 4)
+    {
+        auto& block {this->m_blocks.emplace_back(std::make_unique_for_overwrite<char[]>(length))};
+        std::memcpy(block.get(), token.data(), length);
+        return {block.get(), length};
+    }
+
+    if (this->m_block_used + length > ARENA_BLOCK_SIZE)
+    {
+        auto& block {this->m_blocks.emplace_back(std::make_unique_for_overwrite<char[]>(ARENA_BLOCK_SIZE))};
+        this->m_cur_block  = block.get();
+        this->m_block_used = 0;
+    }
+
+    auto* dst {this->m_cur_block + this->m_block_used};
+    std::memcpy(dst, token.data(), length);
+    this->m_block_used += length;
+    return {dst, length};
+}
+
+}    // namespace logtt
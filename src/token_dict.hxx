@@ -0,0 +1,65 @@
+#pragma once
+
+#include "precomp.hxx"
+#include "snapshot.hxx"
+#include <cstddef>
+#include <memory>
+#include <string>
+#include <string_view>
+#include <unordered_map>
+#include <vector>
+
+namespace logtt
+{
+
+// Token 字典：把每个不同的 token 映射成紧凑的整数 ID，WILDCARD 固定占用 ID 0
+// token 的字节统一存放在按块分配的 arena 中，避免每个 token 单独分配一次堆内存
+class TokenDict
+{
+public:
+    TokenDict();
+
+    TokenDict(const TokenDict&)            = delete;
+    TokenDict& operator=(const TokenDict&) = delete;
+
+    TokenDict(TokenDict&&) noexcept            = default;
+    TokenDict& operator=(TokenDict&&) noexcept = default;
+
+    ~TokenDict() = default;
+
+    // 返回 token 的 ID，首次出现时分配新 ID
+    Token intern(std::string_view token);
+
+    [[nodiscard]]
+    std::string_view get(Token id) const;
+    // 以空格拼接 token，得到模板字符串
+    [[nodiscard]]
+    std::string to_string(const TContent& content) const;
+    [[nodiscard]]
+    std::size_t size() const;
+    // token ID 是否由这个字典分配，用于校验从快照读入的 token
+    [[nodiscard]]
+    bool contains(Token id) const;
+    [[nodiscard]]
+    bool contains(const TContent& content) const;
+
+    void clear();
+
+    // 快照中依次存放每个 token 的长度和所有 token 拼接后的字节
+    // 加载时整段字节放入一个 arena 块，token 直接引用块内的字节
+    void save(SnapshotWriter& writer) const;
+    bool load(SnapshotReader& reader);
+
+private:
+    std::string_view _store(std::string_view token);
+
+    static constexpr std::size_t ARENA_BLOCK_SIZE {64 * 1024};
+
+    std::vector<std::unique_ptr<char[]>>        m_blocks;
+    char*                                       m_cur_block {nullptr};
+    std::size_t                                 m_block_used {ARENA_BLOCK_SIZE};
+    std::vector<std::string_view>               m_tokens;
+    std::unordered_map<std::string_view, Token> m_ids;
+};
+
+}    // namespace logtt
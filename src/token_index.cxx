@@ -0,0 +1,376 @@
+#include "token_index.hxx"
+#include <algorithm>
+#include <cctype>
+#include <format>
+#include <iterator>
+#include <ranges>
+
+namespace logtt
+{
+
+namespace
+{
+
+// 追加 value 的 LEB128 编码：每个字节保存 7 位，最高位表示后面还有字节
+void _encode_varint(std::uint64_t value, std::string& encoded)
+{
+    while (value >= 0x80)
+    {
+        encoded.push_back(static_cast<char>((value & 0x7F) | 0x80));
+        value >>= 7;
+    }
+    encoded.push_back(static_cast<char>(value));
+}
+
+// 把一个 posting 块解码后追加到 line_ids
+void _decode_postings(std::int64_t first_line_id, std::string_view encoded, std::vector<std::int64_t>& line_ids)
+{
+    auto          line_id {first_line_id};
+    std::uint64_t delta {0};
+    std::uint32_t shift {0};
+    line_ids.push_back(line_id);
+    for (auto&& c : encoded)
+    {
+        auto byte {static_cast<std::uint8_t>(c)};
+        delta |= static_cast<std::uint64_t>(byte & 0x7F) << shift;
+        if ((byte & 0x80) != 0)
+        {
+            shift += 7;
+            continue;
+        }
+        line_id += static_cast<std::int64_t>(delta);
+        line_ids.push_back(line_id);
+        delta = 0;
+        shift = 0;
+    }
+}
+
+// 空白字符与 std::isspace 在 C 语言区域下的定义一致
+bool _is_space(char c)
+{
+    return c == ' ' || (c >= '\t' && c <= '\r');
+}
+
+// INDEX_KEYS_FUNCTION 的实现，NULL 得到 NULL
+void _index_keys(DataChunk& args, [[maybe_unused]] ExpressionState& state, Vector& result)
+{
+    args.data[0].Flatten(args.size());
+    result.SetVectorType(VectorType::FLAT_VECTOR);
+    auto* result_data {FlatVector::GetData<list_entry_t>(result)};
+    auto& result_validity {FlatVector::Validity(result)};
+    auto& result_child {ListVector::GetEntry(result)};
+
+    const auto* const content_data {FlatVector::GetData<string_t>(args.data[0])};
+    const auto&       content_validity {FlatVector::Validity(args.data[0])};
+
+    std::vector<std::string> keys;
+    idx_t                    offset {0};
+    for (auto&& i : std::views::iota(0UL, args.size()))
+    {
+        if (!content_validity.RowIsValid(i))
+        {
+            result_validity.SetInvalid(i);
+            result_data[i] = {offset, 0};
+            continue;
+        }
+
+        split_index_keys({content_data[i].GetData(), content_data[i].GetSize()}, keys);
+        ListVector::Reserve(result, offset + keys.size());
+        auto* child_data {FlatVector::GetData<string_t>(result_child)};
+
+        result_data[i] = {offset, keys.size()};
+        for (auto&& key : keys)
+        {
+            child_data[offset++] = StringVector::AddString(result_child, key);
+        }
+    }
+    ListVector::SetListSize(result, offset);
+}
+
+}    // namespace
+
+std::string token_index_table_name(const std::string& structured_table_name)
+{
+    return "x_" + structured_table_name.substr(2);
+}
+
+std::string normalize_token(std::string_view token)
+{
+    auto is_punct {
+        [](char c) -> bool
+        {
+            return std::ispunct(static_cast<unsigned char>(c)) != 0;
+        }
+    };
+    while (!token.empty() && is_punct(token.front()))
+    {
+        token.remove_prefix(1);
+    }
+    while (!token.empty() && is_punct(token.back()))
+    {
+        token.remove_suffix(1);
+    }
+
+    std::string key {token};
+    for (auto&& c : key)
+    {
+        c = static_cast<char>(std::tolower(static_cast<unsigned char>(c)));
+    }
+    return key;
+}
+
+void split_index_keys(std::string_view content, std::vector<std::string>& keys)
+{
+    keys.clear();
+    std::size_t pos {0};
+    while (pos < content.size())
+    {
+        if (_is_space(content[pos]))
+        {
+            ++pos;
+            continue;
+        }
+
+        auto end {pos};
+        while (end < content.size() && !_is_space(content[end]))
+        {
+            ++end;
+        }
+        if (auto key {normalize_token(content.substr(pos, end - pos))}; !key.empty())
+        {
+            keys.push_back(std::move(key));
+        }
+        pos = end;
+    }
+}
+
+std::vector<std::string> search_keys(const std::vector<std::string>& terms)
+{
+    std::vector<std::string> keys;
+    std::vector<std::string> term_keys;
+    for (auto&& term : terms)
+    {
+        split_index_keys(term, term_keys);
+        for (auto&& key : term_keys)
+        {
+            if (!std::ranges::contains(keys, key))
+            {
+                keys.push_back(std::move(key));
+            }
+        }
+    }
+    return keys;
+}
+
+void register_token_index_functions(DuckDB& db)
+{
+    Connection conn {db};
+    conn.CreateVectorizedFunction(
+        std::string {INDEX_KEYS_FUNCTION}, {LogicalType::VARCHAR}, LogicalType::LIST(LogicalType::VARCHAR), _index_keys
+    );
+}
+
+std::optional<TokenIndexWriter> TokenIndexWriter::open(
+    Connection&        conn,
+    Connection&        append_conn,
+    const std::string& structured_table_name,
+    std::int64_t       line_offset
+)
+{
+    auto table_name {token_index_table_name(structured_table_name)};
+    if (line_offset == 0)
+    {
+        conn.Query(
+            std::format(
+                R"(
+                DROP TABLE IF EXISTS {0};
+                CREATE TABLE {0}
+                (
+                    Token       VARCHAR,
+                    FirstLineID BIGINT,
+                    LastLineID  BIGINT,
+                    LineCount   UINTEGER,
+                    Postings    BLOB
+                );
+                CREATE INDEX {0}_token ON {0} (Token);
+            )",
+                table_name
+            )
+        );
+    }
+    else if (conn.TableInfo(table_name) == nullptr)
+    {
+        return std::nullopt;
+    }
+
+    return TokenIndexWriter {append_conn, table_name};
+}
+
+TokenIndexWriter::TokenIndexWriter(Connection& append_conn, const std::string& table_name):
+    m_appender {make_uniq<Appender>(append_conn, table_name)}
+{}
+
+void TokenIndexWriter::add(std::int64_t line_id, std::string_view content)
+{
+    split_index_keys(content, this->m_line_keys);
+    for (auto&& line_key : this->m_line_keys)
+    {
+        // try_emplace 只在插入时才移动 line_key
+        auto [it, inserted] {
+            this->m_key_ids.try_emplace(std::move(line_key), static_cast<std::uint32_t>(this->m_keys.size()))
+        };
+        if (inserted)
+        {
+            this->m_keys.push_back(it->first);
+            this->m_postings.emplace_back();
+        }
+
+        // 一行中重复出现的键只记录一次
+        auto& postings {this->m_postings[it->second]};
+        if (postings.empty() || postings.back() != line_id)
+        {
+            postings.push_back(line_id);
+        }
+    }
+}
+
+void TokenIndexWriter::flush()
+{
+    std::string encoded;
+    for (auto&& [key, postings] : std::views::zip(this->m_keys, this->m_postings))
+    {
+        if (postings.empty())
+        {
+            continue;
+        }
+
+        // 第一个 LineID 保存在 FirstLineID 中，之后只编码与前一个 LineID 的差
+        encoded.clear();
+        for (auto&& [prev, line_id] : std::views::pairwise(postings))
+        {
+            _encode_varint(static_cast<std::uint64_t>(line_id - prev), encoded);
+        }
+
+        this->m_appender->AppendRow(
+            Value {std::string {key}},
+            Value::BIGINT(postings.front()),
+            Value::BIGINT(postings.back()),
+            Value::UINTEGER(static_cast<std::uint32_t>(postings.size())),
+            Value::BLOB(reinterpret_cast<const_data_ptr_t>(encoded.data()), encoded.size())
+        );
+        postings.clear();
+    }
+}
+
+void TokenIndexWriter::close()
+{
+    this->m_appender->Close();
+}
+
+std::optional<std::vector<std::int64_t>> search_token_index(
+    Connection&                     conn,
+    const std::string&              structured_table_name,
+    const std::vector<std::string>& terms,
+    bool                            match_all
+)
+{
+    auto table_name {token_index_table_name(structured_table_name)};
+    if (conn.TableInfo(table_name) == nullptr)
+    {
+        return std::nullopt;
+    }
+
+    auto keys {search_keys(terms)};
+    if (keys.empty())
+    {
+        return std::vector<std::int64_t> {};
+    }
+
+    // Token = $1 的查找走 ART 索引，只读取这个词的 posting 块
+    auto statement {conn.Prepare(
+        std::format("SELECT FirstLineID, Postings FROM {} WHERE Token = $1 ORDER BY FirstLineID", table_name)
+    )};
+    if (statement->HasError())
+    {
+        statement->error.Throw();
+    }
+
+    // 同一个词的块互不重叠，按 FirstLineID 的顺序解码后 LineID 仍然递增
+    auto read_postings {
+        [&](const std::string& key) -> std::vector<std::int64_t>
+        {
+            vector<Value> values {Value {key}};
+            auto          result {statement->Execute(values, false)};
+            if (result->HasError())
+            {
+                result->ThrowError();
+            }
+
+            std::vector<std::int64_t> line_ids;
+            while (auto chunk {result->Fetch()})
+            {
+                chunk->Flatten();
+                const auto* first_line_id_data {FlatVector::GetData<std::int64_t>(chunk->data[0])};
+                const auto* postings_data {FlatVector::GetData<string_t>(chunk->data[1])};
+                for (auto&& row : std::views::iota(0UL, chunk->size()))
+                {
+                    const auto& postings {postings_data[row]};
+                    _decode_postings(
+                        first_line_id_data[row], std::string_view {postings.GetData(), postings.GetSize()}, line_ids
+                    );
+                }
+            }
+            return line_ids;
+        }
+    };
+
+    std::vector<std::int64_t> line_ids;
+    if (match_all)
+    {
+        // 交集：任意一个词没有命中时结果一定为空，不再读取后面的词
+        std::vector<std::vector<std::int64_t>> postings_lists;
+        for (auto&& key : keys)
+        {
+            auto postings {read_postings(key)};
+            if (postings.empty())
+            {
+                return std::vector<std::int64_t> {};
+            }
+            postings_lists.push_back(std::move(postings));
+        }
+
+        // 从最短的列表开始求交集，中间结果不会超过最短的列表
+        std::ranges::sort(
+            postings_lists,
+            [](const auto& lhs, const auto& rhs) -> bool
+            {
+                return lhs.size() < rhs.size();
+            }
+        );
+        line_ids = std::move(postings_lists.front());
+        std::vector<std::int64_t> intersection;
+        for (auto&& postings : postings_lists | std::views::drop(1))
+        {
+            intersection.clear();
+            std::ranges::set_intersection(line_ids, postings, std::back_inserter(intersection));
+            std::swap(line_ids, intersection);
+        }
+    }
+    else
+    {
+        for (auto&& key : keys)
+        {
+            auto postings {read_postings(key)};
+            line_ids.insert(line_ids.end(), postings.begin(), postings.end());
+        }
+        if (keys.size() > 1)
+        {
+            std::ranges::sort(line_ids);
+            line_ids.erase(std::ranges::unique(line_ids).begin(), line_ids.end());
+        }
+    }
+
+    return line_ids;
+}
+
+}    // namespace logtt
@@ -0,0 +1,77 @@
+#pragma once
+
+#include "precomp.hxx"
+#include <cstdint>
+#include <optional>
+#include <string>
+#include <string_view>
+#include <unordered_map>
+#include <vector>
+
+namespace logtt
+{
+
+// 结构化表 s_N 对应的倒排索引表 x_N，每行是一个 token 在一批日志中的 posting 块
+// (Token, FirstLineID, LastLineID, LineCount, Postings)：Postings 依次保存相邻 LineID 之差的 LEB128 变长编码
+// 同一个 token 的块按 FirstLineID 递增且互不重叠，Token 列上建有 ART 索引，查找一个 token 只读取它自己的块
+std::string token_index_table_name(const std::string& structured_table_name);
+
+// 搜索规则：一行的键由原始的 Content 得到，按 ASCII 空白切分后逐个用 normalize_token 规范化，丢弃空键
+// 搜索词按同样的规则切分为键，一行包含某个键当且仅当这一行的键中有与之完全相同的键
+// 倒排索引与没有索引时的回退搜索（在 SQL 中调用 INDEX_KEYS_FUNCTION）使用同一个实现，两者的结果总是一致
+// 搜索的是原始内容而不是掩码后的 token，被掩码规则替换掉的 IP、数字等也可以搜索
+
+// 键的规范化：去掉首尾的 ASCII 标点并把 ASCII 字母转为小写，"[ERROR]" 与 "error," 都对应 "error"
+// 全部由标点组成的 token 得到空串，不会被索引
+std::string normalize_token(std::string_view token);
+// 按搜索规则把 content 切分为键，结果写入 keys，同一个键可能出现多次
+void split_index_keys(std::string_view content, std::vector<std::string>& keys);
+// 搜索词对应的键，去掉重复的键；一个搜索词中含有空白时切分为多个键
+std::vector<std::string> search_keys(const std::vector<std::string>& terms);
+
+// 标量函数 _index_keys(VARCHAR) -> VARCHAR[]，按搜索规则返回一行的键
+inline constexpr std::string_view INDEX_KEYS_FUNCTION {"_index_keys"};
+// 注册 INDEX_KEYS_FUNCTION，函数注册在数据库实例上，只需注册一次
+void register_token_index_functions(DuckDB& db);
+
+// 解析时逐行收集键的 posting，每批日志写完后调用 flush 把这一批的 posting 块追加到索引表
+class TokenIndexWriter
+{
+public:
+    // 从头解析时重建索引表；增量解析时只有索引表已存在才继续追加，否则返回空，避免得到只覆盖部分日志的索引
+    static std::optional<TokenIndexWriter> open(
+        Connection&        conn,
+        Connection&        append_conn,
+        const std::string& structured_table_name,
+        std::int64_t       line_offset
+    );
+
+    // 记录 LineID 为 line_id、原始内容为 content 的行中的键，行必须按 LineID 递增的顺序加入
+    void add(std::int64_t line_id, std::string_view content);
+    // 把已收集的 posting 编码后写入索引表，并清空收集的 posting
+    void flush();
+    void close();
+
+private:
+    TokenIndexWriter(Connection& append_conn, const std::string& table_name);
+
+    unique_ptr<Appender>                           m_appender;
+    std::unordered_map<std::string, std::uint32_t> m_key_ids;
+    // 下标为键下标，引用 m_key_ids 中的键
+    std::vector<std::string_view> m_keys;
+    // 每个键在当前批中的 LineID，递增且不重复
+    std::vector<std::vector<std::int64_t>> m_postings;
+    // 当前行的键，在各行之间复用
+    std::vector<std::string> m_line_keys;
+};
+
+// 查找包含全部（match_all 为真）或任意一个 terms 的行，返回递增的 LineID；没有倒排索引时返回空
+// terms 按 search_keys 切分为键后与索引中的键整词比较
+std::optional<std::vector<std::int64_t>> search_token_index(
+    Connection&                     conn,
+    const std::string&              structured_table_name,
+    const std::vector<std::string>& terms,
+    bool                            match_all
+);
+
+}    // namespace logtt
@@ -1,6 +1,19 @@
 #include "utils.hxx"
+#include "field_splitter.hxx"
+#include "mask_prefilter.hxx"
+#include "timestamp_parser.hxx"
+#include <boost/container_hash/hash.hpp>
+#include <algorithm>
+#include <array>
+#include <atomic>
+#include <chrono>
+#include <filesystem>
 #include <format>
+#include <functional>
+#include <mutex>
 #include <ranges>
+#include <unordered_set>
+#include <utility>
 
 namespace logtt
 {
@@ -8,9 +21,132 @@ namespace logtt
 namespace
 {
 
-unique_ptr<ParsedExpression>
-_build_timestamp_expr(const std::vector<std::string>& timestamp_fields, const std::string& timestamp_format)
+// 日志文件最后修改时间所在的年份，用于补全不含年份的时间戳，取不到时使用当前年份
+std::int32_t _default_year(const std::string& log_file)
 {
+    auto now {std::chrono::system_clock::now()};
+
+    std::error_code ec;
+    auto            write_time {std::filesystem::last_write_time(log_file, ec)};
+    if (!ec)
+    {
+        now = std::chrono::time_point_cast<std::chrono::system_clock::duration>(
+            std::chrono::clock_cast<std::chrono::system_clock>(write_time)
+        );
+    }
+
+    std::chrono::year_month_day ymd {std::chrono::floor<std::chrono::days>(now)};
+    return static_cast<int>(ymd.year());
+}
+
+// UDF 注册在整个数据库共享的系统目录中，同名函数只能注册一次
+// 函数名由构造 UDF 的参数哈希得到，同名的 UDF 行为相同，之后的调用直接复用已经注册的函数
+void _register_udf_once(const std::string& udf_name, const std::function<void()>& register_udf)
+{
+    static std::mutex                      mutex;
+    static std::unordered_set<std::string> registered;
+
+    std::lock_guard lock {mutex};
+    if (registered.contains(udf_name))
+    {
+        return;
+    }
+    register_udf();
+    registered.insert(udf_name);
+}
+
+// 注册按 timestamp_format 预编译的时间戳解析 UDF，参数为各个时间戳字段，返回 TIMESTAMP_S
+void _register_timestamp_parser(
+    Connection&        conn,
+    const std::string& udf_name,
+    TimestampParser    parser,
+    std::size_t        field_count,
+    const std::string& timestamp_format
+)
+{
+    auto udf {
+        [parser {std::move(parser)}, timestamp_format](
+            DataChunk& args, [[maybe_unused]] ExpressionState& state, Vector& result
+        ) -> void
+        {
+            args.Flatten();
+            result.SetVectorType(VectorType::FLAT_VECTOR);
+            auto* result_data {FlatVector::GetData<std::int64_t>(result)};
+            auto& result_validity {FlatVector::Validity(result)};
+
+            // 缓存只在一批之内有效，不同线程上的批互不影响
+            TimestampParser::DateCache    cache;
+            std::vector<std::string_view> fields;
+            fields.reserve(args.ColumnCount());
+            for (auto&& i : std::views::iota(0UL, args.size()))
+            {
+                // 与 concat_ws 一致，跳过为 NULL 的字段
+                fields.clear();
+                for (auto&& column : args.data)
+                {
+                    if (FlatVector::Validity(column).RowIsValid(i))
+                    {
+                        const auto& field {FlatVector::GetData<string_t>(column)[i]};
+                        fields.emplace_back(field.GetData(), field.GetSize());
+                    }
+                }
+                if (fields.empty())
+                {
+                    result_validity.SetInvalid(i);
+                    continue;
+                }
+
+                auto seconds {parser.parse(fields, cache)};
+                if (!seconds)
+                {
+                    throw InvalidInputException(
+                        std::format("Could not parse timestamp \"{}\" with format \"{}\"", fields[0], timestamp_format)
+                    );
+                }
+                result_data[i] = *seconds;
+            }
+        }
+    };
+    conn.CreateVectorizedFunction(
+        udf_name, vector<LogicalType>(field_count, LogicalType::VARCHAR), LogicalType::TIMESTAMP_S, std::move(udf)
+    );
+}
+
+unique_ptr<ParsedExpression> _build_timestamp_expr(
+    Connection&                     conn,
+    const std::string&              log_file,
+    const std::vector<std::string>& timestamp_fields,
+    const std::string&              timestamp_format
+)
+{
+    // 常见的格式使用预编译的解析器，直接读取各个字段，不需要拼接后再调用 strptime
+    auto default_year {_default_year(log_file)};
+    if (auto parser {TimestampParser::compile(timestamp_format, default_year)})
+    {
+        std::size_t seed {0};
+        boost::hash_combine(seed, timestamp_format);
+        boost::hash_combine(seed, timestamp_fields.size());
+        boost::hash_combine(seed, default_year);
+
+        auto udf_name {std::format("_parse_timestamp_{:x}", seed)};
+        _register_udf_once(
+            udf_name,
+            [&]() -> void
+            {
+                _register_timestamp_parser(
+                    conn, udf_name, std::move(*parser), timestamp_fields.size(), timestamp_format
+                );
+            }
+        );
+
+        ParsedExprVec arg_exprs;
+        for (auto&& field : timestamp_fields)
+        {
+            arg_exprs.push_back(make_uniq<ColumnRefExpression>(field));
+        }
+        return make_uniq<FunctionExpression>(udf_name, std::move(arg_exprs));
+    }
+
     unique_ptr<ParsedExpression> func_expr;
     if (timestamp_format == "epoch")
     {
@@ -59,6 +195,136 @@ _build_timestamp_expr(const std::vector<std::string>& timestamp_fields, const st
     return make_uniq<CastExpression>(LogicalType::TIMESTAMP_S, std::move(func_expr));
 }
 
+// 注册按分隔符切分字段的 UDF，返回值与 regexp_extract 按字段名列表提取时相同：
+// 每个字段一个 VARCHAR 成员的 STRUCT，不匹配的行所有字段都是空字符串
+void _register_field_splitter(
+    Connection& conn, const std::string& udf_name, FieldSplitter splitter, const std::vector<std::string>& named_fields
+)
+{
+    child_list_t<LogicalType> struct_children;
+    for (auto&& field : named_fields)
+    {
+        struct_children.emplace_back(field, LogicalType::VARCHAR);
+    }
+
+    auto udf {
+        [splitter {std::move(splitter)}, field_count {named_fields.size()}](
+            DataChunk& args, [[maybe_unused]] ExpressionState& state, Vector& result
+        ) -> void
+        {
+            args.data[0].Flatten(args.size());
+            result.SetVectorType(VectorType::FLAT_VECTOR);
+            auto& result_validity {FlatVector::Validity(result)};
+            auto& result_children {StructVector::GetEntries(result)};
+
+            const auto* const line_data {FlatVector::GetData<string_t>(args.data[0])};
+            const auto&       line_validity {FlatVector::Validity(args.data[0])};
+
+            std::vector<std::string_view> fields(field_count);
+            for (auto&& i : std::views::iota(0UL, args.size()))
+            {
+                if (!line_validity.RowIsValid(i))
+                {
+                    result_validity.SetInvalid(i);
+                    for (auto&& child : result_children)
+                    {
+                        FlatVector::SetNull(*child, i, true);
+                    }
+                    continue;
+                }
+
+                if (!splitter.split({line_data[i].GetData(), line_data[i].GetSize()}, fields))
+                {
+                    std::ranges::fill(fields, std::string_view {});
+                }
+                for (auto&& [child, field] : std::views::zip(result_children, fields))
+                {
+                    auto* child_data {FlatVector::GetData<string_t>(*child)};
+                    child_data[i] = StringVector::AddString(*child, field.data(), field.size());
+                }
+            }
+        }
+    };
+    conn.CreateVectorizedFunction(
+        udf_name, {LogicalType::VARCHAR}, LogicalType::STRUCT(std::move(struct_children)), std::move(udf)
+    );
+}
+
+// 规则集合的散列值，用于区分不同规则集合注册的 UDF
+std::size_t _hash_masks(const std::vector<Mask>& masks)
+{
+    std::size_t seed {0};
+    for (auto&& [regex, replacement] : masks)
+    {
+        boost::hash_combine(seed, regex);
+        boost::hash_combine(seed, replacement);
+    }
+    return seed;
+}
+
+// 计算每个字符之后的切分次数，与依次把每个分隔符 d 替换为 "d " 再按空格切分的结果一致
+// 每次替换会在该字符后追加一个空格，分隔符为空格时已有的空格数翻倍；空格本身也算一次切分
+std::array<std::uint32_t, 256> _build_split_counts(const std::vector<char>& delimiters)
+{
+    std::array<std::uint32_t, 256> split_counts {};
+    for (auto&& c : std::views::iota(0U, 256U))
+    {
+        auto& count {split_counts[c]};
+        count = c == ' ' ? 1 : 0;
+        for (auto&& delim : delimiters)
+        {
+            if (delim == ' ')
+            {
+                count *= 2;
+            }
+            else if (static_cast<unsigned char>(delim) == c)
+            {
+                ++count;
+            }
+        }
+    }
+    return split_counts;
+}
+
+// 不同取值不超过这个数的列才生成取值计数汇总
+constexpr std::int64_t MAX_SUMMARY_VALUES {1 << 16};
+
+// 取值较少、适合在过滤器中逐个勾选的列；LineID 每行都不同，不做汇总
+std::vector<std::string> _summary_columns(Connection& conn, const std::string& structured_table_name)
+{
+    auto rel {conn.Table(structured_table_name)};
+
+    std::vector<std::string> candidates;
+    ParsedExprVec            project_exprs;
+    for (auto&& col : rel->Columns())
+    {
+        if (col.Name() == "LineID")
+        {
+            continue;
+        }
+        candidates.push_back(col.Name());
+
+        ParsedExprVec arg_exprs;
+        arg_exprs.push_back(make_uniq<ColumnRefExpression>(col.Name()));
+        project_exprs.push_back(make_uniq<FunctionExpression>("approx_count_distinct", std::move(arg_exprs)));
+    }
+    if (candidates.empty())
+    {
+        return {};
+    }
+
+    auto                     result {to_m_result(rel->Aggregate(std::move(project_exprs))->Execute())};
+    std::vector<std::string> columns;
+    for (auto&& [i, column] : std::views::enumerate(candidates))
+    {
+        if (result->GetValue<std::int64_t>(static_cast<idx_t>(i), 0) <= MAX_SUMMARY_VALUES)
+        {
+            columns.push_back(std::move(column));
+        }
+    }
+    return columns;
+}
+
 }    // namespace
 
 unique_ptr<MaterializedQueryResult> to_m_result(unique_ptr<QueryResult> result)
@@ -67,18 +333,50 @@ unique_ptr<MaterializedQueryResult> to_m_result(unique_ptr<QueryResult> result)
     return unique_ptr_cast<QueryResult, MaterializedQueryResult>(std::move(result));
 }
 
-std::expected<shared_ptr<Relation>, std::int8_t> get_tmp(Connection& conn, const shared_ptr<Relation>& rel)
+std::expected<ScratchTable, std::int8_t> ScratchTable::create(Connection& conn, const shared_ptr<Relation>& rel)
 {
+    static std::atomic<std::uint64_t> next_id {0};
+
+    ScratchTable scratch {conn, std::format("_scratch_{}", next_id.fetch_add(1))};
     try
     {
-        rel->Create("_tmp", true, OnCreateConflict::REPLACE_ON_CONFLICT);
+        rel->Create(scratch.m_table_name, true, OnCreateConflict::ERROR_ON_CONFLICT);
     }
     catch (const Exception& e)
     {
         return std::unexpected(-1);
     }
 
-    return conn.Table("_tmp");
+    return scratch;
+}
+
+ScratchTable::ScratchTable(Connection& conn, std::string table_name):
+    m_conn {&conn},
+    m_table_name {std::move(table_name)}
+{}
+
+ScratchTable::ScratchTable(ScratchTable&& other) noexcept:
+    m_conn {other.m_conn},
+    m_table_name {std::exchange(other.m_table_name, {})}
+{}
+
+ScratchTable::~ScratchTable()
+{
+    // Query 不抛出异常，表未创建成功时 IF EXISTS 使删除成为空操作
+    if (!this->m_table_name.empty())
+    {
+        this->m_conn->Query(std::format("DROP TABLE IF EXISTS temp.main.{}", this->m_table_name));
+    }
+}
+
+shared_ptr<Relation> ScratchTable::relation() const
+{
+    return this->m_conn->Table(this->m_table_name);
+}
+
+const std::string& ScratchTable::table_name() const
+{
+    return this->m_table_name;
 }
 
 std::int64_t get_rel_row_count(const shared_ptr<Relation>& rel)
@@ -95,29 +393,16 @@ shared_ptr<Relation> load_data(
     const std::string&              log_regex,
     const std::vector<std::string>& named_fields,
     const std::vector<std::string>& timestamp_fields,
-    const std::string&              timestamp_format
+    const std::string&              timestamp_format,
+    std::int64_t                    line_offset,
+    bool                            complete_lines
 )
 {
-    // 将日志文件作为CSV文件读取，使用特殊的分隔符和引号来避免解析错误
-    // 使用 WITH ORDINALITY 生成一个从 1 开始的序列，作为日志行号
-    auto rel {conn.RelationFromQuery(
-        std::format(
-            R"(
-            SELECT ordinality AS LineID, _raw
-            FROM read_csv(
-                '{}',
-                auto_detect=false,
-                columns={{'_raw':'VARCHAR'}},
-                delim=chr(1),
-                quote='',
-                escape='',
-                new_line='\n',
-                header=false
-            )
-            WITH ORDINALITY
-        )",
-            log_file
-        )
+    // 按行并行读取日志文件，LineID 即物理行号，跳过已经解析过的前 line_offset 行
+    auto rel {conn.TableFunction(
+        "read_log_lines",
+        {Value {log_file}},
+        {{"skip", Value::BIGINT(line_offset)}, {"complete_lines", Value::BOOLEAN(complete_lines)}}
     )};
 
     auto named_fields_values {
@@ -131,13 +416,31 @@ shared_ptr<Relation> load_data(
         std::ranges::to<vector<Value>>()
     };
 
-    // 使用正则表达式提取日志字段，并将其展开成多行
+    // 提取日志字段，并将其展开成多行
+    // 只由字面分隔符和字段组成的简单格式直接按分隔符切分，其余格式使用正则表达式提取
     ParsedExprVec arg_exprs_1;
     arg_exprs_1.push_back(make_uniq<ColumnRefExpression>("_raw"));
-    arg_exprs_1.push_back(make_uniq<ConstantExpression>(log_regex));
-    arg_exprs_1.push_back(make_uniq<ConstantExpression>(Value::LIST(named_fields_values)));
 
-    auto func_expr_1 {make_uniq<FunctionExpression>("regexp_extract", std::move(arg_exprs_1))};
+    unique_ptr<FunctionExpression> func_expr_1;
+    if (auto splitter {FieldSplitter::compile(log_regex, named_fields)})
+    {
+        auto udf_name {std::format("_split_fields_{:x}", std::hash<std::string> {}(log_regex))};
+        func_expr_1 = make_uniq<FunctionExpression>(udf_name, std::move(arg_exprs_1));
+        _register_udf_once(
+            udf_name,
+            [&]() -> void
+            {
+                _register_field_splitter(conn, udf_name, std::move(*splitter), named_fields);
+            }
+        );
+    }
+    else
+    {
+        arg_exprs_1.push_back(make_uniq<ConstantExpression>(log_regex));
+        arg_exprs_1.push_back(make_uniq<ConstantExpression>(Value::LIST(named_fields_values)));
+
+        func_expr_1 = make_uniq<FunctionExpression>("regexp_extract", std::move(arg_exprs_1));
+    }
     func_expr_1->SetAlias("_cap");
 
     ParsedExprVec project_exprs_1;
@@ -154,7 +457,7 @@ shared_ptr<Relation> load_data(
 
     // 提取时间戳字段，并将其转换为 TIMESTAMP 类型
     // 同时过滤掉原始的时间戳字段，简化日志表的结构
-    auto func_expr_2 {_build_timestamp_expr(timestamp_fields, timestamp_format)};
+    auto func_expr_2 {_build_timestamp_expr(conn, log_file, timestamp_fields, timestamp_format)};
     func_expr_2->SetAlias("Timestamp");
 
     auto star_expr {make_uniq<StarExpression>()};
@@ -174,110 +477,361 @@ shared_ptr<Relation> load_data(
         ->Project(std::move(project_exprs_3), {});
 }
 
-shared_ptr<Relation> mask_log_rel(shared_ptr<Relation>& rel, const std::vector<Mask>& masks)
+shared_ptr<Relation> mask_log_rel(Connection& conn, shared_ptr<Relation>& rel, const std::vector<Mask>& masks)
 {
-    // 从 ColumnRefExpression("Content") 开始，逐层嵌套 regexp_replace
-    unique_ptr<ParsedExpression> func_expr {make_uniq<ColumnRefExpression>("Content")};
-    for (auto&& [regex, replacement] : masks)
+    MaskPrefilter prefilter {masks};
+
+    ParsedExprVec project_exprs_1;
+    project_exprs_1.push_back(make_uniq<StarExpression>());
+    project_exprs_1.push_back(make_uniq<ColumnRefExpression>("Content"));
+    project_exprs_1.back()->SetAlias("MaskedContent");
+
+    // 一次扫描算出每行可能生效的规则，缺少必需字符的规则直接跳过
+    if (!prefilter.empty())
     {
+        auto udf_name {std::format("_mask_rules_{:x}", _hash_masks(masks))};
+        auto udf {
+            [prefilter](DataChunk& args, [[maybe_unused]] ExpressionState& state, Vector& result) -> void
+            {
+                args.data[0].Flatten(args.size());
+                result.SetVectorType(VectorType::FLAT_VECTOR);
+                auto* result_data {FlatVector::GetData<std::uint64_t>(result)};
+
+                const auto* const content_data {FlatVector::GetData<string_t>(args.data[0])};
+                const auto&       content_validity {FlatVector::Validity(args.data[0])};
+                for (auto&& i : std::views::iota(0UL, args.size()))
+                {
+                    if (!content_validity.RowIsValid(i))
+                    {
+                        result_data[i] = 0;
+                        continue;
+                    }
+                    result_data[i] = prefilter.candidates({content_data[i].GetData(), content_data[i].GetSize()});
+                }
+            }
+        };
+        _register_udf_once(
+            udf_name,
+            [&]() -> void
+            {
+                conn.CreateVectorizedFunction(udf_name, {LogicalType::VARCHAR}, LogicalType::UBIGINT, udf);
+            }
+        );
+
         ParsedExprVec arg_exprs;
-        arg_exprs.push_back(std::move(func_expr));
-        arg_exprs.push_back(make_uniq<ConstantExpression>(Value(regex)));
-        arg_exprs.push_back(make_uniq<ConstantExpression>(Value(replacement)));
-        arg_exprs.push_back(make_uniq<ConstantExpression>(Value("g")));
+        arg_exprs.push_back(make_uniq<ColumnRefExpression>("Content"));
 
-        func_expr = make_uniq<FunctionExpression>("regexp_replace", std::move(arg_exprs));
+        project_exprs_1.push_back(make_uniq<FunctionExpression>(udf_name, std::move(arg_exprs)));
+        project_exprs_1.back()->SetAlias("_MaskRules");
     }
 
-    ParsedExprVec project_exprs;
-    project_exprs.push_back(make_uniq<StarExpression>());
-    project_exprs.push_back(std::move(func_expr));
-
-    return rel->Project(std::move(project_exprs), {"", "MaskedContent"});
-}
+    rel = rel->Project(std::move(project_exprs_1), {});
 
-shared_ptr<Relation> split_log_rel(shared_ptr<Relation>& rel, const std::vector<char>& delimiters)
-{
-    // 从 ColumnRefExpression("MaskedContent") 开始，逐层嵌套 replace
+    // 从 ColumnRefExpression("MaskedContent") 开始，逐层嵌套 regexp_replace
+    // 可以预过滤的规则用 CASE 只作用在可能匹配的行上，它需要读取上一层的结果，因此单独放在一层投影中
     unique_ptr<ParsedExpression> func_expr {make_uniq<ColumnRefExpression>("MaskedContent")};
-    for (auto&& delim : delimiters)
+    auto                         nested {false};
+
+    auto flush {
+        [&rel, &func_expr, &nested]() -> void
+        {
+            auto star_expr {make_uniq<StarExpression>()};
+            star_expr->exclude_list.emplace("MaskedContent");
+
+            ParsedExprVec project_exprs;
+            project_exprs.push_back(std::move(star_expr));
+            project_exprs.push_back(std::move(func_expr));
+
+            rel       = rel->Project(std::move(project_exprs), {"", "MaskedContent"});
+            func_expr = make_uniq<ColumnRefExpression>("MaskedContent");
+            nested    = false;
+        }
+    };
+
+    for (auto&& [rule, mask] : std::views::enumerate(masks))
     {
-        ParsedExprVec arg_exprs;
-        arg_exprs.push_back(std::move(func_expr));
-        arg_exprs.push_back(make_uniq<ConstantExpression>(Value(std::string {delim})));
-        arg_exprs.push_back(make_uniq<ConstantExpression>(Value(std::format("{} ", delim))));
+        const auto& [regex, replacement] {mask};
 
-        func_expr = make_uniq<FunctionExpression>("replace", std::move(arg_exprs));
+        auto bit {prefilter.bit(rule)};
+        if (bit != MaskPrefilter::NO_BIT && nested)
+        {
+            flush();
+        }
+
+        ParsedExprVec arg_exprs_1;
+        arg_exprs_1.push_back(std::move(func_expr));
+        arg_exprs_1.push_back(make_uniq<ConstantExpression>(Value(regex)));
+        arg_exprs_1.push_back(make_uniq<ConstantExpression>(Value(replacement)));
+        arg_exprs_1.push_back(make_uniq<ConstantExpression>(Value("g")));
+
+        func_expr = make_uniq<FunctionExpression>("regexp_replace", std::move(arg_exprs_1));
+        if (bit == MaskPrefilter::NO_BIT)
+        {
+            nested = true;
+            continue;
+        }
+
+        ParsedExprVec arg_exprs_2;
+        arg_exprs_2.push_back(make_uniq<ColumnRefExpression>("_MaskRules"));
+        arg_exprs_2.push_back(make_uniq<ConstantExpression>(Value::UBIGINT(1ULL << bit)));
+
+        auto case_expr {make_uniq<CaseExpression>()};
+        case_expr->case_checks.push_back(
+            {make_uniq<ComparisonExpression>(
+                 ExpressionType::COMPARE_NOTEQUAL,
+                 make_uniq<FunctionExpression>("&", std::move(arg_exprs_2)),
+                 make_uniq<ConstantExpression>(Value::UBIGINT(0))
+             ),
+             std::move(func_expr)}
+        );
+        case_expr->else_expr = make_uniq<ColumnRefExpression>("MaskedContent");
+
+        func_expr = std::move(case_expr);
+        flush();
+    }
+    if (nested)
+    {
+        flush();
     }
 
-    // 在每个分隔符后添加一个空格，以便后续的 str_split 可以正确地将字段分开
-    ParsedExprVec arg_exprs;
-    arg_exprs.push_back(std::move(func_expr));
-    arg_exprs.push_back(make_uniq<ConstantExpression>(Value(" ")));
+    if (prefilter.empty())
+    {
+        return rel;
+    }
+
+    // 移除预过滤列
+    auto star_expr {make_uniq<StarExpression>()};
+    star_expr->exclude_list.emplace("_MaskRules");
+
+    ParsedExprVec project_exprs_2;
+    project_exprs_2.push_back(std::move(star_expr));
+
+    return rel->Project(std::move(project_exprs_2), {});
+}
+
+shared_ptr<Relation> split_log_rel(Connection& conn, shared_ptr<Relation>& rel, const std::vector<char>& delimiters)
+{
+    // 一次扫描完成分词：查表得到每个字符之后的切分次数，逐个写出 token
+    auto udf_name {std::format("_tokenize_{:x}", boost::hash_range(delimiters.begin(), delimiters.end()))};
+    auto udf {
+        [split_counts {_build_split_counts(delimiters)}](
+            DataChunk& args, [[maybe_unused]] ExpressionState& state, Vector& result
+        ) -> void
+        {
+            args.data[0].Flatten(args.size());
+            result.SetVectorType(VectorType::FLAT_VECTOR);
+            auto* result_data {FlatVector::GetData<list_entry_t>(result)};
+            auto& result_validity {FlatVector::Validity(result)};
+            auto& result_child {ListVector::GetEntry(result)};
+
+            const auto* const content_data {FlatVector::GetData<string_t>(args.data[0])};
+            const auto&       content_validity {FlatVector::Validity(args.data[0])};
+
+            idx_t offset {0};
+            for (auto&& i : std::views::iota(0UL, args.size()))
+            {
+                if (!content_validity.RowIsValid(i))
+                {
+                    result_validity.SetInvalid(i);
+                    result_data[i] = {offset, 0};
+                    continue;
+                }
+
+                const auto* const data {content_data[i].GetData()};
+                auto              size {content_data[i].GetSize()};
+
+                // 先数出 token 个数，一次预留好子向量的空间
+                idx_t token_count {1};
+                for (auto&& pos : std::views::iota(0UL, size))
+                {
+                    token_count += split_counts[static_cast<unsigned char>(data[pos])];
+                }
+                ListVector::Reserve(result, offset + token_count);
+                auto* child_data {FlatVector::GetData<string_t>(result_child)};
+
+                result_data[i] = {offset, token_count};
+                idx_t start {0};
+                for (auto&& pos : std::views::iota(0UL, size))
+                {
+                    auto c {static_cast<unsigned char>(data[pos])};
+                    auto count {split_counts[c]};
+                    if (count == 0)
+                    {
+                        continue;
+                    }
+
+                    // 空格本身不属于任何 token，其他分隔符留在前一个 token 的末尾
+                    auto end {c == ' ' ? pos : pos + 1};
+                    child_data[offset++] = StringVector::AddString(result_child, data + start, end - start);
+                    for (auto&& _ : std::views::iota(1U, count))
+                    {
+                        child_data[offset++] = string_t {"", 0};
+                    }
+                    start = pos + 1;
+                }
+                child_data[offset++] = StringVector::AddString(result_child, data + start, size - start);
+            }
+            ListVector::SetListSize(result, offset);
+        }
+    };
+    _register_udf_once(
+        udf_name,
+        [&]() -> void
+        {
+            conn.CreateVectorizedFunction(
+                udf_name, {LogicalType::VARCHAR}, LogicalType::LIST(LogicalType::VARCHAR), std::move(udf)
+            );
+        }
+    );
 
-    func_expr = make_uniq<FunctionExpression>("str_split", std::move(arg_exprs));
+    ParsedExprVec arg_exprs;
+    arg_exprs.push_back(make_uniq<ColumnRefExpression>("MaskedContent"));
 
     ParsedExprVec project_exprs;
     project_exprs.push_back(make_uniq<StarExpression>());
-    project_exprs.push_back(std::move(func_expr));
+    project_exprs.push_back(make_uniq<FunctionExpression>(udf_name, std::move(arg_exprs)));
 
     return rel->Project(std::move(project_exprs), {"", "Tokens"});
 }
 
 void to_table(
-    Connection&                     conn,
-    shared_ptr<Relation>&           rel,
-    const std::vector<std::string>& templates,
-    const std::string&              structured_table_name,
-    const std::string&              templates_table_name
+    Connection&                       conn,
+    shared_ptr<Relation>&             rel,
+    const std::vector<std::uint32_t>& template_ids,
+    std::int64_t                      line_offset,
+    std::vector<TemplateRecord>       templates,
+    const std::string&                structured_table_name,
+    const std::string&                templates_table_name
 )
 {
-    // 使用 UDF 将 log_templates 中的模板字符串映射到每一行
-    auto udf_name {std::format("_get_template_{}", structured_table_name)};
+    // 使用 UDF 将每一行映射到它的 TemplateID
+    auto udf_name {std::format("_get_template_id_{}_{}", structured_table_name, line_offset)};
     auto udf {
-        [&templates](DataChunk& args, [[maybe_unused]] ExpressionState& state, Vector& result) -> void
+        [&template_ids, line_offset](DataChunk& args, [[maybe_unused]] ExpressionState& state, Vector& result) -> void
         {
             result.SetVectorType(VectorType::FLAT_VECTOR);
-            auto* result_data {FlatVector::GetData<string_t>(result)};
+            auto* result_data {FlatVector::GetData<std::uint32_t>(result)};
+            auto& result_validity {FlatVector::Validity(result)};
 
             auto* const line_id_data {FlatVector::GetData<std::int64_t>(args.data[0])};
             for (auto&& i : std::views::iota(0UL, args.size()))
             {
-                result_data[i] = StringVector::AddString(result, templates[line_id_data[i] - 1]);
+                // 匹配模式下未匹配到模板的行写入 NULL
+                auto template_id {template_ids[line_id_data[i] - line_offset - 1]};
+                if (template_id == NO_TEMPLATE_ID)
+                {
+                    result_validity.SetInvalid(i);
+                }
+                else
+                {
+                    result_data[i] = template_id;
+                }
             }
         }
     };
-    conn.CreateVectorizedFunction<string_t, std::int64_t>(udf_name, udf);
-
-    ParsedExprVec arg_exprs_1;
-    arg_exprs_1.push_back(make_uniq<ColumnRefExpression>("LineID"));
+    conn.CreateVectorizedFunction(udf_name, {LogicalType::BIGINT}, LogicalType::UINTEGER, udf);
 
-    auto func_expr_1 {make_uniq<FunctionExpression>(udf_name, std::move(arg_exprs_1))};
-    func_expr_1->SetAlias("Template");
+    ParsedExprVec arg_exprs;
+    arg_exprs.push_back(make_uniq<ColumnRefExpression>("LineID"));
 
-    ParsedExprVec project_exprs_1;
-    project_exprs_1.push_back(make_uniq<StarExpression>());
-    project_exprs_1.push_back(std::move(func_expr_1));
+    auto func_expr {make_uniq<FunctionExpression>(udf_name, std::move(arg_exprs))};
+    func_expr->SetAlias("TemplateID");
 
-    rel->Project(std::move(project_exprs_1), {})->Create(structured_table_name);
+    ParsedExprVec project_exprs;
+    project_exprs.push_back(make_uniq<StarExpression>());
+    project_exprs.push_back(std::move(func_expr));
 
-    // 统计每个模板的出现次数，并按出现次数降序排序
-    auto func_expr_2 {make_uniq<FunctionExpression>("count", ParsedExprVec {})};
-    func_expr_2->SetAlias("Count");
+    if (conn.TableInfo(structured_table_name) == nullptr)
+    {
+        rel->Project(std::move(project_exprs), {})->Create(structured_table_name);
+    }
+    else
+    {
+        rel->Project(std::move(project_exprs), {})->Insert(structured_table_name);
+    }
 
-    ParsedExprVec project_exprs;
-    project_exprs.push_back(make_uniq<ColumnRefExpression>("Template"));
-    project_exprs.push_back(std::move(func_expr_2));
+    write_templates(conn, templates, templates_table_name);
+    write_value_summaries(conn, structured_table_name, line_offset);
+}
 
-    vector<OrderByNode> order_exprs;
-    order_exprs.emplace_back(
-        OrderType::DESCENDING, OrderByNullType::ORDER_DEFAULT, make_uniq<ColumnRefExpression>("Count")
+void write_templates(
+    Connection& conn, const std::vector<TemplateRecord>& templates, const std::string& templates_table_name
+)
+{
+    // 模板表以 TemplateID 为主键，已有的模板直接按 TemplateID 覆盖
+    conn.Query(
+        std::format(
+            "CREATE TABLE IF NOT EXISTS {} (TemplateID UINTEGER PRIMARY KEY, Template STRING, Count BIGINT)",
+            templates_table_name
+        )
     );
+    if (templates.empty())
+    {
+        return;
+    }
+
+    vector<vector<Value>> values;
+    values.reserve(templates.size());
+    for (auto&& [template_id, log_template, count] : templates)
+    {
+        values.push_back({Value::UINTEGER(template_id), Value(std::string {log_template}), Value::BIGINT(count)});
+    }
+
+    conn.Values(values, {"TemplateID", "Template", "Count"})->CreateView("_templates", true, true);
+    conn.Query(std::format("INSERT OR REPLACE INTO {} SELECT * FROM _templates", templates_table_name));
+}
 
-    conn.Table(structured_table_name)
-        ->Aggregate(std::move(project_exprs), "Template")
-        ->Order(std::move(order_exprs))
-        ->Create(templates_table_name);
+std::string value_summary_table_name(const std::string& structured_table_name)
+{
+    return std::format("f_{}", structured_table_name.substr(2));
+}
+
+void write_value_summaries(Connection& conn, const std::string& structured_table_name, std::int64_t line_offset)
+{
+    auto summary_table_name {value_summary_table_name(structured_table_name)};
+
+    // 增量解析时沿用汇总表中已有的列，只追加新增行的计数；汇总表不存在时按整张结构化表重新生成
+    std::vector<std::string> columns;
+    auto                     incremental {line_offset > 0 && conn.TableInfo(summary_table_name) != nullptr};
+    if (incremental)
+    {
+        auto result {conn.Query(std::format("SELECT DISTINCT ColumnName FROM {}", summary_table_name))};
+        for (auto&& row : std::views::iota(0UL, result->RowCount()))
+        {
+            columns.push_back(result->GetValue(0, row).ToString());
+        }
+    }
+    else
+    {
+        columns = _summary_columns(conn, structured_table_name);
+        conn.Query(
+            std::format(
+                "CREATE OR REPLACE TABLE {} (ColumnName STRING, Value STRING, Count BIGINT)", summary_table_name
+            )
+        );
+    }
+    if (columns.empty())
+    {
+        return;
+    }
+
+    // 每列单独分组，只需读取这一列
+    auto selects {
+        columns |
+        std::views::transform(
+            [&](const std::string& column) -> std::string
+            {
+                return std::format(
+                    R"(SELECT '{0}', "{0}"::STRING, count(*) FROM {1} WHERE LineID > {2} GROUP BY ALL)",
+                    column,
+                    structured_table_name,
+                    incremental ? line_offset : 0
+                );
+            }
+        ) |
+        std::views::join_with(std::string_view {" UNION ALL "}) | std::ranges::to<std::string>()
+    };
+    conn.Query(std::format("INSERT INTO {} {}", summary_table_name, selects));
 }
 
 }    // namespace logtt
@@ -3,32 +3,95 @@
 #include "precomp.hxx"
 #include <expected>
 #include <string>
+#include <string_view>
 #include <vector>
 
 namespace logtt
 {
 
-unique_ptr<MaterializedQueryResult>              to_m_result(unique_ptr<QueryResult> result);
-std::expected<shared_ptr<Relation>, std::int8_t> get_tmp(Connection& conn, const shared_ptr<Relation>& rel);
-std::int64_t                                     get_rel_row_count(const shared_ptr<Relation>& rel);
+unique_ptr<MaterializedQueryResult> to_m_result(unique_ptr<QueryResult> result);
+std::int64_t                        get_rel_row_count(const shared_ptr<Relation>& rel);
 
+// 缓存中间结果的临时表，只对创建它的连接可见，析构时删除
+// 表名在进程内唯一，同一连接上的多个任务或查询各自使用自己的临时表，互不覆盖
+class ScratchTable
+{
+public:
+    // 把 rel 的结果写入新的临时表，失败时返回 -1
+    static std::expected<ScratchTable, std::int8_t> create(Connection& conn, const shared_ptr<Relation>& rel);
+
+    ScratchTable(const ScratchTable&)            = delete;
+    ScratchTable& operator=(const ScratchTable&) = delete;
+
+    ScratchTable(ScratchTable&& other) noexcept;
+    ScratchTable& operator=(ScratchTable&&) = delete;
+
+    ~ScratchTable();
+
+    // 读取临时表的关系，只能在 ScratchTable 析构之前执行
+    [[nodiscard]]
+    shared_ptr<Relation> relation() const;
+    // 临时表位于 temp.main 中，可以用 Appender(conn, "temp", "main", table_name()) 直接写入
+    [[nodiscard]]
+    const std::string& table_name() const;
+
+private:
+    ScratchTable(Connection& conn, std::string table_name);
+
+    Connection* m_conn;
+    // 被移动后为空，不再删除任何表
+    std::string m_table_name;
+};
+
+// line_offset 为已经解析过的行数，读取时跳过这些行，LineID 从 line_offset + 1 开始
+// complete_lines 为真时不读取结尾没有换行符的最后一行，支持增量解析的解析器以此保证下次从完整的行开始继续
 shared_ptr<Relation> load_data(
     Connection&                     conn,
     const std::string&              log_file,
     const std::string&              log_regex,
     const std::vector<std::string>& named_fields,
     const std::vector<std::string>& timestamp_fields,
-    const std::string&              timestamp_format
+    const std::string&              timestamp_format,
+    std::int64_t                    line_offset    = 0,
+    bool                            complete_lines = false
 );
-shared_ptr<Relation> mask_log_rel(shared_ptr<Relation>& rel, const std::vector<Mask>& masks);
-shared_ptr<Relation> split_log_rel(shared_ptr<Relation>& rel, const std::vector<char>& delimiters);
+// 依次应用掩码规则，结果写入 MaskedContent 列；能确定必需字符的规则只作用在含有这些字符的行上
+shared_ptr<Relation> mask_log_rel(Connection& conn, shared_ptr<Relation>& rel, const std::vector<Mask>& masks);
+// 按分隔符把 MaskedContent 切分为 Tokens 列：空格切分，其他分隔符切分后保留在前一个 token 的末尾
+shared_ptr<Relation> split_log_rel(Connection& conn, shared_ptr<Relation>& rel, const std::vector<char>& delimiters);
+
+// 模板表中的一行
+struct TemplateRecord
+{
+    std::uint32_t    id;
+    std::string_view log_template;
+    std::int64_t     count;
+};
 
+// 写入结构化表和模板表，表不存在时创建，已存在时追加
+// template_ids[i] 是 LineID 为 line_offset + i + 1 的行的 TemplateID，NO_TEMPLATE_ID 写入 NULL
+// templates 按 TemplateID 覆盖模板表中已有的行，模板更新后旧行通过 TemplateID 自动对应到新模板
 void to_table(
-    Connection&                     conn,
-    shared_ptr<Relation>&           rel,
-    const std::vector<std::string>& templates,
-    const std::string&              structured_table_name,
-    const std::string&              templates_table_name
+    Connection&                       conn,
+    shared_ptr<Relation>&             rel,
+    const std::vector<std::uint32_t>& template_ids,
+    std::int64_t                      line_offset,
+    std::vector<TemplateRecord>       templates,
+    const std::string&                structured_table_name,
+    const std::string&                templates_table_name
+);
+// 按 TemplateID 覆盖写入模板表，表不存在时创建
+// TemplateID 标识的是日志簇而不是模板文本：两个日志簇可能渲染出相同的模板，这时模板表中会有两行相同的 Template，
+// 各自统计所属日志簇的行数；按模板文本显示或计数时需要自行按 Template 合并
+// 模板表不保证行的顺序，需要按出现次数排列时由查询排序
+void write_templates(
+    Connection& conn, const std::vector<TemplateRecord>& templates, const std::string& templates_table_name
 );
 
+// 结构化表 s_N 对应的取值计数汇总表 f_N，每行为 (ColumnName, Value, Count)，Value 统一保存为字符串
+// 同一列同一取值可能有多行（每次增量解析追加一行），读取时需要按 Value 求和
+std::string value_summary_table_name(const std::string& structured_table_name);
+// 为取值较少的列生成取值计数汇总；line_offset 大于 0 时只把 LineID 大于 line_offset 的行追加到已有的汇总中
+void write_value_summaries(Connection& conn, const std::string& structured_table_name, std::int64_t line_offset);
+
 }    // namespace logtt
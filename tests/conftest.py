@@ -0,0 +1,26 @@
+import itertools
+import os
+
+import pytest
+
+_table_ids = itertools.count(1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _database_dir(tmp_path_factory):
+    # 数据库文件 logtt.duckdb 在第一次连接时创建在当前目录下，之后整个测试进程共用这一个数据库
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("database"))
+    yield
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def new_tables():
+    """返回一个函数，每次调用得到一对未使用过的结构化表名和模板表名，各个测试的表因此互不影响"""
+
+    def _new_tables() -> tuple[str, str]:
+        table_id = next(_table_ids)
+        return f"s_{table_id}", f"t_{table_id}"
+
+    return _new_tables
@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import pytest
+
+parsers = pytest.importorskip("modules.logparser.parsers")
+duckdb_service = pytest.importorskip("modules.duckdb_service")
+
+LOG_FORMAT = "{Date} {Time} {Level}: {Content}"
+TIMESTAMP_FIELDS = ["Date", "Time"]
+TIMESTAMP_FORMAT = "%y%m%d %H%M%S"
+
+LINE_COUNT = 50_000
+
+
+def _write_log(log_file: Path):
+    log_file.write_text(
+        "".join(
+            f"081109 2036{i % 60:02d} INFO: Received block blk_{i % 1000} of size {i % 7} from 10.250.{i % 13}.1\n"
+            for i in range(LINE_COUNT)
+        )
+    )
+
+
+def _parse(log_file: Path, new_tables, build_token_index: bool = False) -> str:
+    structured_table, templates_table = new_tables()
+    log_parser = parsers.DrainLogParser(LOG_FORMAT, TIMESTAMP_FIELDS, TIMESTAMP_FORMAT, [], "")
+    log_parser.build_token_index = build_token_index
+    log_parser.parse(str(log_file), structured_table, templates_table)
+    return structured_table
+
+
+def _line_ids(table_name: str, offset: int, limit: int, **kwargs) -> list[int]:
+    columns, _ = duckdb_service.DuckDBService.fetch_csv_table(table_name, offset, limit, **kwargs)
+    column = next(column for column in columns if column.name == "LineID")
+    return column.to_numpy().tolist()
+
+
+def test_pages_follow_line_order(tmp_path: Path, new_tables):
+    log_file = tmp_path / "app.log"
+    _write_log(log_file)
+    structured_table = _parse(log_file, new_tables)
+
+    # 逐页读取时，各页首尾相接，拼起来正好是按 LineID 排列的全部行
+    page_size = 4096
+    line_ids = []
+    for offset in range(0, LINE_COUNT, page_size):
+        line_ids += _line_ids(structured_table, offset, page_size)
+    assert line_ids == list(range(1, LINE_COUNT + 1))
+
+
+@pytest.mark.parametrize(
+    ("search_terms", "match_all"),
+    [
+        (["blk_7"], True),
+        (["BLOCK"], True),
+        (["10.250.3.1"], True),
+        (["blk_7", "10.250.3.1"], True),
+        (["blk_7", "10.250.3.1"], False),
+        (["size", "blk_1"], True),
+        (["blk"], True),
+        (["missing"], False),
+    ],
+)
+def test_search_with_and_without_token_index(tmp_path: Path, new_tables, search_terms, match_all):
+    log_file = tmp_path / "app.log"
+    _write_log(log_file)
+    indexed_table = _parse(log_file, new_tables, build_token_index=True)
+    unindexed_table = _parse(log_file, new_tables)
+
+    # 有没有倒排索引，同一个搜索得到的行和分页都一样
+    kwargs = {"search_terms": search_terms, "match_all": match_all}
+    _, indexed_total = duckdb_service.DuckDBService.fetch_csv_table(indexed_table, 0, 1, **kwargs)
+    _, unindexed_total = duckdb_service.DuckDBService.fetch_csv_table(unindexed_table, 0, 1, **kwargs)
+    assert indexed_total == unindexed_total
+    assert _line_ids(indexed_table, 0, LINE_COUNT, **kwargs) == _line_ids(unindexed_table, 0, LINE_COUNT, **kwargs)
+    assert _line_ids(indexed_table, 100, 50, **kwargs) == _line_ids(unindexed_table, 100, 50, **kwargs)
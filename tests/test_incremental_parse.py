@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import pytest
+
+parsers = pytest.importorskip("modules.logparser.parsers")
+duckdb_service = pytest.importorskip("modules.duckdb_service")
+
+LOG_FORMAT = "{Date} {Time} {Level}: {Content}"
+TIMESTAMP_FIELDS = ["Date", "Time"]
+TIMESTAMP_FORMAT = "%y%m%d %H%M%S"
+
+
+def _lines(lengths: range, repeat: int) -> list[str]:
+    """每个长度生成 repeat 行，首个 token 随长度变化，同一长度的行只有最后一个 token 不同"""
+    return [
+        f"081109 2036{i % 60:02d} INFO: step{length} "
+        + " ".join(f"word{j}" for j in range(length - 2))
+        + f" value{i}"
+        for length in lengths
+        for i in range(repeat)
+    ]
+
+
+@pytest.mark.parametrize(
+    "parser_type",
+    [parsers.DrainLogParser, parsers.JaccardDrainLogParser],
+)
+def test_parse_incremental_with_new_token_lengths(parser_type, tmp_path: Path, new_tables):
+    structured_table, templates_table = new_tables()
+    log_file = tmp_path / "app.log"
+    first_lines = _lines(range(3, 6), 4)
+    log_file.write_text("\n".join(first_lines) + "\n")
+
+    log_parser = parser_type(LOG_FORMAT, TIMESTAMP_FIELDS, TIMESTAMP_FORMAT, [], "")
+    result = log_parser.parse(str(log_file), structured_table, templates_table)
+    assert result.line_count == len(first_lines)
+    assert duckdb_service.DuckDBService.get_table_row_count(templates_table) == 3
+
+    # 新的 token 长度会产生新的分片，之后追加的行仍要匹配到第一次解析得到的日志簇上
+    appended_lines = _lines(range(6, 40), 1) + _lines(range(3, 6), 2)
+    with log_file.open("a") as f:
+        f.write("\n".join(appended_lines) + "\n")
+
+    result = log_parser.parse_incremental(str(log_file), structured_table, templates_table, result.line_count)
+    assert result.line_count == len(first_lines) + len(appended_lines)
+    assert duckdb_service.DuckDBService.get_table_row_count(structured_table) == result.line_count
+    assert duckdb_service.DuckDBService.get_table_row_count(templates_table) == 3 + len(range(6, 40))
+
+
+def test_parse_incremental_waits_for_unterminated_line(tmp_path: Path, new_tables):
+    structured_table, templates_table = new_tables()
+    log_file = tmp_path / "app.log"
+    lines = _lines(range(3, 6), 2)
+    # 最后一行只写入了一半
+    log_file.write_text("\n".join(lines) + "\n" + lines[0][:20])
+
+    log_parser = parsers.DrainLogParser(LOG_FORMAT, TIMESTAMP_FIELDS, TIMESTAMP_FORMAT, [], "")
+    result = log_parser.parse(str(log_file), structured_table, templates_table)
+    assert result.line_count == len(lines)
+
+    with log_file.open("a") as f:
+        f.write(lines[0][20:] + "\n")
+
+    result = log_parser.parse_incremental(str(log_file), structured_table, templates_table, result.line_count)
+    assert result.line_count == len(lines) + 1
+    assert duckdb_service.DuckDBService.get_table_row_count(structured_table) == result.line_count
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+parsers = pytest.importorskip("modules.logparser.parsers")
+duckdb_service = pytest.importorskip("modules.duckdb_service")
+
+LOG_FORMAT = "{Date} {Time} {Level}: {Content}"
+TIMESTAMP_FIELDS = ["Date", "Time"]
+TIMESTAMP_FORMAT = "%y%m%d %H%M%S"
+
+# read_log_lines 按 8 MiB 的字节区间并行读取文件
+RANGE_BYTES = 8 << 20
+
+
+def _contents(start: int, stop: int) -> list[str]:
+    return [
+        f"Received block blk_{i} of size {i * 7919 % 100000} from 10.250.{i % 256}.{i % 97}"
+        for i in range(start, stop)
+    ]
+
+
+def _write_lines(log_file: Path, contents: list[str], mode: str = "w"):
+    with log_file.open(mode) as f:
+        f.write("".join(f"081109 203615 INFO: {content}\n" for content in contents))
+
+
+def _column_values(table_name: str, column_name: str) -> list[str]:
+    total = duckdb_service.DuckDBService.get_table_row_count(table_name)
+    columns, _ = duckdb_service.DuckDBService.fetch_csv_table(table_name, 0, total)
+    column = next(column for column in columns if column.name == column_name)
+    return [column.format(row) for row in range(total)]
+
+
+def test_parse_file_larger_than_read_range(tmp_path: Path, new_tables):
+    structured_table, templates_table = new_tables()
+    log_file = tmp_path / "large.log"
+    # 每行约 90 字节，文件跨越多个字节区间，区间的边界落在行的中间
+    contents = _contents(0, 250_000)
+    _write_lines(log_file, contents)
+    assert log_file.stat().st_size > 2 * RANGE_BYTES
+
+    log_parser = parsers.DrainLogParser(LOG_FORMAT, TIMESTAMP_FIELDS, TIMESTAMP_FORMAT, [], "")
+    result = log_parser.parse(str(log_file), structured_table, templates_table)
+    assert result.line_count == len(contents)
+
+    # 结果按 LineID 排序，LineID 必须与物理行号一一对应
+    assert _column_values(structured_table, "LineID") == [str(i) for i in range(1, len(contents) + 1)]
+    assert _column_values(structured_table, "Content") == contents
+
+    # 跳过的行数超过第一个区间时，追加的行仍从正确的 LineID 开始
+    appended_contents = _contents(250_000, 260_000)
+    _write_lines(log_file, appended_contents, "a")
+    result = log_parser.parse_incremental(str(log_file), structured_table, templates_table, result.line_count)
+    assert result.line_count == len(contents) + len(appended_contents)
+    assert _column_values(structured_table, "LineID") == [str(i) for i in range(1, result.line_count + 1)]
+    assert _column_values(structured_table, "Content") == contents + appended_contents
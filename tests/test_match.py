@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import pytest
+
+parsers = pytest.importorskip("modules.logparser.parsers")
+duckdb_service = pytest.importorskip("modules.duckdb_service")
+log_analysis = pytest.importorskip("modules.log_analysis")
+
+LOG_FORMAT = "{Date} {Time} {Level}: {Content}"
+TIMESTAMP_FIELDS = ["Date", "Time"]
+TIMESTAMP_FORMAT = "%y%m%d %H%M%S"
+
+OPEN_LINE = "081109 203615 INFO: Opening file {}"
+CLOSE_LINE = "081109 203615 INFO: Closing file {} after {} bytes"
+UNKNOWN_LINE = "081109 203615 WARN: Checksum mismatch on replica {} of block {} at {}"
+
+
+def _create_parser():
+    return parsers.DrainLogParser(LOG_FORMAT, TIMESTAMP_FIELDS, TIMESTAMP_FORMAT, [], "")
+
+
+def _column_values(table_name: str, column_name: str) -> list[str]:
+    total = duckdb_service.DuckDBService.get_table_row_count(table_name)
+    columns, _ = duckdb_service.DuckDBService.fetch_csv_table(table_name, 0, total)
+    column = next(column for column in columns if column.name == column_name)
+    return [column.format(row) for row in range(total)]
+
+
+def _learn_templates(tmp_path: Path, new_tables) -> str:
+    """学习打开和关闭文件两个模板，返回模板表名"""
+    log_file = tmp_path / "train.log"
+    lines = [line for i in range(4) for line in (OPEN_LINE.format(i), CLOSE_LINE.format(i, i * 100))]
+    log_file.write_text("\n".join(lines) + "\n")
+
+    structured_table, templates_table = new_tables()
+    _create_parser().parse(str(log_file), structured_table, templates_table)
+    assert duckdb_service.DuckDBService.get_table_row_count(templates_table) == 2
+    return templates_table
+
+
+def test_match_leaves_unmatched_lines_without_template(tmp_path: Path, new_tables):
+    source_templates_table = _learn_templates(tmp_path, new_tables)
+
+    log_file = tmp_path / "app.log"
+    lines = [OPEN_LINE.format(10), UNKNOWN_LINE.format(1, 2, 3), CLOSE_LINE.format(10, 7), UNKNOWN_LINE.format(4, 5, 6)]
+    log_file.write_text("\n".join(lines) + "\n")
+
+    structured_table, templates_table = new_tables()
+    result = _create_parser().match(str(log_file), structured_table, templates_table, source_templates_table)
+    assert result.line_count == len(lines)
+    assert result.unmatched_count == 2
+
+    # 只匹配不学习：模板表与已有模板相同，未匹配的行 TemplateID 为空
+    template_ids = _column_values(structured_table, "TemplateID")
+    assert [template_id == "" for template_id in template_ids] == [False, True, False, True]
+    assert sorted(_column_values(templates_table, "Template")) == sorted(
+        _column_values(source_templates_table, "Template")
+    )
+
+
+def test_transition_matrix_skips_unmatched_lines(tmp_path: Path, new_tables):
+    source_templates_table = _learn_templates(tmp_path, new_tables)
+
+    # 打开 → 未匹配 → 关闭 → 打开 → 关闭：中间隔着未匹配行的打开和关闭不算一次转移
+    log_file = tmp_path / "app.log"
+    lines = [
+        OPEN_LINE.format(1),
+        UNKNOWN_LINE.format(1, 2, 3),
+        CLOSE_LINE.format(1, 7),
+        OPEN_LINE.format(2),
+        CLOSE_LINE.format(2, 9),
+    ]
+    log_file.write_text("\n".join(lines) + "\n")
+
+    structured_table, templates_table = new_tables()
+    _create_parser().match(str(log_file), structured_table, templates_table, source_templates_table)
+
+    matrix = log_analysis.LogAnalysis.get_template_transition_matrix(structured_table, templates_table)
+    assert matrix.sum() == 2
@@ -0,0 +1,123 @@
+import struct
+from pathlib import Path
+
+import pytest
+
+parsers = pytest.importorskip("modules.logparser.parsers")
+duckdb_service = pytest.importorskip("modules.duckdb_service")
+
+LOG_FORMAT = "{Date} {Time} {Level}: {Content}"
+TIMESTAMP_FIELDS = ["Date", "Time"]
+TIMESTAMP_FORMAT = "%y%m%d %H%M%S"
+
+PARSER_TYPES = [parsers.DrainLogParser, parsers.JaccardDrainLogParser, parsers.SpellLogParser]
+
+
+def _lines(lengths: range, repeat: int) -> list[str]:
+    """每个长度生成 repeat 行，首个 token 随长度变化，同一长度的行只有最后一个 token 不同"""
+    return [
+        f"081109 2036{i % 60:02d} INFO: step{length} "
+        + " ".join(f"word{j}" for j in range(length - 2))
+        + f" value{i}"
+        for length in lengths
+        for i in range(repeat)
+    ]
+
+
+def _rows(table_name: str) -> list[tuple[str, ...]]:
+    """按 DuckDB 的显示格式取出整张表，行的顺序不作要求"""
+    total = duckdb_service.DuckDBService.get_table_row_count(table_name)
+    columns, _ = duckdb_service.DuckDBService.fetch_csv_table(table_name, 0, total)
+    return sorted(zip(*([column.format(row) for row in range(total)] for column in columns)))
+
+
+def _create_parser(parser_type):
+    return parser_type(LOG_FORMAT, TIMESTAMP_FIELDS, TIMESTAMP_FORMAT, [], "")
+
+
+@pytest.mark.parametrize("parser_type", PARSER_TYPES)
+def test_load_snapshot_then_parse_incremental(parser_type, tmp_path: Path, new_tables):
+    log_file = tmp_path / "app.log"
+    snapshot_file = tmp_path / "app.snapshot"
+    log_file.write_text("\n".join(_lines(range(3, 8), 4)) + "\n")
+
+    # 一直在内存中的解析器
+    structured_table, templates_table = new_tables()
+    log_parser = _create_parser(parser_type)
+    result = log_parser.parse(str(log_file), structured_table, templates_table)
+    log_parser.save_snapshot(str(snapshot_file))
+
+    # 重启后的解析器：先得到同样的表，再从快照恢复学习到的状态
+    restored_structured_table, restored_templates_table = new_tables()
+    _create_parser(parser_type).parse(str(log_file), restored_structured_table, restored_templates_table)
+    restored_parser = _create_parser(parser_type)
+    restored_parser.load_snapshot(str(snapshot_file))
+
+    # 追加的行既有已有模板的，也有新的 token 长度
+    with log_file.open("a") as f:
+        f.write("\n".join(_lines(range(3, 12), 3)) + "\n")
+
+    log_parser.parse_incremental(str(log_file), structured_table, templates_table, result.line_count)
+    restored_parser.parse_incremental(
+        str(log_file), restored_structured_table, restored_templates_table, result.line_count
+    )
+
+    assert _rows(restored_structured_table) == _rows(structured_table)
+    assert _rows(restored_templates_table) == _rows(templates_table)
+
+
+def _saved_snapshot(parser_type, tmp_path: Path, new_tables) -> Path:
+    log_file = tmp_path / "app.log"
+    snapshot_file = tmp_path / "app.snapshot"
+    log_file.write_text("\n".join(_lines(range(3, 8), 4)) + "\n")
+
+    log_parser = _create_parser(parser_type)
+    log_parser.parse(str(log_file), *new_tables())
+    log_parser.save_snapshot(str(snapshot_file))
+    return snapshot_file
+
+
+@pytest.mark.parametrize("parser_type", [parsers.JaccardDrainLogParser, parsers.SpellLogParser])
+def test_load_snapshot_rejects_other_parser(parser_type, tmp_path: Path, new_tables):
+    snapshot_file = _saved_snapshot(parsers.DrainLogParser, tmp_path, new_tables)
+
+    with pytest.raises(ValueError):
+        _create_parser(parser_type).load_snapshot(str(snapshot_file))
+
+
+@pytest.mark.parametrize("parser_type", PARSER_TYPES)
+def test_load_snapshot_rejects_truncated_file(parser_type, tmp_path: Path, new_tables):
+    snapshot_file = _saved_snapshot(parser_type, tmp_path, new_tables)
+    data = snapshot_file.read_bytes()
+
+    for size in (0, 8, len(data) // 2, len(data) - 1):
+        snapshot_file.write_bytes(data[:size])
+        with pytest.raises(ValueError):
+            _create_parser(parser_type).load_snapshot(str(snapshot_file))
+
+
+def test_load_snapshot_rejects_other_version(tmp_path: Path, new_tables):
+    snapshot_file = _saved_snapshot(parsers.DrainLogParser, tmp_path, new_tables)
+    data = bytearray(snapshot_file.read_bytes())
+    # 文件头依次为 magic、版本号和解析器类型，各 4 字节
+    struct.pack_into("=I", data, 4, struct.unpack_from("=I", data, 4)[0] + 1)
+    snapshot_file.write_bytes(data)
+
+    with pytest.raises(ValueError):
+        _create_parser(parsers.DrainLogParser).load_snapshot(str(snapshot_file))
+
+
+def test_load_snapshot_rejects_unknown_tokens(tmp_path: Path, new_tables):
+    snapshot_file = _saved_snapshot(parsers.DrainLogParser, tmp_path, new_tables)
+    data = snapshot_file.read_bytes()
+
+    # Drain 快照在 12 字节的文件头之后是 depth、children 和 sim_thr，共 8 字节，之后是 token 字典
+    # 清空 token 字典后，日志簇和前缀树引用的 token ID 全部越界
+    offset = 20
+    (token_count,) = struct.unpack_from("=Q", data, offset)
+    lengths = struct.unpack_from(f"={token_count}I", data, offset + 8)
+    end = offset + 8 + 4 * token_count + sum(lengths)
+    snapshot_file.write_bytes(data[:offset] + struct.pack("=Q", 0) + data[end:])
+
+    with pytest.raises(ValueError):
+        _create_parser(parsers.DrainLogParser).load_snapshot(str(snapshot_file))
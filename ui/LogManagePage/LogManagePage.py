@@ -169,6 +169,14 @@ class LogManagePage(QWidget):
                 lambda: self._on_view_template(index)
             )
             menu.addAction(view_template_action)
+
+            # 解析器状态仍在内存中或保存了快照时，可以只解析追加的日志
+            if self._log_table_model.can_extract_incremental(index):
+                incremental_action = Action(FluentIcon.SYNC, self.tr("增量提取"))
+                incremental_action.triggered.connect(
+                    lambda: self._log_table_model.request_extract_incremental(index)
+                )
+                menu.addAction(incremental_action)
         elif status == LogStatus.NOT_EXTRACTED:
             # 未提取的日志
             extract_action = Action(FluentIcon.PLAY, self.tr("开始提取"))
@@ -13,10 +13,12 @@ from PySide6.QtWidgets import (
 from qfluentwidgets import (
     Action,
     BodyLabel,
+    ComboBox,
     FluentIcon,
     InfoBar,
     InfoBarPosition,
     RoundMenu,
+    SearchLineEdit,
     TableView,
 )
 from qfluentwidgets.components import ModelComboBox
@@ -76,6 +78,21 @@ class LogViewPage(QWidget):
         self._log_combo_box.currentIndexChanged.connect(self._on_log_selected)
         tool_bar_layout.addWidget(self._log_combo_box)
 
+        # 关键字搜索，多个词以空白分隔
+        self._search_line_edit = SearchLineEdit(self)
+        self._search_line_edit.setMinimumWidth(300)
+        self._search_line_edit.setPlaceholderText(self.tr("搜索关键字，多个关键字以空格分隔"))
+        self._search_line_edit.searchSignal.connect(self._on_search)
+        self._search_line_edit.clearSignal.connect(self._on_search_cleared)
+        tool_bar_layout.addWidget(self._search_line_edit)
+
+        self._search_mode_combo_box = ComboBox(self)
+        self._search_mode_combo_box.addItems([self.tr("包含全部"), self.tr("包含任意")])
+        self._search_mode_combo_box.currentIndexChanged.connect(
+            lambda: self._on_search(self._search_line_edit.text())
+        )
+        tool_bar_layout.addWidget(self._search_mode_combo_box)
+
         tool_bar_layout.addStretch()
 
         self._info_label = BodyLabel(self)
@@ -89,6 +106,12 @@ class LogViewPage(QWidget):
         self._table_view = TableView(self)
         self._table_view.setBorderVisible(True)
         self._table_view.setBorderRadius(8)
+        # 启用排序，排序由数据库完成，初始不排序任何列
+        self._table_view.setSortingEnabled(True)
+        self._table_view.horizontalHeader().setSortIndicator(
+            -1,
+            Qt.SortOrder.AscendingOrder,
+        )
         # 禁用单元格换行
         self._table_view.setWordWrap(False)
         # 隐藏垂直表头
@@ -147,10 +170,16 @@ class LogViewPage(QWidget):
             )
             return
 
-        # 创建新的模型实例
+        # 创建新的模型实例，搜索关键字只作用于当前日志
         self._select_log_id = log_id
+        self._search_line_edit.clear()
         self._csv_file_table_model = CsvFileTableModel(structured_table_name, self)
         self._table_view.setModel(self._csv_file_table_model)
+        # 新模型没有排序，清除上一个模型留下的排序指示器
+        self._table_view.horizontalHeader().setSortIndicator(
+            -1,
+            Qt.SortOrder.AscendingOrder,
+        )
         self._table_view.scrollToTop()
         self._update_info_label()
 
@@ -221,6 +250,31 @@ class LogViewPage(QWidget):
         global_pos = header.mapToGlobal(pos)
         self._show_column_filter_menu(column_name, global_pos)
 
+    @Slot(str)
+    def _on_search(self, text: str):
+        """按关键字搜索"""
+        if self._select_log_id == -1:
+            return
+
+        if terms := text.split():
+            self._csv_file_table_model.set_search(
+                terms,
+                self._search_mode_combo_box.currentIndex() == 0,
+            )
+        elif self._csv_file_table_model.is_searching():
+            self._csv_file_table_model.clear_search()
+        self._table_view.scrollToTop()
+        self._update_info_label()
+
+    @Slot()
+    def _on_search_cleared(self):
+        """清除搜索"""
+        if self._select_log_id == -1 or not self._csv_file_table_model.is_searching():
+            return
+
+        self._csv_file_table_model.clear_search()
+        self._update_info_label()
+
     @Slot(str)
     def _on_set_column_filter(self, column_name: str):
         """设置列过滤"""
@@ -11,6 +11,7 @@ from qfluentwidgets import (
     InfoBarPosition,
     PrimaryPushSettingCard,
     SmoothScrollArea,
+    SwitchSettingCard,
     setThemeColor,
 )
 
@@ -35,6 +36,7 @@ class SettingPage(SmoothScrollArea):
         self._init_theme_color_card()
         self._init_language_card()
         self._init_log_parser_config_card()
+        self._init_token_index_card()
 
         appcfg.appRestartSig.connect(self._on_need_restart)
 
@@ -73,6 +75,16 @@ class SettingPage(SmoothScrollArea):
         self._log_parser_config_card.clicked.connect(self._on_manage_log_parser_config)
         self._main_layout.addWidget(self._log_parser_config_card)
 
+    def _init_token_index_card(self):
+        self._token_index_card = SwitchSettingCard(
+            FluentIcon.SEARCH,
+            self.tr("建立搜索索引"),
+            self.tr("提取日志时同时建立关键字索引，搜索大日志时无需扫描全部内容，但会占用更多的时间和磁盘空间"),
+            appcfg.buildTokenIndex,
+            self._scroll_widget,
+        )
+        self._main_layout.addWidget(self._token_index_card)
+
     # ==================== 槽函数 ====================
 
     @Slot()
@@ -90,6 +90,12 @@ class TemplateViewPage(QWidget):
         self._table_view = TableView(self)
         self._table_view.setBorderVisible(True)
         self._table_view.setBorderRadius(8)
+        # 启用排序，排序由数据库完成，初始不排序任何列
+        self._table_view.setSortingEnabled(True)
+        self._table_view.horizontalHeader().setSortIndicator(
+            -1,
+            Qt.SortOrder.AscendingOrder,
+        )
         # 禁用单元格换行
         self._table_view.setWordWrap(False)
         # 隐藏垂直表头
@@ -156,6 +162,11 @@ class TemplateViewPage(QWidget):
         self._select_log_id = log_id
         self._csv_file_table_model = CsvFileTableModel(templates_table_name, self)
         self._table_view.setModel(self._csv_file_table_model)
+        # 新模型没有排序，清除上一个模型留下的排序指示器
+        self._table_view.horizontalHeader().setSortIndicator(
+            -1,
+            Qt.SortOrder.AscendingOrder,
+        )
         self._table_view.scrollToTop()
         self._update_info_label()
 
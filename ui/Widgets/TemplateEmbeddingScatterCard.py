@@ -48,8 +48,8 @@ class TemplateEmbeddingScatterCard(CardWidget):
                 model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"},
             )
 
-        result, _ = DuckDBService.fetch_csv_table(template_table_name, 0, -1)
-        templates = [v[0] for v in result]
+        columns, _ = DuckDBService.fetch_csv_table(template_table_name, 0, -1)
+        templates = columns[1].to_numpy().tolist()
 
         # 计算原始 embedding
         original_embedding = self._model.encode(templates)